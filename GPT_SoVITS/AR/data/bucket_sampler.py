@@ -4,7 +4,7 @@ import itertools
 import math
 import random
 from random import shuffle
-from typing import Iterator, Optional, TypeVar
+from typing import Iterator, List, Optional, TypeVar
 
 import torch
 import torch.distributed as dist
@@ -12,6 +12,7 @@ from torch.utils.data import Dataset, Sampler
 
 __all__ = [
     "DistributedBucketSampler",
+    "DynamicBatchSampler",
 ]
 
 T_co = TypeVar("T_co", covariant=True)
@@ -74,9 +75,10 @@ class DistributedBucketSampler(Sampler[T_co]):
         self.id_buckets = self.make_buckets(bucket_width=2.0)
 
     def _get_sample_lengths(self):
-        id_with_lengths = []
-        for i in range(len(self.dataset)):
-            id_with_lengths.append((i, self.dataset.get_sample_length(i)))
+        if hasattr(self.dataset, "get_sample_lengths"):
+            id_with_lengths = list(enumerate(self.dataset.get_sample_lengths().tolist()))
+        else:
+            id_with_lengths = [(i, self.dataset.get_sample_length(i)) for i in range(len(self.dataset))]
         id_with_lengths.sort(key=lambda x: x[1])
         return id_with_lengths
 
@@ -147,3 +149,103 @@ class DistributedBucketSampler(Sampler[T_co]):
             epoch (int): Epoch number.
         """
         self.epoch = epoch
+
+
+class DynamicBatchSampler(Sampler[List[int]]):
+    r"""
+    group samples into batches under a token budget instead of a fixed batch size.
+
+    the cost of a batch is what the model actually pads to: every sample becomes
+    x (phones) concatenated with y (semantic tokens + EOS), each padded to the batch
+    max, so cost = n * (max_phones + max_semantic + 1), doubled for DPO where the
+    rejected y is appended to the batch.
+
+    batches are built identically on every rank from (seed, epoch), padded to a
+    multiple of num_replicas and strided per rank, so all ranks run the same number
+    of steps. enable with train.max_tokens (and optionally train.max_sentences) in the
+    s1 config.
+    """
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        max_tokens: int,
+        max_sentences: Optional[int] = None,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+        shuffle: bool = True,
+        seed: int = 0,
+        bucket_tokens: int = 32,
+        dpo: bool = False,
+    ) -> None:
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        if rank >= num_replicas or rank < 0:
+            raise ValueError("Invalid rank {}, rank should be in the interval [0, {}]".format(rank, num_replicas - 1))
+        self.dataset = dataset
+        self.max_tokens = max_tokens
+        self.max_sentences = max_sentences
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.bucket_tokens = bucket_tokens
+        self.sample_factor = 2 if dpo else 1
+        self.epoch = 0
+        phoneme_lens, semantic_lens = dataset.get_token_lengths()
+        self.phoneme_lens = phoneme_lens.tolist()
+        self.semantic_lens = [length + 1 for length in semantic_lens.tolist()]  # EOS
+        self._cache = None
+
+    def _make_batches(self, epoch: int) -> List[List[int]]:
+        n = len(self.phoneme_lens)
+        costs = [p + s for p, s in zip(self.phoneme_lens, self.semantic_lens)]
+        if self.shuffle:
+            g = torch.Generator()
+            g.manual_seed(self.seed + epoch)
+            order = torch.randperm(n, generator=g).tolist()
+            # 按粗粒度长度排序(稳定排序), 同一档内保留随机顺序, 每个 epoch 的 batch 组成都不同
+            order.sort(key=lambda i: costs[i] // self.bucket_tokens)
+        else:
+            order = sorted(range(n), key=lambda i: costs[i])
+
+        batches = []
+        batch = []
+        max_p = max_s = 0
+        for i in order:
+            p = max(max_p, self.phoneme_lens[i])
+            s = max(max_s, self.semantic_lens[i])
+            full = self.max_sentences is not None and len(batch) >= self.max_sentences
+            if batch and (full or (len(batch) + 1) * (p + s) * self.sample_factor > self.max_tokens):
+                batches.append(batch)
+                batch = []
+                p, s = self.phoneme_lens[i], self.semantic_lens[i]
+            batch.append(i)
+            max_p, max_s = p, s
+        if batch:
+            batches.append(batch)
+
+        if self.shuffle:
+            order = torch.randperm(len(batches), generator=g).tolist()
+            batches = [batches[i] for i in order]
+        # 补齐到 num_replicas 的整数倍, 各 rank 步数一致
+        padding_size = -len(batches) % self.num_replicas
+        if padding_size > 0:
+            batches += (batches * math.ceil(padding_size / len(batches)))[:padding_size]
+        return batches[self.rank :: self.num_replicas]
+
+    def _batches(self) -> List[List[int]]:
+        if self._cache is None or self._cache[0] != self.epoch:
+            self._cache = (self.epoch, self._make_batches(self.epoch))
+        return self._cache[1]
+
+    def __iter__(self) -> Iterator[List[int]]:
+        return iter(self._batches())
+
+    def __len__(self) -> int:
+        return len(self._batches())
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
@@ -1,9 +1,11 @@
 # modified from https://github.com/yangdongchao/SoundStorm/blob/master/soundstorm/s1/AR/data/data_module.py
 # reference: https://github.com/lifeiteng/vall-e
+from functools import partial
+
 from pytorch_lightning import LightningDataModule
 from torch.utils.data import DataLoader
 
-from AR.data.bucket_sampler import DistributedBucketSampler
+from AR.data.bucket_sampler import DistributedBucketSampler, DynamicBatchSampler
 from AR.data.dataset import Text2SemanticDataset
 
 
@@ -43,6 +45,30 @@ class Text2SemanticDataModule(LightningDataModule):
         #     pad_val=self.config['data']['pad_val'])
 
     def train_dataloader(self):
+        collate_fn = self._train_dataset.collate
+        pack_tokens = self.config["train"].get("pack_tokens", 0)
+        if pack_tokens > 0:
+            # 把 batch 内的样本首尾相接装进长度 pack_tokens 的行, 不再补齐
+            assert self.config["train"].get("if_dpo", False) is not True, "pack_tokens does not support if_dpo"
+            collate_fn = partial(self._train_dataset.collate_packed, pack_tokens=pack_tokens)
+        max_tokens = self.config["train"].get("max_tokens", 0)
+        if max_tokens > 0:
+            # 按 token 预算组 batch, 短句多塞、长句少塞
+            batch_sampler = DynamicBatchSampler(
+                self._train_dataset,
+                max_tokens=max_tokens,
+                max_sentences=self.config["train"].get("max_sentences", None),
+                seed=self.config["train"].get("seed", 0),
+                dpo=self.config["train"].get("if_dpo", False) is True,
+            )
+            return DataLoader(
+                self._train_dataset,
+                batch_sampler=batch_sampler,
+                collate_fn=collate_fn,
+                num_workers=self.num_workers,
+                persistent_workers=True,
+                prefetch_factor=16,
+            )
         batch_size = (
             self.config["train"]["batch_size"] // 2
             if self.config["train"].get("if_dpo", False) is True
@@ -54,7 +80,7 @@ class Text2SemanticDataModule(LightningDataModule):
             self._train_dataset,
             batch_size=batch_size,
             sampler=sampler,
-            collate_fn=self._train_dataset.collate,
+            collate_fn=collate_fn,
             num_workers=self.num_workers,
             persistent_workers=True,
             prefetch_factor=16,
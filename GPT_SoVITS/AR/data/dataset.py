@@ -2,18 +2,22 @@
 # reference: https://github.com/lifeiteng/vall-e
 
 # sys.path.append("/data/docker/liujing04/gpt-vits/mq-vits-s1bert_no_bert")
+import glob
+import itertools
+import json
 import os
+import shutil
 import traceback
 from typing import Dict, List
 
 import numpy as np
-import pandas as pd
 import torch
 from torch.utils.data import DataLoader, Dataset
 
 version = os.environ.get("version", None)
 
-from text import cleaned_text_to_sequence
+from module.feature_store import FeatureStoreReader, has_store, open_features, store_path
+from text import _symbol_to_id_v1, _symbol_to_id_v2, cleaned_text_to_sequence
 
 # from config import exp_dir
 
@@ -37,6 +41,48 @@ def batch_sequences(sequences: List[np.array], axis: int = 0, pad_value: int = 0
     return batch
 
 
+INDEX_SUFFIX = ".index"
+INDEX_ARRAYS = ["item_names", "semantic_tokens", "semantic_offsets", "phoneme_tokens", "phoneme_offsets"]
+
+
+def read_semantic_tsv(semantic_path: str, max_sample: int = None):
+    """不经过 pandas, 直接切行; 返回 (names, token 字符串列表或 None)"""
+    with open(semantic_path, "r", encoding="utf-8") as f:
+        lines = f.read().strip("\n").split("\n")[1:]  # 去掉表头
+    if max_sample is not None:
+        lines = lines[:max_sample]
+    rows = [line.split("\t", 1) for line in lines if line != ""]
+    names = [row[0] for row in rows]
+    if all(len(row) == 2 for row in rows):
+        return names, [row[1] for row in rows]
+    return names, None  # token 存在 6-name2semantic.shards 里
+
+
+def semantic_tsv_has_tokens(semantic_path: str):
+    """只看第一行数据: 有 tab 说明 token 写在 tsv 里, 否则只有名字, token 在 6-name2semantic.shards"""
+    with open(semantic_path, "r", encoding="utf-8") as f:
+        f.readline()  # 表头
+        row = f.readline().rstrip("\n")
+    return row == "" or "\t" in row
+
+
+def parse_int_rows(rows: List[str], dtype=np.int16):
+    """空格分隔的整数串 -> (拼接后的数组, 每行长度), 一次 np.fromstring 完成解析"""
+    lengths = np.array([row.count(" ") + 1 for row in rows], dtype=np.int64)
+    tokens = np.fromstring(" ".join(rows), dtype=np.int64, sep=" ")
+    if len(tokens) != lengths.sum():  # 有行里带了多余空格, 逐行解析
+        parsed = [np.array(row.split(), dtype=np.int64) for row in rows]
+        lengths = np.array([len(row) for row in parsed], dtype=np.int64)
+        tokens = np.concatenate(parsed) if len(parsed) > 0 else np.zeros(0, dtype=np.int64)
+    return tokens.astype(dtype), lengths
+
+
+def to_offsets(lengths: np.ndarray):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
 class Text2SemanticDataset(Dataset):
     """dataset class for text tokens to semantic model training."""
 
@@ -54,11 +100,6 @@ class Text2SemanticDataset(Dataset):
     ) -> None:
         super().__init__()
 
-        self.semantic_data = pd.read_csv(
-            semantic_path,
-            delimiter="\t",
-            encoding="utf-8",
-        )
         # get dict
         self.path2 = phoneme_path  # "%s/2-name2text.txt"%exp_dir#phoneme_path
         self.path3 = "%s/3-bert" % (
@@ -66,18 +107,21 @@ class Text2SemanticDataset(Dataset):
                 phoneme_path,
             )
         )  # "%s/3-bert"%exp_dir#bert_dir
+        self.bert_features = open_features(self.path3)
         self.path6 = semantic_path  # "%s/6-name2semantic.tsv"%exp_dir#semantic_path
         assert os.path.exists(self.path2)
         assert os.path.exists(self.path6)
-        self.phoneme_data = {}
-        with open(self.path2, "r", encoding="utf8") as f:
-            lines = f.read().strip("\n").split("\n")
-
-        for line in lines:
-            tmp = line.split("\t")
-            if len(tmp) != 4:
-                continue
-            self.phoneme_data[tmp[0]] = [tmp[1], tmp[2], tmp[3]]
+        # 3-get-semantic.py 开了 feature_store 时 token 存在 6-name2semantic.shards, tsv 里只有名字;
+        # tsv 里有 token 时以 tsv 为准, 不读可能是旧的 token 库
+        self.semantic_store = None
+        if not semantic_tsv_has_tokens(semantic_path):
+            semantic_store_dir = os.path.splitext(semantic_path)[0]
+            if not has_store(semantic_store_dir):
+                raise FileNotFoundError(
+                    "%s only lists names, but the token store %s does not exist; rerun 3-get-semantic.py"
+                    % (semantic_path, store_path(semantic_store_dir))
+                )
+            self.semantic_store = FeatureStoreReader(store_path(semantic_store_dir))
 
         # self.phoneme_data = np.load(phoneme_path, allow_pickle=True).item()
         # pad for semantic tokens
@@ -92,98 +136,171 @@ class Text2SemanticDataset(Dataset):
         self.max_sec = max_sec
         self.min_ps_ratio = min_ps_ratio
         self.max_ps_ratio = max_ps_ratio
+        self.max_sample = max_sample
 
-        if max_sample is not None:
-            self.semantic_data = self.semantic_data[:max_sample]
-
-        # {idx: (semantic, phoneme)}
-        # semantic list, phoneme list
-        self.semantic_phoneme = []
-        self.item_names = []
-
-        self.inited = False
-
-        if not self.inited:
-            # 调用初始化函数
+        # 过滤后的结果以扁平数组 + 偏移量保存在 tsv 旁边的 6-name2semantic.index/,
+        # 输入文件和过滤参数不变时, 重启和其他 DDP rank 直接 mmap 读取
+        self.index_dir = os.path.splitext(semantic_path)[0] + INDEX_SUFFIX
+        meta = self._index_meta()
+        if not self.load_index(meta):
             self.init_batch()
-            self.inited = True
-            del self.semantic_data
-            del self.phoneme_data
+            self.save_index(meta)
+
+        # 每个样本对应的行号, 数据太少时重复几遍
+        self.rows = np.arange(len(self.item_names))
+        min_num = 100  # 20直接不补#30补了也不存ckpt
+        leng = len(self.rows)
+        if leng < min_num:
+            self.rows = np.tile(self.rows, max(2, int(min_num / leng)))
+        # 345410 for LibriTTS
+        print("dataset.__len__():", self.__len__())
         # self.tokenizer = AutoTokenizer.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
         # self.tokenizer = AutoTokenizer.from_pretrained("/data/docker/liujing04/bert-vits2/Bert-VITS2-master20231106/bert/chinese-roberta-wwm-ext-large")
 
+    def _index_meta(self):
+        paths = [self.path2, self.path6]
+        if self.semantic_store is not None:
+            paths += sorted(glob.glob(os.path.join(self.semantic_store.root, "index-*.jsonl")))
+        files = [[os.path.basename(path), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths]
+        return {
+            "files": files,
+            "version": version,
+            "hz": self.hz,
+            "max_sec": self.max_sec,
+            "min_ps_ratio": self.min_ps_ratio,
+            "max_ps_ratio": self.max_ps_ratio,
+            "max_sample": self.max_sample,
+        }
+
+    def load_index(self, meta) -> bool:
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        try:
+            with open(meta_path, "r", encoding="utf8") as f:
+                if json.load(f) != meta:
+                    return False
+            self._mmap_index()
+        except Exception:
+            traceback.print_exc()
+            return False
+        print("loaded dataset index from", self.index_dir)
+        return True
+
+    def _mmap_index(self):
+        arrays = {name: np.load(os.path.join(self.index_dir, "%s.npy" % name), mmap_mode="r") for name in INDEX_ARRAYS}
+        self.item_names = arrays["item_names"].tolist()
+        self.semantic_tokens = arrays["semantic_tokens"]
+        self.semantic_offsets = np.array(arrays["semantic_offsets"])
+        self.phoneme_tokens = arrays["phoneme_tokens"]
+        self.phoneme_offsets = np.array(arrays["phoneme_offsets"])
+        self.mmapped = True
+
+    def save_index(self, meta):
+        try:
+            tmp_dir = "%s.%s.tmp" % (self.index_dir, os.getpid())
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name in INDEX_ARRAYS:
+                value = getattr(self, name)
+                np.save(os.path.join(tmp_dir, "%s.npy" % name), np.array(value) if name == "item_names" else value)
+            # meta 最后写, 没有 meta 的目录不会被当成有效索引
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf8") as f:
+                json.dump(meta, f)
+            if os.path.exists(self.index_dir):
+                shutil.rmtree(self.index_dir, ignore_errors=True)
+            os.replace(tmp_dir, self.index_dir)
+        except OSError:  # 其他 rank 已经写好了, 或者目录只读, 都不影响训练
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def __getstate__(self):
+        # DataLoader worker 里重新 mmap, 不把整份 token 数组 pickle 过去
+        state = self.__dict__.copy()
+        if state.get("mmapped", False):
+            for name in INDEX_ARRAYS[1:]:
+                del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if state.get("mmapped", False):
+            item_names = self.item_names
+            self._mmap_index()
+            self.item_names = item_names
+
     def init_batch(self):
-        semantic_data_len = len(self.semantic_data)
-        phoneme_data_len = len(self.phoneme_data.keys())
-        print("semantic_data_len:", semantic_data_len)
-        print("phoneme_data_len:", phoneme_data_len)
-        print(self.semantic_data)
-        idx = 0
-        num_not_in = 0
-        num_deleted_bigger = 0
-        num_deleted_ps = 0
-        for i in range(semantic_data_len):
-            # 先依次遍历
-            # get str
-            item_name = self.semantic_data.iloc[i, 0]
-            # print(self.phoneme_data)
-            try:
-                phoneme, word2ph, text = self.phoneme_data[item_name]
-            except Exception:
-                traceback.print_exc()
-                # print(f"{item_name} not in self.phoneme_data !")
-                num_not_in += 1
-                continue
-
-            semantic_str = self.semantic_data.iloc[i, 1]
-            # get token list
-            semantic_ids = [int(idx) for idx in semantic_str.split(" ")]
-            # (T), 是否需要变成 (1, T) -> 不需要，因为需要求 len
-            # 过滤掉太长的样本
-            if (
-                len(semantic_ids) > self.max_sec * self.hz
-            ):  #########1###根据token个数推测总时长过滤时长60s（config里）#40*25=1k
-                num_deleted_bigger += 1
-                continue
-            # (T, ), 这个速度不会很慢，所以可以在一开始就处理，无需在 __getitem__ 里面单个处理####
-            phoneme = phoneme.split(" ")
-
-            try:
-                phoneme_ids = cleaned_text_to_sequence(phoneme, version)
-            except:
-                traceback.print_exc()
-                # print(f"{item_name} not in self.phoneme_data !")
-                num_not_in += 1
-                continue
-            # if len(phoneme_ids) >400:###########2：改为恒定限制为semantic/2.5就行
-            if len(phoneme_ids) > self.max_sec * self.hz / 2.5:  ###########2：改为恒定限制为semantic/2.5就行
-                num_deleted_ps += 1
-                continue
-            # if len(semantic_ids) > 1000:###########3
-            #     num_deleted_bigger += 1
-            #     continue
-
-            ps_ratio = len(phoneme_ids) / (len(semantic_ids) / self.hz)
-
-            if ps_ratio > self.max_ps_ratio or ps_ratio < self.min_ps_ratio:  ##########4#3~25#每秒多少个phone
-                num_deleted_ps += 1
-                # print(item_name)
-                continue
-
-            self.semantic_phoneme.append((semantic_ids, phoneme_ids))
-            idx += 1
-            self.item_names.append(item_name)
+        names, semantic_rows = read_semantic_tsv(self.path6, self.max_sample)
+        if semantic_rows is None and self.semantic_store is None:
+            raise FileNotFoundError("%s only lists names, but there is no token store next to it" % self.path6)
+        phoneme_data = {}
+        with open(self.path2, "r", encoding="utf8") as f:
+            for line in f.read().strip("\n").split("\n"):
+                tmp = line.split("\t")
+                if len(tmp) != 4:
+                    continue
+                phoneme_data[tmp[0]] = tmp[1]
+        print("semantic_data_len:", len(names))
+        print("phoneme_data_len:", len(phoneme_data))
+
+        # 1) 名字对不上 / token 库里没有
+        keep = np.array([name in phoneme_data for name in names], dtype=bool)
+        if self.semantic_store is not None:
+            keep &= np.array([name in self.semantic_store for name in names], dtype=bool)
+        names = [name for name, k in zip(names, keep) if k]
+        num_not_in = int((~keep).sum())
+
+        if self.semantic_store is not None:
+            parts = [self.semantic_store.load_numpy(name) for name in names]
+            semantic_lens = np.array([len(part) for part in parts], dtype=np.int64)
+            semantic_tokens = np.concatenate(parts).astype(np.int16) if len(parts) > 0 else np.zeros(0, np.int16)
+        else:
+            semantic_rows = [row for row, k in zip(semantic_rows, keep) if k]
+            semantic_tokens, semantic_lens = parse_int_rows(semantic_rows)
+
+        # 2) phone -> id, 整体查一次表; 有未知符号时逐条处理并跳过出错的条目
+        phoneme_rows = [phoneme_data[name].split(" ") for name in names]
+        symbol_to_id = _symbol_to_id_v1 if version == "v1" else _symbol_to_id_v2
+        phoneme_lens = np.array([len(row) for row in phoneme_rows], dtype=np.int64)
+        valid = np.ones(len(names), dtype=bool)
+        try:
+            phoneme_tokens = np.array(
+                list(map(symbol_to_id.__getitem__, itertools.chain.from_iterable(phoneme_rows))), dtype=np.int16
+            )
+        except KeyError:
+            parsed = []
+            for i, row in enumerate(phoneme_rows):
+                try:
+                    parsed.append(cleaned_text_to_sequence(row, version))
+                except Exception:
+                    traceback.print_exc()
+                    valid[i] = False
+                    parsed.append([])
+            phoneme_tokens = np.array(list(itertools.chain.from_iterable(parsed)), dtype=np.int16)
+            phoneme_lens = np.array([len(row) for row in parsed], dtype=np.int64)
+        num_not_in += int((~valid).sum())
+
+        # 3) 长度和 phone/sec 过滤, 全部是数组运算
+        # (T, ), 这个速度不会很慢，所以可以在一开始就处理，无需在 __getitem__ 里面单个处理####
+        #########1###根据token个数推测总时长过滤时长60s（config里）#40*25=1k
+        too_long = valid & (semantic_lens > self.max_sec * self.hz)
+        num_deleted_bigger = int(too_long.sum())
+        valid &= ~too_long
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ps_ratio = phoneme_lens / (semantic_lens / self.hz)
+        bad_ps = valid & (
+            (phoneme_lens > self.max_sec * self.hz / 2.5)  ###########2：改为恒定限制为semantic/2.5就行
+            | ~((ps_ratio <= self.max_ps_ratio) & (ps_ratio >= self.min_ps_ratio))  ##########4#3~25#每秒多少个phone
+        )
+        num_deleted_ps = int(bad_ps.sum())
+        valid &= ~bad_ps
+
+        self.item_names = [name for name, v in zip(names, valid) if v]
+        # 按 token 展开的掩码, 一次取出保留条目的 token
+        self.semantic_tokens = semantic_tokens[np.repeat(valid, semantic_lens)]
+        self.semantic_offsets = to_offsets(semantic_lens[valid])
+        self.phoneme_tokens = phoneme_tokens[np.repeat(valid, phoneme_lens)]
+        self.phoneme_offsets = to_offsets(phoneme_lens[valid])
+        self.mmapped = False
 
-        min_num = 100  # 20直接不补#30补了也不存ckpt
-        leng = len(self.semantic_phoneme)
-        if leng < min_num:
-            tmp1 = self.semantic_phoneme
-            tmp2 = self.item_names
-            self.semantic_phoneme = []
-            self.item_names = []
-            for _ in range(max(2, int(min_num / leng))):
-                self.semantic_phoneme += tmp1
-                self.item_names += tmp2
         if num_not_in > 0:
             print(f"there are {num_not_in} semantic datas not in phoneme datas")
         if num_deleted_bigger > 0:
@@ -202,26 +319,25 @@ class Text2SemanticDataset(Dataset):
         dataset.__len__(): 366463
 
         """
-        # 345410 for LibriTTS
-        print("dataset.__len__():", self.__len__())
 
     def __get_item_names__(self) -> List[str]:
-        return self.item_names
+        return [self.item_names[row] for row in self.rows]
 
     def __len__(self) -> int:
-        return len(self.semantic_phoneme)
+        return len(self.rows)
 
     def __getitem__(self, idx: int) -> Dict:
-        semantic_ids, phoneme_ids = self.semantic_phoneme[idx]
-        item_name = self.item_names[idx]
+        row = self.rows[idx]
+        semantic_ids = self.semantic_tokens[self.semantic_offsets[row] : self.semantic_offsets[row + 1]]
+        phoneme_ids = self.phoneme_tokens[self.phoneme_offsets[row] : self.phoneme_offsets[row + 1]]
+        item_name = self.item_names[row]
         phoneme_ids_len = len(phoneme_ids)
         # semantic tokens target
         semantic_ids_len = len(semantic_ids)
 
         flag = 0
-        path_bert = "%s/%s.pt" % (self.path3, item_name)
-        if os.path.exists(path_bert) == True:
-            bert_feature = torch.load(path_bert, map_location="cpu")
+        if item_name in self.bert_features:
+            bert_feature = self.bert_features.load(item_name)
         else:
             flag = 1
         if flag == 1:
@@ -239,10 +355,18 @@ class Text2SemanticDataset(Dataset):
         }
 
     def get_sample_length(self, idx: int):
-        semantic_ids = self.semantic_phoneme[idx][0]
-        sec = 1.0 * len(semantic_ids) / self.hz
+        row = self.rows[idx]
+        sec = 1.0 * (self.semantic_offsets[row + 1] - self.semantic_offsets[row]) / self.hz
         return sec
 
+    def get_sample_lengths(self) -> np.ndarray:
+        """所有样本的时长(秒), 给 sampler 一次取完"""
+        return np.diff(self.semantic_offsets)[self.rows] / self.hz
+
+    def get_token_lengths(self):
+        """(phone 数, semantic token 数), 给按 token 预算组 batch 的 DynamicBatchSampler 用"""
+        return np.diff(self.phoneme_offsets)[self.rows], np.diff(self.semantic_offsets)[self.rows]
+
     def collate(self, examples: List[Dict]) -> Dict:
         sample_index: List[int] = []
         phoneme_ids: List[torch.Tensor] = []
@@ -290,6 +414,89 @@ class Text2SemanticDataset(Dataset):
             "bert_feature": bert_padded,
         }
 
+    def collate_packed(self, examples: List[Dict], pack_tokens: int) -> Dict:
+        """
+        把一个 batch 的样本首尾相接装进若干行 (每行最多 pack_tokens 个位置, 每个样本占 phone 数 + semantic 数),
+        不再补齐到 batch 内最长的样本. phone / bert / semantic 都按装箱顺序拼成一条, 由
+        Text2SemanticDecoder.forward_packed 按 x_index / y_index 放回各行
+        """
+        lengths = [item["phoneme_ids_len"] + item["semantic_ids_len"] for item in examples]
+        # first-fit decreasing, 超过 pack_tokens 的样本单独占一行
+        rows: List[List[int]] = []
+        row_lengths: List[int] = []
+        for i in sorted(range(len(examples)), key=lambda i: -lengths[i]):
+            for r in range(len(rows)):
+                if row_lengths[r] + lengths[i] <= pack_tokens:
+                    rows[r].append(i)
+                    row_lengths[r] += lengths[i]
+                    break
+            else:
+                rows.append([i])
+                row_lengths.append(lengths[i])
+        max_len = max(row_lengths)
+
+        order = [i for row in rows for i in row]
+        phoneme_lens = np.array([examples[i]["phoneme_ids_len"] for i in order], dtype=np.int64)
+        semantic_lens = np.array([examples[i]["semantic_ids_len"] for i in order], dtype=np.int64)
+        # 每个样本在拼接后的行里的起点
+        starts = np.concatenate(
+            [to_offsets([lengths[i] for i in row])[:-1] + r * max_len for r, row in enumerate(rows)]
+        )
+        x_starts, y_starts = starts, starts + phoneme_lens
+        x_positions = np.arange(phoneme_lens.sum()) - np.repeat(to_offsets(phoneme_lens)[:-1], phoneme_lens)
+        y_positions = np.arange(semantic_lens.sum()) - np.repeat(to_offsets(semantic_lens)[:-1], semantic_lens)
+        # x 的最后一位预测第一个 semantic, 每个样本有 semantic 数 + 1 个预测位置, 最后一个目标是 EOS
+        target_lens = semantic_lens + 1
+        target_positions = np.arange(target_lens.sum()) - np.repeat(to_offsets(target_lens)[:-1], target_lens)
+        logit_index = np.repeat(y_starts - 1, target_lens) + target_positions
+        target_index = np.arange(semantic_lens.sum()) + np.repeat(np.arange(len(order)), semantic_lens)
+
+        segment = np.full((len(rows), max_len), -1, dtype=np.int64)
+        is_y = np.zeros((len(rows), max_len), dtype=bool)
+        for k, (start, phoneme_len, semantic_len) in enumerate(zip(starts, phoneme_lens, semantic_lens)):
+            end = start + phoneme_len + semantic_len
+            segment.flat[start:end] = k
+            is_y.flat[start + phoneme_len : end] = True
+
+        bert_feature = torch.zeros(1, 1024, int(phoneme_lens.sum()), dtype=torch.float32)
+        offset = 0
+        for i in order:
+            bert = examples[i]["bert_feature"]
+            if bert is not None:
+                bert_feature[0, :, offset : offset + bert.shape[-1]] = bert
+            offset += examples[i]["phoneme_ids_len"]
+
+        phoneme_ids = np.concatenate([examples[i]["phoneme_ids"] for i in order]).astype(np.int64)
+        semantic_ids = np.concatenate([examples[i]["semantic_ids"] for i in order]).astype(np.int64)
+
+        return {
+            # List[int], 按装箱顺序
+            "ids": [examples[i]["idx"] for i in order],
+            # torch.Tensor (1, sum(phoneme_length))
+            "phoneme_ids": torch.from_numpy(phoneme_ids)[None],
+            # torch.Tensor (N)
+            "phoneme_ids_len": torch.from_numpy(phoneme_lens),
+            # torch.Tensor (1, sum(semantic_length))
+            "semantic_ids": torch.from_numpy(semantic_ids)[None],
+            # torch.Tensor (N)
+            "semantic_ids_len": torch.from_numpy(semantic_lens),
+            # torch.Tensor (1, 1024, sum(phoneme_length))
+            "bert_feature": bert_feature,
+            # torch.Tensor (sum(phoneme_length)) / (sum(semantic_length)), 每个样本内从 0 计数
+            "x_positions": torch.from_numpy(x_positions),
+            "y_positions": torch.from_numpy(y_positions),
+            # torch.Tensor, 在展平的 (rows * max_len) 里的下标
+            "x_index": torch.from_numpy(np.repeat(x_starts, phoneme_lens) + x_positions),
+            "y_index": torch.from_numpy(np.repeat(y_starts, semantic_lens) + y_positions),
+            "logit_index": torch.from_numpy(logit_index),
+            # torch.Tensor (sum(semantic_length)), semantic 在目标序列里的下标, 其余位置是 EOS
+            "target_index": torch.from_numpy(target_index),
+            # torch.Tensor (rows, max_len), 每个位置属于第几个样本, 空位为 -1
+            "segment": torch.from_numpy(segment),
+            # torch.Tensor (rows, max_len), 是否为 semantic 位置
+            "is_y": torch.from_numpy(is_y),
+        }
+
 
 if __name__ == "__main__":
     root_dir = "/data/docker/liujing04/gpt-vits/prepare/dump_mix/"
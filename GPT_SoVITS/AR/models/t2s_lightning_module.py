@@ -43,13 +43,16 @@ class Text2SemanticLightningModule(LightningModule):
         opt = self.optimizers()
         scheduler = self.lr_schedulers()
         forward = self.model.forward if self.config["train"].get("if_dpo", False) == True else self.model.forward_old
-        loss, acc = forward(
-            batch["phoneme_ids"],
-            batch["phoneme_ids_len"],
-            batch["semantic_ids"],
-            batch["semantic_ids_len"],
-            batch["bert_feature"],
-        )
+        if "segment" in batch:
+            loss, acc = self.model.forward_packed(batch)
+        else:
+            loss, acc = forward(
+                batch["phoneme_ids"],
+                batch["phoneme_ids_len"],
+                batch["semantic_ids"],
+                batch["semantic_ids_len"],
+                batch["bert_feature"],
+            )
         self.manual_backward(loss)
         if batch_idx > 0 and batch_idx % 4 == 0:
             opt.step()
@@ -14,12 +14,15 @@ from AR.models.utils import (
     get_batch_logps,
     make_pad_mask,
     make_pad_mask_left,
+    make_packed_attn_mask,
     make_reject_y,
+    make_xy_attn_mask,
     sample,
     topk_sampling,
 )
 from AR.modules.embedding import SinePositionalEmbedding, TokenEmbedding
 from AR.modules.transformer import LayerNorm, TransformerEncoder, TransformerEncoderLayer
+from module.int8 import linear, quantize_weight
 
 default_config = {
     "embedding_dim": 512,
@@ -77,12 +80,23 @@ class T2SMLP:
         self.b1 = b1
         self.w2 = w2
         self.b2 = b2
+        # quantize_int8 之后 w1 / w2 是 int8, s1 / s2 是逐行 scale
+        self.s1: Optional[torch.Tensor] = None
+        self.s2: Optional[torch.Tensor] = None
 
     def forward(self, x):
-        x = F.relu(F.linear(x, self.w1, self.b1))
-        x = F.linear(x, self.w2, self.b2)
+        x = F.relu(linear(x, self.w1, self.b1, self.s1))
+        x = linear(x, self.w2, self.b2, self.s2)
         return x
 
+    def quantize_int8(self):
+        w1, s1 = quantize_weight(self.w1)
+        w2, s2 = quantize_weight(self.w2)
+        self.w1 = w1
+        self.s1 = s1
+        self.w2 = w2
+        self.s2 = s2
+
 
 @torch.jit.script
 class T2SBlock:
@@ -115,9 +129,20 @@ class T2SBlock:
         self.norm_w2 = norm_w2
         self.norm_b2 = norm_b2
         self.norm_eps2 = norm_eps2
+        self.qkv_s: Optional[torch.Tensor] = None
+        self.out_s: Optional[torch.Tensor] = None
 
         self.false = torch.tensor(False, dtype=torch.bool)
 
+    def quantize_int8(self):
+        qkv_w, qkv_s = quantize_weight(self.qkv_w)
+        out_w, out_s = quantize_weight(self.out_w)
+        self.qkv_w = qkv_w
+        self.qkv_s = qkv_s
+        self.out_w = out_w
+        self.out_s = out_s
+        self.mlp.quantize_int8()
+
     @torch.jit.ignore
     def to_mask(
         self,
@@ -139,7 +164,7 @@ class T2SBlock:
         padding_mask: Optional[torch.Tensor] = None,
         torch_sdpa: bool = True,
     ):
-        q, k, v = F.linear(self.to_mask(x, padding_mask), self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        q, k, v = linear(self.to_mask(x, padding_mask), self.qkv_w, self.qkv_b, self.qkv_s).chunk(3, dim=-1)
 
         batch_size = q.shape[0]
         q_len = q.shape[1]
@@ -159,7 +184,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(self.to_mask(attn, padding_mask), self.out_w, self.out_b)
+        attn = linear(self.to_mask(attn, padding_mask), self.out_w, self.out_b, self.out_s)
 
         x = x + attn
         x = F.layer_norm(x, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1)
@@ -181,7 +206,7 @@ class T2SBlock:
         attn_mask: torch.Tensor = None,
         torch_sdpa: bool = True,
     ):
-        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        q, k, v = linear(x, self.qkv_w, self.qkv_b, self.qkv_s).chunk(3, dim=-1)
 
         k_cache = torch.cat([k_cache, k], dim=1)
         v_cache = torch.cat([v_cache, v], dim=1)
@@ -200,7 +225,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(attn, self.out_w, self.out_b)
+        attn = linear(attn, self.out_w, self.out_b, self.out_s)
 
         x = x + attn
         x = F.layer_norm(
@@ -256,6 +281,10 @@ class T2STransformer:
             )
         return x, k_cache, v_cache
 
+    def quantize_int8(self):
+        for i in range(self.num_blocks):
+            self.blocks[i].quantize_int8()
+
 
 class Text2SemanticDecoder(nn.Module):
     def __init__(self, config, norm_first=False, top_k=3):
@@ -352,12 +381,22 @@ class Text2SemanticDecoder(nn.Module):
 
         self.t2s_transformer = T2STransformer(self.num_layers, blocks)
 
-    def make_input_data(self, x, x_lens, y, y_lens, bert_feature):
+    def quantize_int8(self):
+        """
+        仅 CPU 推理用: t2s_transformer 的 Linear 换成 int8 权重 (见 module/int8.py).
+        self.h 的 fp32 权重只有训练和 infer() 会用到, 这里一起释放; 需要 fp32 时重新加载权重.
+        """
+        self.t2s_transformer.quantize_int8()
+        self.h = None
+
+    def make_x_input(self, x, x_lens, bert_feature):
         x = self.ar_text_embedding(x)
         x = x + self.bert_proj(bert_feature.transpose(1, 2))
         x = self.ar_text_position(x)
         x_mask = make_pad_mask_left(x_lens)
+        return x, x_mask
 
+    def make_y_input(self, y, y_lens):
         y_mask = make_pad_mask(y_lens)
         y_mask_int = y_mask.type(torch.int64)
         codes = y.type(torch.int64) * (1 - y_mask_int)
@@ -365,41 +404,15 @@ class Text2SemanticDecoder(nn.Module):
         # Training
         # AR Decoder
         y, targets = self.pad_y_eos(codes, y_mask_int, eos_id=self.EOS)
-        x_len = x_lens.max()
-        y_len = y_lens.max()
         y_emb = self.ar_audio_embedding(y)
         y_pos = self.ar_audio_position(y_emb)
+        return y_pos, y_mask, targets
 
-        xy_padding_mask = torch.concat([x_mask, y_mask], dim=1)
-
-        ar_xy_padding_mask = xy_padding_mask
-
-        x_attn_mask = F.pad(
-            torch.zeros((x_len, x_len), dtype=torch.bool, device=x.device),
-            (0, y_len),
-            value=True,
-        )
-        # x_attn_mask[:, x_len]=False
-        y_attn_mask = F.pad(
-            torch.triu(
-                torch.ones(y_len, y_len, dtype=torch.bool, device=x.device),
-                diagonal=1,
-            ),
-            (x_len, 0),
-            value=False,
-        )
+    def make_input_data(self, x, x_lens, y, y_lens, bert_feature):
+        x, x_mask = self.make_x_input(x, x_lens, bert_feature)
+        y_pos, y_mask, targets = self.make_y_input(y, y_lens)
 
-        xy_attn_mask = torch.concat([x_attn_mask, y_attn_mask], dim=0)
-        bsz, src_len = x.shape[0], x_len + y_len
-        _xy_padding_mask = (
-            ar_xy_padding_mask.view(bsz, 1, 1, src_len)
-            .expand(-1, self.num_head, -1, -1)
-            .reshape(bsz * self.num_head, 1, src_len)
-        )
-        xy_attn_mask = xy_attn_mask.logical_or(_xy_padding_mask)
-        new_attn_mask = torch.zeros_like(xy_attn_mask, dtype=x.dtype)
-        new_attn_mask.masked_fill_(xy_attn_mask, float("-inf"))
-        xy_attn_mask = new_attn_mask
+        xy_attn_mask = make_xy_attn_mask(x_mask, y_mask)
         # x 和完整的 y 一次性输入模型
         xy_pos = torch.concat([x, y_pos], dim=1)
 
@@ -413,26 +426,25 @@ class Text2SemanticDecoder(nn.Module):
 
         reject_y, reject_y_lens = make_reject_y(y, y_lens)
 
-        xy_pos, xy_attn_mask, targets = self.make_input_data(x, x_lens, y, y_lens, bert_feature)
+        ###### DPO #############
+        # chosen 和 reject 共用同一段文本前缀: 拼成 [x, y, reject_y] 只跑一遍,
+        # 两段 y 各自只看得到 x 和自己, 结果与分开跑两遍相同
+        x, x_mask = self.make_x_input(x, x_lens, bert_feature)
+        y_pos, y_mask, targets = self.make_y_input(y, y_lens)
+        reject_y_pos, reject_y_mask, reject_targets = self.make_y_input(reject_y, reject_y_lens)
+
+        xy_pos = torch.concat([x, y_pos, reject_y_pos], dim=1)
+        xy_attn_mask = make_xy_attn_mask(x_mask, y_mask, reject_y_mask)
 
         xy_dec, _ = self.h(
             (xy_pos, None),
             mask=xy_attn_mask,
         )
-        x_len = x_lens.max()
-        logits = self.ar_predict_layer(xy_dec[:, x_len-1:])
-
-        ###### DPO #############
-        reject_xy_pos, reject_xy_attn_mask, reject_targets = self.make_input_data(
-            x, x_lens, reject_y, reject_y_lens, bert_feature
-        )
-
-        reject_xy_dec, _ = self.h(
-            (reject_xy_pos, None),
-            mask=reject_xy_attn_mask,
-        )
-        x_len = x_lens.max()
-        reject_logits = self.ar_predict_layer(reject_xy_dec[:, x_len-1:])
+        x_len, y_len = x.shape[1], y_pos.shape[1]
+        all_logits = self.ar_predict_layer(xy_dec[:, x_len - 1 :])
+        # x 的最后一位预测两段 y 的第一个 token
+        logits = all_logits[:, : y_len + 1]
+        reject_logits = torch.concat([all_logits[:, :1], all_logits[:, y_len + 1 :]], dim=1)
 
         # loss
         # from feiteng: 每次 duration 越多, 梯度更新也应该更多, 所以用 sum
@@ -452,52 +464,8 @@ class Text2SemanticDecoder(nn.Module):
         x: phoneme_ids
         y: semantic_ids
         """
-        x = self.ar_text_embedding(x)
-        x = x + self.bert_proj(bert_feature.transpose(1, 2))
-        x = self.ar_text_position(x)
-        x_mask = make_pad_mask_left(x_lens)
-
-        y_mask = make_pad_mask(y_lens)
-        y_mask_int = y_mask.type(torch.int64)
-        codes = y.type(torch.int64) * (1 - y_mask_int)
-
-        # Training
-        # AR Decoder
-        y, targets = self.pad_y_eos(codes, y_mask_int, eos_id=self.EOS)
+        xy_pos, xy_attn_mask, targets = self.make_input_data(x, x_lens, y, y_lens, bert_feature)
         x_len = x_lens.max()
-        y_len = y_lens.max()
-        y_emb = self.ar_audio_embedding(y)
-        y_pos = self.ar_audio_position(y_emb)
-
-        xy_padding_mask = torch.concat([x_mask, y_mask], dim=1)
-        ar_xy_padding_mask = xy_padding_mask
-
-        x_attn_mask = F.pad(
-            torch.zeros((x_len, x_len), dtype=torch.bool, device=x.device),
-            (0, y_len),
-            value=True,
-        )
-        y_attn_mask = F.pad(
-            torch.triu(
-                torch.ones(y_len, y_len, dtype=torch.bool, device=x.device),
-                diagonal=1,
-            ),
-            (x_len, 0),
-            value=False,
-        )
-        xy_attn_mask = torch.concat([x_attn_mask, y_attn_mask], dim=0)
-        bsz, src_len = x.shape[0], x_len + y_len
-        _xy_padding_mask = (
-            ar_xy_padding_mask.view(bsz, 1, 1, src_len)
-            .expand(-1, self.num_head, -1, -1)
-            .reshape(bsz * self.num_head, 1, src_len)
-        )
-        xy_attn_mask = xy_attn_mask.logical_or(_xy_padding_mask)
-        new_attn_mask = torch.zeros_like(xy_attn_mask, dtype=x.dtype)
-        new_attn_mask.masked_fill_(xy_attn_mask, float("-inf"))
-        xy_attn_mask = new_attn_mask
-        # x 和完整的 y 一次性输入模型
-        xy_pos = torch.concat([x, y_pos], dim=1)
         xy_dec, _ = self.h(
             (xy_pos, None),
             mask=xy_attn_mask,
@@ -509,6 +477,36 @@ class Text2SemanticDecoder(nn.Module):
         acc = self.ar_accuracy_metric(logits.detach(), targets).item()
         return loss, acc
 
+    def forward_packed(self, batch):
+        """
+        batch 来自 Text2SemanticDataset.collate_packed: 多个样本首尾相接装在同一行, 样本之间互相看不到,
+        位置编码在每个样本内从 0 重新计数. 每个样本的 loss 与 acc 与单独(不补齐)跑 forward_old 一致
+        """
+        x = self.ar_text_embedding(batch["phoneme_ids"])
+        x = x + self.bert_proj(batch["bert_feature"].transpose(1, 2))
+        x = self.ar_text_position(x, positions=batch["x_positions"])
+        y_emb = self.ar_audio_embedding(batch["semantic_ids"])
+        y_pos = self.ar_audio_position(y_emb, positions=batch["y_positions"])
+
+        segment = batch["segment"]
+        bsz, src_len = segment.shape
+        xy_pos = x.new_zeros(bsz * src_len, x.shape[-1]).index_copy(
+            0, torch.concat([batch["x_index"], batch["y_index"]]), torch.concat([x[0], y_pos[0]])
+        )
+        xy_attn_mask = make_packed_attn_mask(segment, batch["is_y"])
+        xy_dec, _ = self.h(
+            (xy_pos.view(bsz, src_len, -1), None),
+            mask=xy_attn_mask,
+        )
+        logits = self.ar_predict_layer(xy_dec.reshape(bsz * src_len, -1)[batch["logit_index"]])
+        targets = torch.full_like(batch["logit_index"], self.EOS)
+        targets[batch["target_index"]] = batch["semantic_ids"][0]
+        # loss
+        # from feiteng: 每次 duration 越多, 梯度更新也应该更多, 所以用 sum
+        loss = F.cross_entropy(logits, targets, reduction="sum")
+        acc = self.ar_accuracy_metric(logits.detach(), targets).item()
+        return loss, acc
+
     # 需要看下这个函数和 forward 的区别以及没有 semantic 的时候 prompts 输入什么
     def infer(
         self,
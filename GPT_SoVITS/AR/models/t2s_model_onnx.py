@@ -183,7 +183,7 @@ class T2SFirstStageDecoder(nn.Module):
 
         y = torch.concat([y, samples], dim=1)
 
-        return y, cache["k"], cache["v"], cache["y_emb"], x_example
+        return y, cache["k"], cache["v"], cache["y_emb"], x_example, logits
 
 
 class T2SStageDecoder(nn.Module):
@@ -74,6 +74,51 @@ def make_pad_mask_left(lengths: torch.Tensor, max_len: int = 0) -> torch.Tensor:
     return expaned_lengths < 0
 
 
+def make_xy_attn_mask(x_mask: torch.Tensor, *y_masks: torch.Tensor) -> torch.Tensor:
+    """
+    Args:
+      x_mask / y_masks:
+        (bsz, x_len) / (bsz, y_len) padding masks, True for padded positions. Several
+        y segments may follow the same x prefix (e.g. chosen and rejected for DPO).
+    Returns:
+      Return a (bsz, 1, src_len, src_len) bool tensor, True for masked positions: x
+      attends to x only, each y segment attends to x and causally to itself, and padded
+      keys are masked for every query. The head dim is left to broadcast, so
+      scaled_dot_product_attention can pick a fused kernel instead of getting a dense
+      (bsz * num_head, src_len, src_len) float mask.
+    """
+    masks = (x_mask,) + y_masks
+    device = x_mask.device
+    segment = torch.concat([torch.full((mask.shape[1],), i, device=device) for i, mask in enumerate(masks)])
+    src_len = segment.shape[0]
+    pos = torch.arange(src_len, device=device)
+    # 第 j 列属于某段 y 时, 只有同一段 y 里不在它之前的行才能看到, 即 x 部分双向、每段 y 各自因果
+    structure = (segment > 0).unsqueeze(0) & (
+        (segment.unsqueeze(0) != segment.unsqueeze(1)) | (pos.unsqueeze(0) > pos.unsqueeze(1))
+    )
+    padding_mask = torch.concat(masks, dim=1)
+    return structure.view(1, 1, src_len, src_len) | padding_mask.view(-1, 1, 1, src_len)
+
+
+def make_packed_attn_mask(segment: torch.Tensor, is_y: torch.Tensor) -> torch.Tensor:
+    """
+    Args:
+      segment:
+        (bsz, src_len) index of the sample each packed position belongs to, -1 for padding.
+      is_y:
+        (bsz, src_len) True for semantic positions.
+    Returns:
+      Return a (bsz, 1, src_len, src_len) bool tensor, True for masked positions:
+      block-diagonal over the packed samples, and inside each block the same layout as
+      make_xy_attn_mask. Padding positions only attend to each other.
+    """
+    src_len = segment.shape[1]
+    pos = torch.arange(src_len, device=segment.device)
+    later = pos.unsqueeze(0) > pos.unsqueeze(1)
+    mask = (segment.unsqueeze(2) != segment.unsqueeze(1)) | (is_y.unsqueeze(1) & later)
+    return mask.unsqueeze(1)
+
+
 # https://github.com/microsoft/unilm/blob/master/xtune/src/transformers/modeling_utils.py
 def top_k_top_p_filtering(
     logits,
@@ -137,10 +182,11 @@ def topk_sampling(logits, top_k=10, top_p=1.0, temperature=1.0):
 from typing import Optional
 
 
+# 这几个函数也被 export_torch_script.py 导出的 TorchScript 模块调用, 改动时要保持可以 torch.jit.script
 def multinomial_sample_one_no_sync(
     probs_sort,
 ):  # Does multinomial sampling without a cuda synchronization
-    q = torch.empty_like(probs_sort).exponential_(1)
+    q = torch.empty_like(probs_sort).exponential_(1.0)
     return torch.argmax(probs_sort / q, dim=-1, keepdim=True).to(dtype=torch.int)
 
 
@@ -149,7 +195,7 @@ def logits_to_probs(
     previous_tokens: Optional[torch.Tensor] = None,
     temperature: float = 1.0,
     top_k: Optional[int] = None,
-    top_p: Optional[int] = None,
+    top_p: Optional[float] = None,
     repetition_penalty: float = 1.0,
 ):
     # if previous_tokens is not None:
@@ -192,9 +238,19 @@ def logits_to_probs(
 def sample(
     logits,
     previous_tokens: Optional[torch.Tensor] = None,
-    **sampling_kwargs,
+    temperature: float = 1.0,
+    top_k: Optional[int] = None,
+    top_p: Optional[float] = None,
+    repetition_penalty: float = 1.0,
 ) -> Tuple[torch.Tensor, torch.Tensor]:
-    probs = logits_to_probs(logits=logits, previous_tokens=previous_tokens, **sampling_kwargs)
+    probs = logits_to_probs(
+        logits=logits,
+        previous_tokens=previous_tokens,
+        temperature=temperature,
+        top_k=top_k,
+        top_p=top_p,
+        repetition_penalty=repetition_penalty,
+    )
     idx_next = multinomial_sample_one_no_sync(probs)
     return idx_next, probs
 
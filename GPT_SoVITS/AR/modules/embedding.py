@@ -71,8 +71,10 @@ class SinePositionalEmbedding(nn.Module):
         pe = pe.unsqueeze(0)
         self.pe = pe.to(device=x.device, dtype=x.dtype).detach()
 
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, positions: torch.Tensor = None) -> torch.Tensor:
         self.extend_pe(x)
         output = x.unsqueeze(-1) if x.ndim == 2 else x
-        output = output * self.x_scale + self.alpha * self.pe[:, : x.size(1)]
+        # packed 序列 (1, N, D) 里每个样本的位置从 0 重新计数, 位置总小于 N
+        pe = self.pe[:, : x.size(1)] if positions is None else self.pe[:, positions]
+        output = output * self.x_scale + self.alpha * pe
         return self.dropout(output)
@@ -155,6 +155,12 @@ def multi_head_attention_forward_patched(
             cache=cache,
         )
 
+    # (N, 1, L, S) 的 bool mask (True 为屏蔽) 直接按 head 广播给 SDPA, 不展开成 (N*num_heads, L, S) 的 float mask
+    broadcast_mask = None
+    if attn_mask is not None and attn_mask.dim() == 4:
+        assert attn_mask.dtype == torch.bool and key_padding_mask is None
+        broadcast_mask, attn_mask = attn_mask, None
+
     is_batched = _mha_shape_check(query, key, value, key_padding_mask, attn_mask, num_heads)
 
     # For unbatched input, we unsqueeze at the expected batch-dim to pretend that the input
@@ -372,6 +378,10 @@ def multi_head_attention_forward_patched(
     #
 
     if need_weights:
+        if broadcast_mask is not None:
+            attn_mask = torch.zeros(broadcast_mask.shape, dtype=q.dtype, device=q.device)
+            attn_mask = attn_mask.masked_fill_(broadcast_mask, float("-inf")).expand(-1, num_heads, -1, -1)
+            attn_mask = attn_mask.reshape(bsz * num_heads, tgt_len, src_len)
         B, Nt, E = q.shape
         q_scaled = q / math.sqrt(E)
 
@@ -405,7 +415,10 @@ def multi_head_attention_forward_patched(
         # attn_mask can be either (L,S) or (N*num_heads, L, S)
         # if attn_mask's shape is (1, L, S) we need to unsqueeze to (1, 1, L, S)
         # in order to match the input for SDPA of (N, num_heads, L, S)
-        if attn_mask is not None:
+        if broadcast_mask is not None:
+            # SDPA 的 bool mask 里 True 表示参与计算
+            attn_mask = broadcast_mask.logical_not()
+        elif attn_mask is not None:
             if attn_mask.size(0) == 1 and attn_mask.dim() == 3:
                 attn_mask = attn_mask.unsqueeze(0)
             else:
@@ -1,8 +1,10 @@
 import gc
 import math
 import os
+import queue
 import random
 import sys
+import threading
 import time
 import traceback
 from copy import deepcopy
@@ -25,15 +27,22 @@ from AR.models.t2s_lightning_module import Text2SemanticLightningModule
 from BigVGAN.bigvgan import BigVGAN
 from feature_extractor.cnhubert import CNHubert
 from module.mel_processing import mel_spectrogram_torch, spectrogram_torch
+from module.int8 import quantize_int8_
 from module.models import SynthesizerTrn, SynthesizerTrnV3, Generator
-from peft import LoraConfig, get_peft_model
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import (
+    get_sovits_version_from_path_fast,
+    is_safetensors,
+    load_lora_merged,
+    load_sovits_new,
+    load_t2s_weights,
+)
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 
 from tools.audio_sr import AP_BWE
 from tools.i18n.i18n import I18nAuto, scan_language_list
 from TTS_infer_pack.text_segmentation_method import splits
 from TTS_infer_pack.TextPreprocessor import TextPreprocessor
+from TTS_infer_pack.torchscript_backend import TorchScriptBackend
 from sv import SV
 
 resample_transform_dict = {}
@@ -153,6 +162,7 @@ custom:
   cnhuhbert_base_path: GPT_SoVITS/pretrained_models/chinese-hubert-base
   device: cpu
   is_half: false
+  preload_languages: []  # e.g. [zh, en], other languages load on first use
   t2s_weights_path: GPT_SoVITS/pretrained_models/gsv-v2final-pretrained/s1bert25hz-5kh-longer-epoch=12-step=369668.ckpt
   vits_weights_path: GPT_SoVITS/pretrained_models/gsv-v2final-pretrained/s2G2333k.pth
   version: v2
@@ -328,6 +338,12 @@ class TTS_Config:
             print(f"Warning: Half precision is not supported on CPU, set is_half to False.")
             self.is_half = False
 
+        # 仅 CPU: T2S 的 Linear 和 SoVITS TextEncoder 用 int8 权重, 见 module/int8.py
+        self.int8 = self.configs.get("int8", False)
+        if str(self.device) != "cpu" and self.int8:
+            print(f"Warning: INT8 quantization is only supported on CPU, set int8 to False.")
+            self.int8 = False
+
         version = self.configs.get("version", None)
         self.version = version
         assert self.version in ["v1", "v2", "v3", "v4", "v2Pro", "v2ProPlus"], "Invalid version!"
@@ -335,7 +351,20 @@ class TTS_Config:
         self.vits_weights_path = self.configs.get("vits_weights_path", None)
         self.bert_base_path = self.configs.get("bert_base_path", None)
         self.cnhuhbert_base_path = self.configs.get("cnhuhbert_base_path", None)
+        self.preload_languages: list = self.configs.get("preload_languages", None) or []
         self.languages = self.v1_languages if self.version == "v1" else self.v2_languages
+        # "torch" | "onnx" | "torchscript", onnx 后端跑 onnx_export.py 导出的图 (仅 v1/v2), 见 onnx_backend.py;
+        # torchscript 后端跑 export_torch_script.py 导出的模块, 见 torchscript_backend.py
+        self.backend: str = self.configs.get("backend", "torch")
+        self.onnx_path: str = self.configs.get("onnx_path", None)
+        self.torchscript_path: str = self.configs.get("torchscript_path", None)
+        assert self.backend in ["torch", "onnx", "torchscript"], "Invalid backend!"
+        if self.backend == "onnx" and (self.version not in ["v1", "v2"] or self.onnx_path in [None, ""]):
+            print(f"Warning: onnx backend needs onnx_path and a v1/v2 model, set backend to torch.")
+            self.backend = "torch"
+        if self.backend == "torchscript" and self.torchscript_path in [None, ""]:
+            print(f"Warning: torchscript backend needs torchscript_path, set backend to torch.")
+            self.backend = "torch"
 
         self.use_vocoder: bool = False
 
@@ -388,11 +417,16 @@ class TTS_Config:
         self.config = {
             "device": str(self.device),
             "is_half": self.is_half,
+            "int8": self.int8,
             "version": self.version,
             "t2s_weights_path": self.t2s_weights_path,
             "vits_weights_path": self.vits_weights_path,
             "bert_base_path": self.bert_base_path,
             "cnhuhbert_base_path": self.cnhuhbert_base_path,
+            "preload_languages": self.preload_languages,
+            "backend": self.backend,
+            "onnx_path": self.onnx_path,
+            "torchscript_path": self.torchscript_path,
         }
         return self.config
 
@@ -433,6 +467,8 @@ class TTS:
         self.vocoder = None
         self.sr_model: AP_BWE = None
         self.sv_model = None
+        self.onnx_backend = None  # TTS_infer_pack.onnx_backend.OnnxBackend, 用到时才导入 onnxruntime
+        self.torchscript_backend: TorchScriptBackend = None
         self.sr_model_not_exist: bool = False
 
         self.vocoder_configs: dict = {
@@ -448,6 +484,7 @@ class TTS:
         self.text_preprocessor: TextPreprocessor = TextPreprocessor(
             self.bert_model, self.bert_tokenizer, self.configs.device
         )
+        self.text_preprocessor.preload(self.configs.preload_languages, self.configs.version)
 
         self.prompt_cache: dict = {
             "ref_audio_path": None,
@@ -471,6 +508,10 @@ class TTS:
         self.init_vits_weights(self.configs.vits_weights_path)
         self.init_bert_weights(self.configs.bert_base_path)
         self.init_cnhuhbert_weights(self.configs.cnhuhbert_base_path)
+        if self.configs.backend == "onnx":
+            self.init_onnx_backend(self.configs.onnx_path)
+        elif self.configs.backend == "torchscript":
+            self.init_torchscript_backend(self.configs.torchscript_path)
         # self.enable_half_precision(self.configs.is_half)
 
     def init_cnhuhbert_weights(self, base_path: str):
@@ -566,19 +607,8 @@ class TTS:
             print(
                 f"Loading VITS pretrained weights from {weights_path}. {vits_model.load_state_dict(load_sovits_new(path_sovits)['weight'], strict=False)}"
             )
-            lora_rank = dict_s2["lora_rank"]
-            lora_config = LoraConfig(
-                target_modules=["to_k", "to_q", "to_v", "to_out.0"],
-                r=lora_rank,
-                lora_alpha=lora_rank,
-                init_lora_weights=True,
-            )
-            vits_model.cfm = get_peft_model(vits_model.cfm, lora_config)
-            print(
-                f"Loading LoRA weights from {weights_path}. {vits_model.load_state_dict(dict_s2['weight'], strict=False)}"
-            )
-
-            vits_model.cfm = vits_model.cfm.merge_and_unload()
+            cached = load_lora_merged(vits_model, path_sovits, weights_path, dict_s2)
+            print(f"Loading LoRA weights from {weights_path}. {'merged cache' if cached else 'merged'}")
 
         vits_model = vits_model.to(self.configs.device)
         vits_model = vits_model.eval()
@@ -586,6 +616,12 @@ class TTS:
         self.vits_model = vits_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.vits_model = self.vits_model.half()
+        if self.configs.int8 and str(self.configs.device) == "cpu":
+            print(f"INT8 quantized {quantize_int8_(self.vits_model.enc_p)} layers of the SoVITS text encoder")
+        if self.onnx_backend is not None:  # 换了权重, 重新核对导出的图
+            self.init_onnx_backend(self.configs.onnx_path)
+        if self.torchscript_backend is not None:  # 换了权重, 重新核对导出的模块
+            self.init_torchscript_backend(self.configs.torchscript_path)
 
         self.configs.save_configs()
 
@@ -596,21 +632,62 @@ class TTS:
         self.configs.t2s_weights_path = weights_path
         self.configs.save_configs()
         self.configs.hz = 50
-        dict_s1 = torch.load(weights_path, map_location=self.configs.device, weights_only=False)
+        dict_s1 = load_t2s_weights(weights_path, map_location=self.configs.device)
         config = dict_s1["config"]
         self.configs.max_sec = config["data"]["max_sec"]
         t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
-        t2s_model.load_state_dict(dict_s1["weight"])
+        if is_safetensors(weights_path):
+            # 张量已经在 device 上, 直接换进模型, 不再拷回 cpu 上新建的参数; 权重存的是 fp16
+            t2s_model.load_state_dict(dict_s1["weight"], assign=True)
+            t2s_model = t2s_model.float()
+        else:
+            t2s_model.load_state_dict(dict_s1["weight"])
         t2s_model = t2s_model.to(self.configs.device)
         t2s_model = t2s_model.eval()
         self.t2s_model = t2s_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.t2s_model = self.t2s_model.half()
+        if self.configs.int8 and str(self.configs.device) == "cpu":
+            self.t2s_model.model.quantize_int8()
 
         codebook = t2s_model.model.ar_audio_embedding.weight.clone()
         mute_emb = codebook[self.configs.mute_tokens[self.configs.version]].unsqueeze(0)
         sim_matrix = F.cosine_similarity(mute_emb.float(), codebook.float(), dim=-1)
         self.configs.mute_emb_sim_matrix = sim_matrix
+        if self.onnx_backend is not None:
+            self.init_onnx_backend(self.configs.onnx_path)
+        if self.torchscript_backend is not None:
+            self.init_torchscript_backend(self.configs.torchscript_path)
+
+    def init_onnx_backend(self, onnx_path: str):
+        print(f"Loading onnx models from {onnx_path}")
+        from TTS_infer_pack.onnx_backend import OnnxBackend
+
+        previous = self.onnx_backend
+        self.onnx_backend = OnnxBackend(
+            onnx_path,
+            self.configs.device,
+            eos=self.t2s_model.model.EOS,
+            version=self.configs.version,
+            t2s_weights_path=self.configs.t2s_weights_path,
+            vits_weights_path=self.configs.vits_weights_path,
+        )
+        if previous is not None:  # set_device 重建会话, 参考音频沿用
+            self.onnx_backend.ref_audio_path, self.onnx_backend.ref_audio = previous.ref_audio_path, previous.ref_audio
+
+    def init_torchscript_backend(self, torchscript_path: str):
+        print(f"Loading torchscript models from {torchscript_path}")
+        previous = self.torchscript_backend
+        self.torchscript_backend = TorchScriptBackend(
+            torchscript_path,
+            self.configs.device,
+            self.configs.is_half,
+            self.configs.version,
+            self.configs.t2s_weights_path,
+            self.configs.vits_weights_path,
+        )
+        if previous is not None and previous.ref_audio is not None:  # 参考音频沿用
+            self.torchscript_backend.set_ref_audio(previous.ref_audio_path, previous.ref_audio)
 
     def init_vocoder(self, version: str):
         if version == "v3":
@@ -725,6 +802,27 @@ class TTS:
                 self.cnhuhbert_model = self.cnhuhbert_model.float()
             if self.vocoder is not None:
                 self.vocoder = self.vocoder.float()
+        if self.torchscript_backend is not None:  # 导出的模块精度固定, 重新核对
+            self.init_torchscript_backend(self.configs.torchscript_path)
+
+    def enable_int8(self, enable: bool = True, save: bool = True):
+        """
+        To enable weight-only INT8 quantization of the T2S and SoVITS text encoder (CPU only).
+        The T2S and SoVITS weights are reloaded.
+        Args:
+            enable: bool, whether to enable INT8 quantization.
+        """
+        if str(self.configs.device) != "cpu" and enable:
+            print("INT8 quantization is only supported on CPU.")
+            return
+        if self.configs.int8 == enable:
+            return
+
+        self.configs.int8 = enable
+        if save:
+            self.configs.save_configs()
+        self.init_t2s_weights(self.configs.t2s_weights_path)
+        self.init_vits_weights(self.configs.vits_weights_path)
 
     def set_device(self, device: torch.device, save: bool = True):
         """
@@ -735,6 +833,12 @@ class TTS:
         self.configs.device = device
         if save:
             self.configs.save_configs()
+        if self.configs.int8 and str(device) != "cpu":
+            # int8 权重不随 .to() 移动, 重新加载 fp32 权重
+            print("INT8 quantization is only supported on CPU, reload fp32 weights.")
+            self.configs.int8 = False
+            self.init_t2s_weights(self.configs.t2s_weights_path)
+            self.init_vits_weights(self.configs.vits_weights_path)
         if self.t2s_model is not None:
             self.t2s_model = self.t2s_model.to(device)
         if self.vits_model is not None:
@@ -747,6 +851,10 @@ class TTS:
             self.vocoder = self.vocoder.to(device)
         if self.sr_model is not None:
             self.sr_model = self.sr_model.to(device)
+        if self.onnx_backend is not None:
+            self.init_onnx_backend(self.configs.onnx_path)
+        if self.torchscript_backend is not None:
+            self.init_torchscript_backend(self.configs.torchscript_path)
 
     def set_ref_audio(self, ref_audio_path: str):
         """
@@ -763,13 +871,18 @@ class TTS:
         self.prompt_cache["ref_audio_path"] = ref_audio_path
 
     def _set_ref_spec(self, ref_audio_path):
-        spec_audio = self._get_ref_spec(ref_audio_path)
+        audio = self._get_ref_audio(ref_audio_path)
+        spec_audio = self._get_ref_spec(ref_audio_path, audio)
         if self.prompt_cache["refer_spec"] in [[], None]:
             self.prompt_cache["refer_spec"] = [spec_audio]
         else:
             self.prompt_cache["refer_spec"][0] = spec_audio
+        if self.onnx_backend is not None:
+            self.onnx_backend.set_ref_audio(ref_audio_path, audio)
+        if self.torchscript_backend is not None:
+            self.torchscript_backend.set_ref_audio(ref_audio_path, audio)
 
-    def _get_ref_spec(self, ref_audio_path):
+    def _get_ref_audio(self, ref_audio_path):
         raw_audio, raw_sr = torchaudio.load(ref_audio_path)
         raw_audio = raw_audio.to(self.configs.device).float()
         self.prompt_cache["raw_audio"] = raw_audio
@@ -788,6 +901,11 @@ class TTS:
         maxx = audio.abs().max()
         if maxx > 1:
             audio /= min(2, maxx)
+        return audio
+
+    def _get_ref_spec(self, ref_audio_path, audio=None):
+        if audio is None:
+            audio = self._get_ref_audio(ref_audio_path)
         spec = spectrogram_torch(
             audio,
             self.configs.filter_length,
@@ -968,6 +1086,68 @@ class TTS:
 
         return _data, batch_index_list
 
+    def prefetch_batches(self, make_batch, batch_texts_list: list, prefetch: int = 2):
+        """
+        Prepare text batches in a background thread while the caller synthesizes the previous ones,
+        so that g2p/BERT of the next sentences overlaps with T2S/VITS decoding of the current one.
+
+        Args:
+            make_batch (Callable[[list], dict]): turns a list of texts into a batch, may return None.
+            batch_texts_list (List[list]): texts grouped by batch.
+            prefetch (int): max number of prepared batches waiting in the queue, 0 runs inline.
+
+        Yields:
+            dict: the prepared batches in their original order, skipping empty ones.
+        """
+        if prefetch <= 0:
+            for batch_texts in batch_texts_list:
+                batch = make_batch(batch_texts)
+                if batch is not None:
+                    yield batch
+            return
+
+        batch_queue = queue.Queue(maxsize=prefetch)
+        done = object()
+        closed = threading.Event()
+
+        def put(item):
+            while not closed.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def producer():
+            try:
+                # 梯度开关是线程局部的, 需要在工作线程内重新关闭
+                with torch.no_grad():
+                    for batch_texts in batch_texts_list:
+                        if closed.is_set() or self.stop_flag:
+                            break
+                        batch = make_batch(batch_texts)
+                        if batch is not None and not put(batch):
+                            return
+            except Exception as e:
+                put(e)
+                return
+            put(done)
+
+        worker = threading.Thread(target=producer, name="tts-frontend", daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = batch_queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            closed.set()
+            worker.join()
+
     def recovery_order(self, data: list, batch_index_list: list) -> list:
         """
         Recovery the order of the audio according to the batch_index_list.
@@ -1027,6 +1207,7 @@ class TTS:
                     "overlap_length": 2,          # int. overlap length of semantic tokens for streaming mode.
                     "min_chunk_length": 16,        # int. The minimum chunk length of semantic tokens for streaming mode. (affects audio chunk size)
                     "fixed_length_chunk": False,  # bool. When turned on, it can achieve faster streaming response, but with lower quality. (lower quality, faster response speed)
+                    "frontend_prefetch": 2,       # int. number of text batches prepared ahead of synthesis in return_fragment/streaming mode, 0 to disable.
                 }
         returns:
             Tuple[int, np.ndarray]: sampling rate and audio data.
@@ -1060,6 +1241,7 @@ class TTS:
         overlap_length = inputs.get("overlap_length", 2)
         min_chunk_length = inputs.get("min_chunk_length", 16)
         fixed_length_chunk = inputs.get("fixed_length_chunk", False)
+        frontend_prefetch = inputs.get("frontend_prefetch", 2)
         chunk_split_thershold = 0.0 # 该值代表语义token与mute token的余弦相似度阈值，若大于该阈值，则视为可切分点。
 
         if parallel_infer and not streaming_mode:
@@ -1221,6 +1403,8 @@ class TTS:
                 )
                 return batch[0]
 
+            data = self.prefetch_batches(make_batch, data, frontend_prefetch)
+
         t2 = time.perf_counter()
         try:
             print("############ 推理 ############")
@@ -1232,10 +1416,6 @@ class TTS:
             output_sr = self.configs.sampling_rate if not self.configs.use_vocoder else self.vocoder_configs["sr"]
             for item in data:
                 t3 = time.perf_counter()
-                if return_fragment or streaming_mode:
-                    item = make_batch(item)
-                    if item is None:
-                        continue
 
                 batch_phones: List[torch.LongTensor] = item["phones"]
                 # batch_phones:torch.LongTensor = item["phones"]
@@ -1265,7 +1445,16 @@ class TTS:
 
                 if not streaming_mode:
                     print(f"############ {i18n('预测语义Token')} ############")
-                    pred_semantic_list, idx_list = self.t2s_model.model.infer_panel(
+                    infer_panel = self.t2s_model.model.infer_panel
+                    if self.onnx_backend is not None and self.onnx_backend.sdec is not None and prompt is not None:
+                        infer_panel = self.onnx_backend.infer_panel
+                    elif (
+                        self.torchscript_backend is not None
+                        and self.torchscript_backend.t2s is not None
+                        and prompt is not None
+                    ):
+                        infer_panel = self.torchscript_backend.infer_panel
+                    pred_semantic_list, idx_list = infer_panel(
                         all_phoneme_ids,
                         all_phoneme_lens,
                         prompt,
@@ -1313,7 +1502,26 @@ class TTS:
                             )
                             _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
 
-                            _batch_audio_fragment = self.vits_model.decode(
+                            if (
+                                self.onnx_backend is not None
+                                and self.onnx_backend.vits is not None
+                                and len(refer_audio_spec) == 1
+                                and self.onnx_backend.ref_audio_path == self.prompt_cache["ref_audio_path"]
+                            ):
+                                _batch_audio_fragment = self.onnx_backend.decode(all_pred_semantic, _batch_phones).to(
+                                    self.precision
+                                )
+                            elif (
+                                self.torchscript_backend is not None
+                                and self.torchscript_backend.vits is not None
+                                and len(refer_audio_spec) == 1
+                                and self.torchscript_backend.ref_audio_path == self.prompt_cache["ref_audio_path"]
+                            ):
+                                _batch_audio_fragment = self.torchscript_backend.decode(
+                                    all_pred_semantic, _batch_phones, sv_emb[0] if self.is_v2pro else None
+                                ).detach()
+                            else:
+                                _batch_audio_fragment = self.vits_model.decode(
                                     all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb
                                 ).detach()[0, 0, :]
 
@@ -1526,6 +1734,9 @@ class TTS:
             self.init_vits_weights(self.configs.vits_weights_path)
             raise e
         finally:
+            if hasattr(data, "close"):
+                # 提前结束时停止前端预取线程
+                data.close()
             self.empty_cache()
 
     def empty_cache(self):
@@ -1598,6 +1809,17 @@ class TTS:
 
         return sr, audio
 
+    def _cfm_inference(self, fea: torch.Tensor, mel2: torch.Tensor, sample_steps: int):
+        x_lens = torch.LongTensor([fea.size(1)]).to(fea.device)
+        if self.torchscript_backend is not None and self.torchscript_backend.dit is not None:
+            return self.torchscript_backend.cfm_inference(self.vits_model.cfm, fea, x_lens, mel2, sample_steps)
+        return self.vits_model.cfm.inference(fea, x_lens, mel2, sample_steps, inference_cfg_rate=0)
+
+    def _get_vocoder(self):
+        if self.torchscript_backend is not None and self.torchscript_backend.vocoder is not None:
+            return self.torchscript_backend.vocoder
+        return self.vocoder
+
     def using_vocoder_synthesis(
         self, semantic_tokens: torch.Tensor, phones: torch.Tensor, speed: float = 1.0, sample_steps: int = 32
     ):
@@ -1645,9 +1867,7 @@ class TTS:
             idx += chunk_len
             fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
 
-            cfm_res = self.vits_model.cfm.inference(
-                fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
-            )
+            cfm_res = self._cfm_inference(fea, mel2, sample_steps)
             cfm_res = cfm_res[:, :, mel2.shape[2] :]
 
             mel2 = cfm_res[:, :, -T_min:]
@@ -1658,7 +1878,7 @@ class TTS:
         cfm_res = denorm_spec(cfm_res)
 
         with torch.inference_mode():
-            wav_gen = self.vocoder(cfm_res)
+            wav_gen = self._get_vocoder()(cfm_res)
             audio = wav_gen[0][0]  # .cpu().detach().numpy()
 
         return audio
@@ -1744,9 +1964,7 @@ class TTS:
         bs = feat_chunks.shape[0]
         fea_ref = fea_ref.repeat(bs, 1, 1)
         fea = torch.cat([fea_ref, feat_chunks], 2).transpose(2, 1)
-        pred_spec = self.vits_model.cfm.inference(
-            fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
-        )
+        pred_spec = self._cfm_inference(fea, mel2, sample_steps)
         pred_spec = pred_spec[:, :, -chunk_len:]
         dd = pred_spec.shape[1]
         pred_spec = pred_spec.permute(1, 0, 2).contiguous().view(dd, -1).unsqueeze(0)
@@ -1755,7 +1973,7 @@ class TTS:
         pred_spec = denorm_spec(pred_spec)
 
         with torch.no_grad():
-            wav_gen = self.vocoder(pred_spec)
+            wav_gen = self._get_vocoder()(pred_spec)
             audio = wav_gen[0][0]  # .cpu().detach().numpy()
 
         audio_fragments = []
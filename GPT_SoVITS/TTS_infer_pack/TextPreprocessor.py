@@ -10,9 +10,8 @@ sys.path.append(now_dir)
 import re
 import torch
 from text.LangSegmenter import LangSegmenter
-from text import chinese
 from typing import Dict, List, Tuple
-from text.cleaner import clean_text
+from text.cleaner import clean_text, preload_languages
 from text import cleaned_text_to_sequence
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from TTS_infer_pack.text_segmentation_method import split_big_text, splits, get_method as get_seg_method
@@ -23,6 +22,9 @@ language = os.environ.get("language", "Auto")
 language = sys.argv[-1] if sys.argv[-1] in scan_language_list() else language
 i18n = I18nAuto(language=language)
 punctuation = set(["!", "?", "…", ",", ".", "-"])
+consecutive_punctuation_pattern = re.compile(
+    "([{0}])([{0}])+".format("".join(re.escape(p) for p in punctuation))
+)
 
 
 def get_first(text: str) -> str:
@@ -56,6 +58,14 @@ class TextPreprocessor:
         self.device = device
         self.bert_lock = threading.RLock()
 
+    def preload(self, languages: List[str], version: str = "v2"):
+        """
+        To load the text frontends of the given languages ahead of the first request.
+        Other languages are still loaded lazily on first use.
+        """
+        with self.bert_lock:
+            preload_languages(languages, version)
+
     def preprocess(self, text: str, lang: str, text_split_method: str, version: str = "v2") -> List[Dict]:
         print(f"############ {i18n('切分文本')} ############")
         text = self.replace_consecutive_punctuation(text)
@@ -233,7 +243,5 @@ class TextPreprocessor:
         return _text
 
     def replace_consecutive_punctuation(self, text):
-        punctuations = "".join(re.escape(p) for p in punctuation)
-        pattern = f"([{punctuations}])([{punctuations}])+"
-        result = re.sub(pattern, r"\1", text)
+        result = consecutive_punctuation_pattern.sub(r"\1", text)
         return result
\ No newline at end of file
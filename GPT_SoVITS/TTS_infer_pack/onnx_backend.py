@@ -0,0 +1,242 @@
+"""
+onnxruntime backend for the T2S and SoVITS stages of TTS (v1/v2).
+
+Runs the graphs written by GPT_SoVITS/onnx_export.py:
+
+    onnx/<name>/<name>_t2s_encoder.onnx   T2SEncoder
+    onnx/<name>/<name>_t2s_fsdec.onnx     T2SFirstStageDecoder (prompt pass, builds the kv cache)
+    onnx/<name>/<name>_t2s_sdec.onnx      T2SStageDecoder (one token per call, carries the kv cache)
+    onnx/<name>/<name>_vits.onnx          VitsModel
+    onnx/<name>/export.json               version and weights paths the graphs were exported from
+
+Set "backend: onnx" and "onnx_path: onnx/<name>" in tts_infer.yaml. The graphs are only
+used while TTS runs the weights they were exported from: the T2S graphs need the same GPT
+weights file, the vits graph the same SoVITS weights file and version. A weights file is
+matched by path and by its fingerprint (module.prep_manifest.model_id: name, size, mtime),
+so retraining into the same filename does not reuse the old graphs. TTS rebuilds the
+backend after set_gpt_weights / set_sovits_weights, and a stage that no longer matches
+stays on the PyTorch modules (exports without export.json are not used). The k / v / y_emb
+outputs of a decoder step are bound straight to the inputs of the next one through
+IOBinding, so the kv cache never leaves the execution provider. The graphs sample
+internally with fixed settings, so the token is drawn here from the exported logits with
+AR.models.utils.sample: top_k / top_p / temperature / repetition_penalty behave as in the
+PyTorch path, and with the same seed the same logits give the same tokens.
+
+BERT, cnhubert and the prompt semantic tokens stay in PyTorch. Cases the graphs cannot
+express (no prompt text, speed_factor != 1, aux reference audio, streaming mode) fall back
+to the PyTorch modules.
+"""
+
+import json
+import os
+
+import numpy as np
+import onnxruntime
+import torch
+
+from AR.models.utils import sample
+from module.prep_manifest import model_id
+
+
+def _same_weights(export_config, kind, path):
+    """路径相同且文件指纹 (名字, 大小, 修改时间) 与导出时一致"""
+    export_path = export_config["%s_weights_path" % kind]
+    if export_path in [None, ""] or path in [None, ""]:
+        return False
+    return os.path.abspath(export_path) == os.path.abspath(path) and export_config.get(
+        "%s_weights_id" % kind
+    ) == model_id(path)
+
+
+class OnnxBackend:
+    def __init__(
+        self,
+        onnx_path: str,
+        device="cpu",
+        eos: int = 1024,
+        num_threads: int = 0,
+        version: str = "v2",
+        t2s_weights_path: str = None,
+        vits_weights_path: str = None,
+    ):
+        name = os.path.basename(os.path.normpath(onnx_path))
+        self.encoder = None
+        self.fsdec = None
+        self.sdec = None
+        self.vits = None
+        self.eos = eos
+        self.ref_audio_path = None
+        self.ref_audio = None
+        export_config_path = os.path.join(onnx_path, "export.json")
+        if not os.path.exists(export_config_path):
+            print(f"Warning: {onnx_path} has no export.json (re-export it with onnx_export.py), skip it.")
+            return
+        with open(export_config_path, "r", encoding="utf-8") as f:
+            export_config = json.load(f)
+        load_t2s = _same_weights(export_config, "t2s", t2s_weights_path)
+        load_vits = export_config["version"] == version and _same_weights(export_config, "vits", vits_weights_path)
+        if not load_t2s:
+            print(f"Warning: the T2S graphs in {onnx_path} do not match {t2s_weights_path}, skip them.")
+        if not load_vits:
+            print(f"Warning: the vits graph in {onnx_path} does not match {vits_weights_path}, skip it.")
+
+        providers = ["CPUExecutionProvider"]
+        self.device_type, self.device_id = "cpu", 0
+        device = torch.device(device)
+        if device.type == "cuda" and "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            self.device_type, self.device_id = "cuda", device.index or 0
+            providers = [("CUDAExecutionProvider", {"device_id": self.device_id})] + providers
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        if num_threads > 0:
+            sess_options.intra_op_num_threads = num_threads
+
+        def load(suffix):
+            return onnxruntime.InferenceSession(
+                os.path.join(onnx_path, "%s_%s.onnx" % (name, suffix)), sess_options=sess_options, providers=providers
+            )
+
+        if load_t2s:
+            self.encoder = load("t2s_encoder")
+            self.fsdec = load("t2s_fsdec")
+            self.sdec = load("t2s_sdec")
+            self.fsdec_outputs = [item.name for item in self.fsdec.get_outputs()]
+            self.sdec_outputs = [item.name for item in self.sdec.get_outputs()]
+            # 旧版导出的 fsdec 没有 logits 输出, 第一个 token 只能用图里固定参数采样的结果
+            self.fsdec_logits = "logits" in self.fsdec_outputs
+            if not self.fsdec_logits:
+                print("%s_t2s_fsdec.onnx has no logits output, re-export it to sample the first token here" % name)
+        if load_vits:
+            self.vits = load("vits")
+
+    def _run(self, session, output_names, cpu_inputs, ort_inputs=None):
+        binding = session.io_binding()
+        for name, value in cpu_inputs.items():
+            binding.bind_cpu_input(name, np.ascontiguousarray(value))
+        for name, value in (ort_inputs or {}).items():
+            binding.bind_ortvalue_input(name, value)
+        for name in output_names:
+            binding.bind_output(name, self.device_type, self.device_id)
+        session.run_with_iobinding(binding)
+        return dict(zip(output_names, binding.get_outputs()))
+
+    def encode(self, x: torch.LongTensor, bert_feature: torch.Tensor):
+        """x: [1, N], bert_feature: [1, 1024, N]"""
+        x = x.cpu().numpy().astype(np.int64)
+        bert = bert_feature[0].transpose(0, 1).float().cpu().numpy()
+        # 编码器图里只是把 ref / text 拼起来, 从哪里切开都一样;
+        # ssl_content 只用于图里的 prompts 输出, prompt 用 TTS 缓存的 prompt_semantic
+        out = self._run(
+            self.encoder,
+            ["x"],
+            {
+                "ref_seq": x[:, :1],
+                "text_seq": x[:, 1:],
+                "ref_bert": bert[:1],
+                "text_bert": bert[1:],
+                "ssl_content": np.zeros((1, 768, 2), dtype=np.float32),
+            },
+        )
+        return out["x"]
+
+    def infer_panel_naive(
+        self,
+        x: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: torch.Tensor,
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+    ):
+        """同 Text2SemanticDecoder.infer_panel_naive (非流式), 返回 (y [1, T], idx)"""
+        x = self.encode(x, bert_feature)
+        y = prompts.cpu().long()
+        prefix_len = y.shape[1]
+        sampling_kwargs = dict(top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature)
+
+        out = self._run(self.fsdec, self.fsdec_outputs, {"prompts": y.numpy()}, {"x": x})
+        cache = {"ik": out["k"], "iv": out["v"], "iy_emb": out["y_emb"], "ix_example": out["x_example"]}
+        stop = False
+        for idx in range(1500):
+            if idx == 0 and not self.fsdec_logits:
+                logits = None
+                samples = torch.from_numpy(out["y"].numpy()[:, -1:]).long()
+            else:
+                if idx > 0:
+                    out = self._run(self.sdec, self.sdec_outputs, {"iy": y.numpy()}, cache)
+                    cache = {"ik": out["k"], "iv": out["v"], "iy_emb": out["y_emb"], "ix_example": cache["ix_example"]}
+                logits = torch.from_numpy(out["logits"].numpy()).float()
+                if idx < 11:  ###至少预测出10个token不然不给停止（0.4s）
+                    logits = logits[:, :-1]
+                samples = sample(logits, y, **sampling_kwargs)[0].long()
+
+            y = torch.concat([y, samples], dim=1)
+
+            if early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num:
+                print("use early stop num:", early_stop_num)
+                stop = True
+
+            if (logits is not None and torch.argmax(logits, dim=-1)[0] == self.eos) or samples[0, 0] == self.eos:
+                stop = True
+                y = y[:, :-1]
+
+            if idx == 1499:
+                stop = True
+
+            if stop:
+                if y.shape[1] == 0:
+                    y = torch.concat([y, torch.zeros_like(samples)], dim=1)
+                    print("bad zero prediction")
+                break
+        return y, idx
+
+    def infer_panel(
+        self,
+        x: list,
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: list,
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        """同 infer_panel_naive_batched 的输入输出; 导出的图是 batch 1, 逐条解码"""
+        y_list = []
+        idx_list = []
+        for i in range(len(x)):
+            y, idx = self.infer_panel_naive(
+                x[i].unsqueeze(0),
+                prompts[i].unsqueeze(0),
+                bert_feature[i].unsqueeze(0),
+                top_k,
+                top_p,
+                early_stop_num,
+                temperature,
+                repetition_penalty,
+            )
+            y_list.append(y[0].to(x[i].device))
+            idx_list.append(idx)
+        return y_list, idx_list
+
+    def set_ref_audio(self, ref_audio_path: str, ref_audio: torch.Tensor):
+        """ref_audio: [1, T], 已重采样到 SoVITS 采样率; vits 图里自己算 spec"""
+        self.ref_audio_path = ref_audio_path
+        self.ref_audio = ref_audio.float().cpu().numpy()
+
+    def decode(self, codes: torch.LongTensor, text: torch.LongTensor):
+        """codes: [1, 1, T], text: [1, N], 返回 [T * 2 * upsample] 的音频"""
+        audio = self.vits.run(
+            ["audio"],
+            {
+                "text_seq": text.cpu().numpy().astype(np.int64),
+                "pred_semantic": codes.cpu().numpy().astype(np.int64),
+                "ref_audio": self.ref_audio,
+            },
+        )[0]
+        return torch.from_numpy(audio).to(codes.device)
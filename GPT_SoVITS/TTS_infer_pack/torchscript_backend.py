@@ -0,0 +1,152 @@
+"""
+TorchScript backend for TTS, running the modules written by export_torch_script.py:
+
+    <path>/t2s_model.pt    T2SModel (all versions); infer_panel_batch decodes the whole batch with a kv cache
+    <path>/vits_model.pt   VitsModel, traced (v1/v2/v2Pro/v2ProPlus)
+    <path>/dit.pt          ExportDiT, the traced CFM estimator (v3/v4)
+    <path>/vocoder.pt      BigVGAN (v3) / HiFiGAN (v4), traced
+    <path>/config.json     version, device type, precision, weights paths and fingerprints of the export
+
+Export with
+    python GPT_SoVITS/export_torch_script.py --version v2 --gpt_model xxx.ckpt --sovits_model xxx.pth --output_path ts/xxx
+then set "backend: torchscript" and "torchscript_path: ts/xxx" in tts_infer.yaml.
+
+A stage is only loaded when the export matches what TTS is running: the same weights file (path and
+fingerprint, so retraining into the same filename does not reuse stale modules) and the same precision
+(half exports need a CUDA device, the T2S weights are baked into TorchScript classes and do not follow
+.half() / .float()). The traced SoVITS stages also keep the device they were exported on, so they
+additionally need the same device type. Everything else stays on the eager modules, as do the cases
+the exported modules cannot express (no prompt text, streaming mode, speed_factor != 1 for SoVITS,
+aux reference audio). The exported T2S samples with AR.models.utils.sample like the eager path, so
+top_k / top_p / temperature / repetition_penalty behave the same.
+"""
+
+import json
+import os
+
+import torch
+from torch import nn
+
+from module.prep_manifest import model_id
+
+
+def _same_weights(export_config, kind, path):
+    """路径相同且文件指纹 (名字, 大小, 修改时间) 与导出时一致"""
+    export_path = export_config["%s_weights_path" % kind]
+    if export_path in [None, ""] or path in [None, ""]:
+        return False
+    return os.path.abspath(export_path) == os.path.abspath(path) and export_config.get(
+        "%s_weights_id" % kind
+    ) == model_id(path)
+
+
+class ScriptedDiT(nn.Module):
+    """按 CFM.inference 调用 estimator 的方式包一层导出的 ExportDiT; 没有 cfg 分支, 也不缓存文本条件"""
+
+    def __init__(self, dit):
+        super().__init__()
+        self.dit = dit
+
+    def forward(self, x, prompt_x, x_lens, t, d, mu, drop_audio_cond=False, drop_text=False, **kwargs):
+        if drop_audio_cond or drop_text:
+            raise NotImplementedError("the exported DiT has no classifier-free guidance branch")
+        return self.dit(x, prompt_x, x_lens, t, d, mu), None, None
+
+
+class TorchScriptBackend:
+    def __init__(
+        self,
+        torchscript_path: str,
+        device="cpu",
+        is_half: bool = False,
+        version: str = "v2",
+        t2s_weights_path: str = None,
+        vits_weights_path: str = None,
+    ):
+        with open(os.path.join(torchscript_path, "config.json"), "r", encoding="utf-8") as f:
+            export_config = json.load(f)
+        self.device = device
+        self.t2s = None
+        self.vits = None
+        self.dit = None
+        self.vocoder = None
+        self.ref_audio_path = None
+        self.ref_audio = None
+
+        is_half = is_half and str(device) != "cpu"
+        self.dtype = torch.float16 if is_half else torch.float32
+        if export_config["is_half"] != is_half:
+            print(
+                f"Warning: {torchscript_path} was exported with is_half={export_config['is_half']}, "
+                f"TTS runs with is_half={is_half}, keep the eager modules."
+            )
+            return
+
+        def load(name):
+            return torch.jit.load(os.path.join(torchscript_path, name), map_location=device).eval()
+
+        stages = export_config["stages"]
+        if "t2s" in stages and _same_weights(export_config, "t2s", t2s_weights_path):
+            self.t2s = load("t2s_model.pt")
+        else:
+            print(f"Warning: t2s_model.pt in {torchscript_path} does not match {t2s_weights_path}, skip it.")
+
+        if export_config["version"] != version or not _same_weights(export_config, "vits", vits_weights_path):
+            print(f"Warning: {torchscript_path} does not match {vits_weights_path}, skip the SoVITS stages.")
+            return
+        if export_config["device"] != torch.device(device).type:
+            print(f"Warning: {torchscript_path} was traced on {export_config['device']}, skip the SoVITS stages.")
+            return
+        if "vits" in stages:
+            self.vits = load("vits_model.pt")
+        if "dit" in stages:
+            self.dit = ScriptedDiT(load("dit.pt"))
+        if "vocoder" in stages:
+            self.vocoder = load("vocoder.pt")
+
+    def infer_panel(
+        self,
+        x: list,
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: list,
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        """同 infer_panel_batch_infer 的输入输出, 整批一起解码"""
+        y_list, idx_list = self.t2s.infer_panel_batch(
+            list(x),
+            prompts,
+            list(bert_feature),
+            int(top_k),
+            float(top_p),
+            float(temperature),
+            float(repetition_penalty),
+            int(early_stop_num),
+        )
+        print(f"T2S Decoding EOS [{prompts.shape[1]} -> {prompts.shape[1] + max(idx_list)}]")
+        return y_list, idx_list
+
+    def set_ref_audio(self, ref_audio_path: str, ref_audio: torch.Tensor):
+        """ref_audio: [1, T], 已重采样到 SoVITS 采样率; vits_model.pt 里自己算 spec"""
+        self.ref_audio_path = ref_audio_path
+        self.ref_audio = ref_audio.to(device=self.device, dtype=self.dtype)
+
+    def decode(self, codes: torch.LongTensor, text: torch.LongTensor, sv_emb: torch.Tensor = None):
+        """codes: [1, 1, T], text: [1, N], sv_emb: [1, 20480] (v2Pro), 返回 [T * 2 * upsample] 的音频"""
+        if sv_emb is None:
+            return self.vits(text, codes, self.ref_audio)
+        return self.vits(text, codes, self.ref_audio, sv_emb.to(self.dtype))
+
+    def cfm_inference(self, cfm: nn.Module, mu, x_lens, prompt, n_timesteps):
+        """采样循环仍是 cfm.inference, 只把 estimator 临时换成导出的 DiT"""
+        estimator = cfm.estimator
+        cfm.estimator = self.dit
+        try:
+            return cfm.inference(mu, x_lens, prompt, n_timesteps, inference_cfg_rate=0)
+        finally:
+            cfm.estimator = estimator
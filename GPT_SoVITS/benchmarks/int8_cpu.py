@@ -0,0 +1,175 @@
+"""
+CPU latency and accuracy of the weight-only INT8 mode (module/int8.py, "int8: true" in
+tts_infer.yaml) against fp32, on the same weights and random inputs.
+
+T2S: the fp32 model decodes greedily; both models then score that sequence teacher-forced
+and "agree" is the share of generated positions where the int8 argmax equals the fp32
+argmax. ms/token is greedy decoding with each model.
+SoVITS (v1/v2): the same semantic tokens are decoded by the fp32 and the int8 model with
+the same noise; "mel L1" is the mean log-mel distance between the two outputs.
+
+usage (from the repository root):
+    python GPT_SoVITS/benchmarks/int8_cpu.py
+    python GPT_SoVITS/benchmarks/int8_cpu.py --gpt GPT_weights_v2/xxx.ckpt --sovits SoVITS_weights_v2/xxx.pth
+"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+import torch.nn.functional as F
+
+import utils
+from AR.models.t2s_lightning_module import Text2SemanticLightningModule
+from module.int8 import quantize_int8_
+from module.mel_processing import mel_spectrogram_torch, spectrogram_torch
+from module.models import SynthesizerTrn
+from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new, load_t2s_weights
+
+PRETRAINED = "GPT_SoVITS/pretrained_models/gsv-v2final-pretrained"
+
+
+def load_t2s(path, int8):
+    dict_s1 = load_t2s_weights(path, map_location="cpu")
+    model = Text2SemanticLightningModule(dict_s1["config"], "****", is_train=False)
+    model.load_state_dict(dict_s1["weight"])
+    model = model.float().eval().model
+    if int8:
+        model.quantize_int8()
+    return model, dict_s1["config"]
+
+
+def load_sovits(path, int8):
+    _, model_version, _ = get_sovits_version_from_path_fast(path)
+    assert model_version in ["v1", "v2"], "only SynthesizerTrn v1/v2 weights are supported here"
+    dict_s2 = load_sovits_new(path)
+    hps = utils.HParams(**dict_s2["config"])
+    model = dict(hps.model.items())
+    model["version"] = model_version
+    model["semantic_frame_rate"] = "25hz"
+    vits = SynthesizerTrn(
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        n_speakers=hps.data.n_speakers,
+        **model,
+    )
+    if hasattr(vits, "enc_q"):
+        del vits.enc_q
+    vits.load_state_dict(dict_s2["weight"], strict=False)
+    vits = vits.eval()
+    if int8:
+        quantize_int8_(vits.enc_p)
+    return vits, hps
+
+
+def block_mb(model):
+    blocks = model.t2s_transformer.blocks
+    tensors = [t for b in blocks for t in (b.qkv_w, b.out_w, b.mlp.w1, b.mlp.w2)]
+    return sum(t.numel() * t.element_size() for t in tensors) / 2**20
+
+
+def greedy(model, x, bert, prompts, early_stop_num):
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        y, idx = next(
+            model.infer_panel_naive(
+                x, torch.LongTensor([x.shape[1]]), prompts, bert, top_k=1, early_stop_num=early_stop_num
+            )
+        )
+    return y, (time.perf_counter() - t0) / (idx + 1) * 1000
+
+
+def teacher_forced_argmax(model, x, bert, y):
+    """y 为 prompt + 生成的 token, 返回每个 y 位置对下一个 token 的 argmax"""
+    with torch.no_grad():
+        x = model.ar_text_embedding(x)
+        x = x + model.bert_proj(bert.transpose(1, 2))
+        x = model.ar_text_position(x)
+        y_pos = model.ar_audio_position(model.ar_audio_embedding(y))
+        x_len, y_len = x.shape[1], y.shape[1]
+        x_attn_mask = F.pad(torch.zeros((x_len, x_len), dtype=torch.bool), (0, y_len), value=True)
+        y_attn_mask = F.pad(torch.triu(torch.ones(y_len, y_len, dtype=torch.bool), diagonal=1), (x_len, 0), value=False)
+        xy_attn_mask = torch.concat([x_attn_mask, y_attn_mask], dim=0)[None, None]
+        xy_dec, _, _ = model.t2s_transformer.process_prompt(torch.concat([x, y_pos], dim=1), xy_attn_mask, None)
+        return model.ar_predict_layer(xy_dec[:, x_len:]).argmax(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gpt", default="%s/s1bert25hz-5kh-longer-epoch=12-step=369668.ckpt" % PRETRAINED)
+    parser.add_argument("--sovits", default="%s/s2G2333k.pth" % PRETRAINED)
+    parser.add_argument("--phones", type=int, default=60, help="prompt + target phonemes")
+    parser.add_argument("--prompt", type=int, default=150, help="prompt semantic tokens")
+    parser.add_argument("--max_tokens", type=int, default=300)
+    parser.add_argument("--codes", type=int, default=250, help="semantic tokens decoded by SoVITS")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    t2s_fp32, config = load_t2s(args.gpt, False)
+    t2s_int8, _ = load_t2s(args.gpt, True)
+    x = torch.randint(1, config["model"]["phoneme_vocab_size"], (1, args.phones))
+    bert = torch.randn(1, 1024, args.phones)
+    prompts = torch.randint(0, config["model"]["EOS"], (1, args.prompt))
+
+    y, _ = greedy(t2s_fp32, x, bert, prompts, args.max_tokens)
+    ms_fp32 = min(greedy(t2s_fp32, x, bert, prompts, args.max_tokens)[1] for _ in range(args.runs))
+    ms_int8 = min(greedy(t2s_int8, x, bert, prompts, args.max_tokens)[1] for _ in range(args.runs))
+    argmax_fp32 = teacher_forced_argmax(t2s_fp32, x, bert, y)[:, args.prompt - 1 : -1]
+    argmax_int8 = teacher_forced_argmax(t2s_int8, x, bert, y)[:, args.prompt - 1 : -1]
+    agree = (argmax_fp32 == argmax_int8).float().mean().item()
+    print(f"T2S: {y.shape[1] - args.prompt} tokens, agree {agree * 100:.1f}%")
+    print(f"{'t2s':<8}{'fp32':>12}{'int8':>12}")
+    print(f"{'MB':<8}{block_mb(t2s_fp32):>12.1f}{block_mb(t2s_int8):>12.1f}")
+    print(f"{'ms/tok':<8}{ms_fp32:>12.2f}{ms_int8:>12.2f}")
+
+    vits_fp32, hps = load_sovits(args.sovits, False)
+    vits_int8, _ = load_sovits(args.sovits, True)
+    codes = torch.randint(0, 1024, (1, 1, args.codes))
+    text = torch.randint(1, 300, (1, args.phones))
+    audio = torch.rand(1, hps.data.sampling_rate * 5) * 0.2 - 0.1
+    refer = spectrogram_torch(
+        audio, hps.data.filter_length, hps.data.sampling_rate, hps.data.hop_length, hps.data.win_length, center=False
+    )
+
+    def decode(vits):
+        torch.manual_seed(args.seed)
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            out = vits.decode(codes, text, [refer])[0, 0]
+        return out, (time.perf_counter() - t0) * 1000
+
+    def mel(wav):
+        return mel_spectrogram_torch(
+            wav.unsqueeze(0),
+            hps.data.filter_length,
+            100,
+            hps.data.sampling_rate,
+            hps.data.hop_length,
+            hps.data.win_length,
+            0,
+            None,
+        )
+
+    wav_fp32, _ = decode(vits_fp32)
+    wav_int8, _ = decode(vits_int8)
+    ms_fp32 = min(decode(vits_fp32)[1] for _ in range(args.runs))
+    ms_int8 = min(decode(vits_int8)[1] for _ in range(args.runs))
+    print(f"SoVITS: mel L1 {(mel(wav_fp32) - mel(wav_int8)).abs().mean().item():.4f}")
+    print(f"{'sovits':<8}{'fp32':>12}{'int8':>12}")
+    print(f"{'ms':<8}{ms_fp32:>12.1f}{ms_int8:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
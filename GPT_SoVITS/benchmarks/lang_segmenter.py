@@ -0,0 +1,90 @@
+"""
+Per-sentence cost of LangSegmenter.getTexts on a mixed zh/en/ja corpus.
+
+Compares three paths:
+    fresh     a new LangSplitter for every call (previous behaviour)
+    shared    the shared LangSplitter, full language detection
+    getTexts  the shared LangSplitter plus the single-script fast path
+
+usage (from the repository root):
+    python GPT_SoVITS/benchmarks/lang_segmenter.py
+    python GPT_SoVITS/benchmarks/lang_segmenter.py --corpus sentences.txt --language all_zh
+"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+from text.LangSegmenter import langsegmenter
+from text.LangSegmenter import LangSegmenter
+
+CORPUS = [
+    "当时ThinkPad T60刚刚发布，一同推出的还有一款名为Advanced Dock的扩展坞配件。",
+    "这款扩展坞通过连接T60底部的插槽，扩展出包括PCIe在内的一大堆接口。",
+    "今天天气很好，我们一起去公园散步吧。",
+    "他在2023年3月15日发表了这篇论文，引用次数已经超过1000次。",
+    "MyGO?,你也喜欢まいご吗？",
+    "ねえ、知ってる？最近、僕は天文学を勉強してるんだ。",
+    "君の瞳が星空みたいにキラキラしてるからさ。",
+    "In this paper, we propose DSPGAN, a GAN-based universal vocoder.",
+    "The quick brown fox jumps over the lazy dog 3 times.",
+    "e.g. I used openai's AI tool to draw a picture.",
+    "我最近在学习Python和PyTorch，感觉deep learning很有意思。",
+    "東京タワーは1958年に完成しました。",
+]
+
+LANGUAGE_TO_DEFAULT = {
+    "auto": "",
+    "all_zh": "zh",
+    "all_ja": "ja",
+    "all_ko": "ko",
+}
+
+
+def run(fn, texts, default_lang):
+    t0 = time.perf_counter()
+    results = [fn(text, default_lang) for text in texts]
+    return time.perf_counter() - t0, results
+
+
+def fresh_split(text, default_lang):
+    langsegmenter.lang_splitter = None
+    return LangSegmenter.splitTexts(text, default_lang)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None, help="utf-8 text file, one sentence per line")
+    parser.add_argument("--language", default="auto", choices=list(LANGUAGE_TO_DEFAULT))
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.corpus is not None:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = CORPUS * args.repeat
+    default_lang = LANGUAGE_TO_DEFAULT[args.language]
+
+    # 预热 fast_langdetect 模型与 jieba 词典
+    LangSegmenter.splitTexts(texts[0], default_lang)
+
+    fast_hits = sum(langsegmenter.fast_path(text, default_lang) is not None for text in texts)
+    t_fresh, _ = run(fresh_split, texts, default_lang)
+    t_shared, slow_results = run(LangSegmenter.splitTexts, texts, default_lang)
+    t_fast, fast_results = run(LangSegmenter.getTexts, texts, default_lang)
+    mismatches = sum(a != b for a, b in zip(slow_results, fast_results))
+
+    n = len(texts)
+    print(f"sentences: {n}, fast path hits: {fast_hits}, mismatches vs full detection: {mismatches}")
+    for name, t in [("fresh", t_fresh), ("shared", t_shared), ("getTexts", t_fast)]:
+        print(f"{name:<10}{t:>10.3f}s{t / n * 1e6:>12.1f} us/sentence")
+
+
+if __name__ == "__main__":
+    main()
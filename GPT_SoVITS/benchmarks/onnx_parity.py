@@ -0,0 +1,155 @@
+"""
+Parity and CPU latency of the onnxruntime backend (TTS_infer_pack/onnx_backend.py)
+against the PyTorch modules of the same v1/v2 weights.
+
+T2S: both paths decode the same prompt with the same seed; "agree" is the share of
+positions where the semantic tokens match (top_k=1 makes the decode deterministic, higher
+top_k still matches as long as the logits stay close). SoVITS: the PyTorch tokens are
+decoded by both paths and compared as log-mel L1; the decoder adds noise, so a second
+PyTorch decode is printed as the noise floor.
+
+Export the graphs first with onnx_export.py (the first-stage decoder needs the "logits"
+output), then from the repository root:
+    python GPT_SoVITS/benchmarks/onnx_parity.py --onnx onnx/nahida --gpt GPT_weights/nahida-e25.ckpt \\
+        --sovits SoVITS_weights/nahida_e30_s3930.pth --ref_audio ref.wav --ref_text "参考音频的文本"
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+
+from module.mel_processing import mel_spectrogram_torch
+from TTS_infer_pack.onnx_backend import OnnxBackend
+from TTS_infer_pack.TTS import TTS, TTS_Config, set_seed
+
+
+def timed(fn, runs):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        out = fn()
+    return out, (time.perf_counter() - t0) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--onnx", required=True, help="onnx/<name>, as written by onnx_export.py")
+    parser.add_argument("--gpt", required=True)
+    parser.add_argument("--sovits", required=True)
+    parser.add_argument("--version", default="v2", choices=["v1", "v2"])
+    parser.add_argument("--ref_audio", required=True)
+    parser.add_argument("--ref_text", required=True)
+    parser.add_argument("--ref_lang", default="zh")
+    parser.add_argument("--text", default="先帝创业未半而中道崩殂，今天下三分，益州疲弊，此诚危急存亡之秋也。")
+    parser.add_argument("--text_lang", default="zh")
+    parser.add_argument("--top_k", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    config = TTS_Config(
+        {
+            "custom": {
+                "device": "cpu",
+                "is_half": False,
+                "version": args.version,
+                "t2s_weights_path": args.gpt,
+                "vits_weights_path": args.sovits,
+            }
+        }
+    )
+    # 不覆盖 GPT_SoVITS/configs/tts_infer.yaml
+    config.configs_path = os.path.join(tempfile.mkdtemp(), "tts_infer.yaml")
+    tts = TTS(config)
+    backend = OnnxBackend(
+        args.onnx,
+        "cpu",
+        eos=tts.t2s_model.model.EOS,
+        num_threads=args.threads,
+        version=tts.configs.version,
+        t2s_weights_path=args.gpt,
+        vits_weights_path=args.sovits,
+    )
+    assert backend.sdec is not None and backend.vits is not None, "%s is not exported from these weights" % args.onnx
+    tts.set_ref_audio(args.ref_audio)
+    backend.set_ref_audio(args.ref_audio, tts._get_ref_audio(args.ref_audio))
+
+    version = tts.configs.version
+    prompt_phones, prompt_bert, _ = tts.text_preprocessor.segment_and_extract_feature_for_text(
+        args.ref_text, args.ref_lang, version
+    )
+    phones, bert, _ = tts.text_preprocessor.segment_and_extract_feature_for_text(args.text, args.text_lang, version)
+    x = [torch.LongTensor(prompt_phones + phones)]
+    x_lens = torch.LongTensor([x[0].shape[0]])
+    bert_feature = [torch.cat([prompt_bert, bert], 1).float()]
+    prompt = tts.prompt_cache["prompt_semantic"].unsqueeze(0)
+    sampling_kwargs = dict(
+        top_k=args.top_k,
+        top_p=1,
+        temperature=1,
+        early_stop_num=tts.configs.hz * tts.configs.max_sec,
+        repetition_penalty=1.35,
+    )
+
+    def t2s(infer_panel):
+        def fn():
+            set_seed(args.seed)
+            with torch.no_grad():
+                y_list, idx_list = infer_panel(x, x_lens, prompt, bert_feature, **sampling_kwargs)
+            return y_list[0][-idx_list[0] :]
+
+        return fn
+
+    tokens_pt, ms_t2s_pt = timed(t2s(tts.t2s_model.model.infer_panel_naive_batched), args.runs)
+    tokens_ort, ms_t2s_ort = timed(t2s(backend.infer_panel), args.runs)
+    n = min(tokens_pt.shape[0], tokens_ort.shape[0])
+    agree = (tokens_pt[:n] == tokens_ort[:n]).float().mean().item()
+
+    codes = tokens_pt.view(1, 1, -1)
+    text = torch.LongTensor(phones).unsqueeze(0)
+    refer = [tts.prompt_cache["refer_spec"][0][0]]
+
+    def vits_pt():
+        with torch.no_grad():
+            return tts.vits_model.decode(codes, text, refer)[0, 0]
+
+    audio_pt, ms_vits_pt = timed(vits_pt, args.runs)
+    audio_ort, ms_vits_ort = timed(lambda: backend.decode(codes, text), args.runs)
+
+    def mel(audio):
+        return mel_spectrogram_torch(
+            audio.float().unsqueeze(0),
+            tts.configs.filter_length,
+            100,
+            tts.configs.sampling_rate,
+            tts.configs.hop_length,
+            tts.configs.win_length,
+            0,
+            None,
+        )
+
+    def mel_l1(a, b):
+        a, b = mel(a), mel(b)
+        frames = min(a.shape[-1], b.shape[-1])
+        return (a[..., :frames] - b[..., :frames]).abs().mean().item()
+
+    print(f"semantic tokens: torch {tokens_pt.shape[0]}, onnx {tokens_ort.shape[0]}, agree {agree * 100:.1f}%")
+    print(f"mel L1: onnx vs torch {mel_l1(audio_ort, audio_pt):.4f}, torch vs torch {mel_l1(vits_pt(), audio_pt):.4f}")
+    print(f"{'stage':<8}{'torch ms':>12}{'onnx ms':>12}{'speedup':>10}")
+    for name, pt, ort in (("t2s", ms_t2s_pt, ms_t2s_ort), ("vits", ms_vits_pt, ms_vits_ort)):
+        print(f"{name:<8}{pt:>12.1f}{ort:>12.1f}{pt / ort:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
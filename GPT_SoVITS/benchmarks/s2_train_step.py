@@ -0,0 +1,142 @@
+"""
+CPU step time of the SoVITS (s2) training step with a tiny model.
+
+"reference" is the step as it used to be (mel of the whole spec, then slice; real
+branch of the generator-pass discriminator built with grad), "fast" is the current
+s2_train.py step (slice the spec first, real branch under no_grad). Both run the same
+D and G updates on random data, so the numbers only measure the step itself.
+
+usage (from the repository root):
+    python GPT_SoVITS/benchmarks/s2_train_step.py
+    python GPT_SoVITS/benchmarks/s2_train_step.py --batch_size 4 --frames 200 --steps 10
+"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+
+import utils
+from module import commons
+from module.losses import discriminator_loss, feature_loss, generator_loss, kl_loss
+from module.mel_processing import mel_spectrogram_torch, spec_to_mel_torch
+from module.models import MultiPeriodDiscriminator, SynthesizerTrn
+
+TINY_MODEL = {
+    "inter_channels": 32,
+    "hidden_channels": 32,
+    "filter_channels": 64,
+    "n_heads": 2,
+    "n_layers": 2,
+    "n_layers_q": 1,
+    "upsample_initial_channel": 32,
+    "gin_channels": 32,
+}
+
+
+def make_batch(hps, batch_size, frames, text_len):
+    spec_lengths = torch.full((batch_size,), frames, dtype=torch.long)
+    spec = torch.rand(batch_size, hps.data.filter_length // 2 + 1, frames) + 1e-3
+    ssl = torch.randn(batch_size, 768, frames)
+    y = torch.rand(batch_size, 1, frames * hps.data.hop_length) * 1.6 - 0.8
+    text = torch.randint(1, 100, (batch_size, text_len))
+    text_lengths = torch.full((batch_size,), text_len, dtype=torch.long)
+    return ssl, spec, spec_lengths, y, text, text_lengths
+
+
+def train_step(hps, net_g, net_d, optim_g, optim_d, batch, fast):
+    ssl, spec, spec_lengths, y, text, text_lengths = batch
+    mel_args = (
+        hps.data.filter_length,
+        hps.data.n_mel_channels,
+        hps.data.sampling_rate,
+        hps.data.mel_fmin,
+        hps.data.mel_fmax,
+    )
+    segment_frames = hps.train.segment_size // hps.data.hop_length
+
+    y_hat, kl_ssl, ids_slice, _, z_mask, (z, z_p, m_p, logs_p, m_q, logs_q), _ = net_g(
+        ssl, spec, spec_lengths, text, text_lengths
+    )
+    if fast:
+        y_mel = spec_to_mel_torch(commons.slice_segments(spec, ids_slice, segment_frames), *mel_args)
+    else:
+        y_mel = commons.slice_segments(spec_to_mel_torch(spec, *mel_args), ids_slice, segment_frames)
+    y_hat_mel = mel_spectrogram_torch(
+        y_hat.squeeze(1),
+        hps.data.filter_length,
+        hps.data.n_mel_channels,
+        hps.data.sampling_rate,
+        hps.data.hop_length,
+        hps.data.win_length,
+        hps.data.mel_fmin,
+        hps.data.mel_fmax,
+    )
+    y = commons.slice_segments(y, ids_slice * hps.data.hop_length, hps.train.segment_size)
+
+    y_d_hat_r, y_d_hat_g, _, _ = net_d(y, y_hat.detach())
+    loss_disc, _, _ = discriminator_loss(y_d_hat_r, y_d_hat_g)
+    optim_d.zero_grad()
+    loss_disc.backward()
+    optim_d.step()
+
+    _, y_d_hat_g, fmap_r, fmap_g = net_d(y, y_hat, grad_real=not fast)
+    loss_mel = torch.nn.functional.l1_loss(y_mel, y_hat_mel) * hps.train.c_mel
+    loss_kl = kl_loss(z_p, logs_q, m_p, logs_p, z_mask) * hps.train.c_kl
+    loss_gen, _ = generator_loss(y_d_hat_g)
+    loss_gen_all = loss_gen + feature_loss(fmap_r, fmap_g) + loss_mel + kl_ssl + loss_kl
+    optim_g.zero_grad()
+    loss_gen_all.backward()
+    optim_g.step()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="GPT_SoVITS/configs/s2.json")
+    parser.add_argument("--batch_size", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=100, help="spec frames per sample")
+    parser.add_argument("--text_len", type=int, default=40)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    hps = utils.get_hparams_from_file(args.config)
+    model = dict(hps.model.items())
+    model.update(TINY_MODEL)
+    model.setdefault("version", "v2")
+
+    net_g = SynthesizerTrn(
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        n_speakers=hps.data.n_speakers,
+        **model,
+    )
+    net_d = MultiPeriodDiscriminator(hps.model.use_spectral_norm, version=model["version"])
+    optim_g = torch.optim.AdamW(filter(lambda p: p.requires_grad, net_g.parameters()), hps.train.learning_rate)
+    optim_d = torch.optim.AdamW(net_d.parameters(), hps.train.learning_rate)
+    net_g.train()
+    net_d.train()
+    batch = make_batch(hps, args.batch_size, args.frames, args.text_len)
+
+    print(f"{'mode':<12}{'ms/step':>12}")
+    for name, fast in (("reference", False), ("fast", True)):
+        for _ in range(args.warmup):
+            train_step(hps, net_g, net_d, optim_g, optim_d, batch, fast)
+        t0 = time.perf_counter()
+        for _ in range(args.steps):
+            train_step(hps, net_g, net_d, optim_g, optim_d, batch, fast)
+        print(f"{name:<12}{(time.perf_counter() - t0) / args.steps * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Import-time cost of the text frontends.
+
+Every module is imported in a fresh interpreter so the numbers are not
+polluted by modules a previous import already pulled in.
+
+usage (from the repository root):
+    python GPT_SoVITS/benchmarks/text_import.py
+    python GPT_SoVITS/benchmarks/text_import.py --preload zh en
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+now_dir = os.getcwd()
+gpt_sovits_dir = os.path.join(now_dir, "GPT_SoVITS")
+
+MODULES = [
+    "text.cleaner",
+    "text.LangSegmenter",
+    "TTS_infer_pack.TextPreprocessor",
+    "text.chinese2",
+    "text.english",
+    "text.japanese",
+    "text.korean",
+    "text.cantonese",
+]
+
+PROBE = """
+import json, time
+import psutil
+process = psutil.Process()
+rss0 = process.memory_info().rss
+t0 = time.perf_counter()
+{body}
+t1 = time.perf_counter()
+rss1 = process.memory_info().rss
+print(json.dumps({{"seconds": t1 - t0, "rss_mb": (rss1 - rss0) / 2**20}}))
+"""
+
+
+def probe(body: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([now_dir, gpt_sovits_dir, env.get("PYTHONPATH", "")])
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(body=body)],
+        cwd=now_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="*", default=MODULES)
+    parser.add_argument("--preload", nargs="*", default=[], help="languages to preload, e.g. zh en ja")
+    parser.add_argument("--version", default="v2")
+    args = parser.parse_args()
+
+    print(f"{'module':<40}{'seconds':>10}{'rss MB':>10}")
+    for module in args.modules:
+        res = probe(f"import {module}")
+        if "error" in res:
+            print(f"{module:<40}{res['error']}")
+        else:
+            print(f"{module:<40}{res['seconds']:>10.3f}{res['rss_mb']:>10.1f}")
+
+    for language in args.preload:
+        res = probe(
+            "from text.cleaner import preload_languages\n"
+            f"preload_languages([{language!r}], {args.version!r})"
+        )
+        name = f"preload {language}"
+        if "error" in res:
+            print(f"{name:<40}{res['error']}")
+        else:
+            print(f"{name:<40}{res['seconds']:>10.3f}{res['rss_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Per-stage latency of the TorchScript backend (TTS_infer_pack/torchscript_backend.py) against the
+eager modules of the same weights, for every version export_torch_script.py exports.
+
+t2s: --batch copies of the same sentence decoded together, infer_panel_batch_infer vs the scripted
+infer_panel_batch (top_k=1, so both stop at the same length as long as the logits stay close).
+vits (v1/v2/v2Pro/v2ProPlus): the eager semantic tokens decoded by SynthesizerTrn.decode vs
+vits_model.pt. cfm (v3/v4): one T_chunk of random features through CFM.inference with the eager DiT
+vs dit.pt. vocoder (v3/v4): one T_chunk mel through BigVGAN / HiFiGAN vs vocoder.pt.
+
+Export first, then from the repository root:
+    python GPT_SoVITS/export_torch_script.py --version v2 --gpt_model GPT_weights_v2/xxx.ckpt \\
+        --sovits_model SoVITS_weights_v2/xxx.pth --output_path ts/xxx
+    python GPT_SoVITS/benchmarks/torchscript_export.py --path ts/xxx --version v2 --gpt GPT_weights_v2/xxx.ckpt \\
+        --sovits SoVITS_weights_v2/xxx.pth --ref_audio ref.wav --ref_text "参考音频的文本"
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+
+from TTS_infer_pack.TTS import TTS, TTS_Config, set_seed
+
+
+def timed(fn, runs, device):
+    fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        out = fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return out, (time.perf_counter() - t0) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", required=True, help="output_path of export_torch_script.py")
+    parser.add_argument("--gpt", required=True)
+    parser.add_argument("--sovits", required=True)
+    parser.add_argument("--version", default="v2", choices=["v1", "v2", "v2Pro", "v2ProPlus", "v3", "v4"])
+    parser.add_argument("--ref_audio", required=True)
+    parser.add_argument("--ref_text", required=True)
+    parser.add_argument("--ref_lang", default="zh")
+    parser.add_argument("--text", default="先帝创业未半而中道崩殂，今天下三分，益州疲弊，此诚危急存亡之秋也。")
+    parser.add_argument("--text_lang", default="zh")
+    parser.add_argument("--batch", type=int, default=4, help="sentences decoded together by T2S")
+    parser.add_argument("--sample_steps", type=int, default=32, help="CFM steps (v3/v4)")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--half", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    config = TTS_Config(
+        {
+            "custom": {
+                "device": args.device,
+                "is_half": args.half,
+                "version": args.version,
+                "t2s_weights_path": args.gpt,
+                "vits_weights_path": args.sovits,
+                "backend": "torchscript",
+                "torchscript_path": args.path,
+            }
+        }
+    )
+    # 不覆盖 GPT_SoVITS/configs/tts_infer.yaml
+    config.configs_path = os.path.join(tempfile.mkdtemp(), "tts_infer.yaml")
+    tts = TTS(config)
+    backend = tts.torchscript_backend
+    tts.set_ref_audio(args.ref_audio)
+
+    version = tts.configs.version
+    device = str(tts.configs.device)
+    prompt_phones, prompt_bert, _ = tts.text_preprocessor.segment_and_extract_feature_for_text(
+        args.ref_text, args.ref_lang, version
+    )
+    phones, bert, _ = tts.text_preprocessor.segment_and_extract_feature_for_text(args.text, args.text_lang, version)
+    x = [torch.LongTensor(prompt_phones + phones).to(device)] * args.batch
+    x_lens = torch.LongTensor([x[0].shape[0]] * args.batch).to(device)
+    bert_feature = [torch.cat([prompt_bert, bert], 1).to(device=device, dtype=tts.precision)] * args.batch
+    prompt = tts.prompt_cache["prompt_semantic"].unsqueeze(0).expand(args.batch, -1).to(device)
+    sampling_kwargs = dict(
+        top_k=1,
+        top_p=1.0,
+        temperature=1.0,
+        early_stop_num=tts.configs.hz * tts.configs.max_sec,
+        repetition_penalty=1.35,
+    )
+
+    def t2s(infer_panel):
+        def fn():
+            set_seed(args.seed)
+            with torch.no_grad():
+                y_list, idx_list = infer_panel(x, x_lens, prompt, bert_feature, **sampling_kwargs)
+            return y_list[0][-idx_list[0] :]
+
+        return fn
+
+    results = []
+    tokens_eager, ms_eager = timed(t2s(tts.t2s_model.model.infer_panel_batch_infer), args.runs, device)
+    if backend is not None and backend.t2s is not None:
+        tokens_script, ms_script = timed(t2s(backend.infer_panel), args.runs, device)
+        n = min(tokens_eager.shape[0], tokens_script.shape[0])
+        agree = (tokens_eager[:n] == tokens_script[:n]).float().mean().item()
+        print(
+            f"semantic tokens: eager {tokens_eager.shape[0]}, script {tokens_script.shape[0]}, agree {agree * 100:.1f}%"
+        )
+        results.append(("t2s", ms_eager, ms_script))
+
+    if version in ["v3", "v4"]:
+        T_chunk = tts.vocoder_configs["T_chunk"]
+        T_ref = tts.vocoder_configs["T_ref"]
+        cfm = tts.vits_model.cfm
+        fea = torch.randn(1, T_chunk, 512, device=device, dtype=tts.precision)
+        x_lens_cfm = torch.LongTensor([T_chunk]).to(device)
+        mel2 = torch.randn(1, 100, T_ref, device=device, dtype=tts.precision)
+        mel = torch.randn(1, 100, T_chunk, device=device, dtype=tts.precision)
+
+        def cfm_fn(inference):
+            def fn():
+                set_seed(args.seed)
+                with torch.no_grad():
+                    return inference()
+
+            return fn
+
+        if backend is not None and backend.dit is not None:
+            _, ms_eager = timed(
+                cfm_fn(lambda: cfm.inference(fea, x_lens_cfm, mel2, args.sample_steps, inference_cfg_rate=0)),
+                args.runs,
+                device,
+            )
+            _, ms_script = timed(
+                cfm_fn(lambda: backend.cfm_inference(cfm, fea, x_lens_cfm, mel2, args.sample_steps)), args.runs, device
+            )
+            results.append(("cfm", ms_eager, ms_script))
+        if backend is not None and backend.vocoder is not None:
+            with torch.no_grad():
+                wav_eager, ms_eager = timed(lambda: tts.vocoder(mel), args.runs, device)
+                wav_script, ms_script = timed(lambda: backend.vocoder(mel), args.runs, device)
+            print(f"vocoder max abs diff: {(wav_eager - wav_script).abs().max().item():.6f}")
+            results.append(("vocoder", ms_eager, ms_script))
+    elif backend is not None and backend.vits is not None:
+        codes = tokens_eager.view(1, 1, -1)
+        text = torch.LongTensor(phones).unsqueeze(0).to(device)
+        spec, audio_16k = tts.prompt_cache["refer_spec"][0]
+        refer = [spec.to(dtype=tts.precision, device=device)]
+        sv_emb = [tts.sv_model.compute_embedding3(audio_16k)] if tts.is_v2pro else None
+
+        def vits_eager():
+            with torch.no_grad():
+                return tts.vits_model.decode(codes, text, refer, sv_emb=sv_emb)[0, 0]
+
+        def vits_script():
+            with torch.no_grad():
+                return backend.decode(codes, text, sv_emb[0] if sv_emb else None)
+
+        _, ms_eager = timed(vits_eager, args.runs, device)
+        _, ms_script = timed(vits_script, args.runs, device)
+        results.append(("vits", ms_eager, ms_script))
+
+    print(f"{'stage':<8}{'eager ms':>12}{'script ms':>12}{'speedup':>10}")
+    for name, eager, script in results:
+        print(f"{name:<8}{eager:>12.1f}{script:>12.1f}{eager / script:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
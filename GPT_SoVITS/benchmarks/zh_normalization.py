@@ -0,0 +1,116 @@
+"""
+Per-sentence cost of the Chinese text normalisation.
+
+The per-call regex / str.replace implementations that used to live in
+chinese2.py and zh_normalization are kept below as references; they are
+timed against the current table-driven versions and their outputs are
+compared sentence by sentence.
+
+usage (from the repository root):
+    python GPT_SoVITS/benchmarks/zh_normalization.py --corpus news.txt
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+from text import chinese2
+from text.cleaner import clean_text
+from text.symbols import punctuation
+from text.zh_normalization.char_convert import t2s_dict, tranditional_to_simplified
+from text.zh_normalization.text_normlization import TextNormalizer
+
+CORPUS = [
+    "国家统计局15日发布数据，2023年全年国内生产总值为1260582亿元，比上年增长5.2%。",
+    "据气象台预报，明天白天多云转阴，最高气温28℃，最低气温-3°C，东北风3~4级。",
+    "记者从市交通委获悉，地铁10号线将于2024年12月28日开通运营，全长约35.5公里。",
+    "该公司第三季度营收同比增长17.8%，净利润达到3.6亿元，约合每股收益0.45元。",
+    "比赛第85分钟，主队球员头球破门，最终以2:1逆转取胜，积分升至联赛第3位。",
+    "他说：“我们要把这件事做好，不辜负大家的期望！”随后离开了会场……",
+    "咨询电话：010-12345678，或拨打服务热线400-123-4567，手机13812345678。",
+    "這是一段繁體中文的新聞內容，用於測試繁簡轉換的性能表現。",
+]
+
+
+def legacy_replace_punctuation(text):
+    text = text.replace("嗯", "恩").replace("呣", "母")
+    pattern = re.compile("|".join(re.escape(p) for p in chinese2.rep_map.keys()))
+    replaced_text = pattern.sub(lambda x: chinese2.rep_map[x.group()], text)
+    replaced_text = re.sub(r"[^一-龥" + "".join(punctuation) + r"]+", "", replaced_text)
+    return replaced_text
+
+
+def legacy_replace_consecutive_punctuation(text):
+    punctuations = "".join(re.escape(p) for p in punctuation)
+    pattern = f"([{punctuations}])([{punctuations}])+"
+    return re.sub(pattern, r"\1", text)
+
+
+def legacy_tranditional_to_simplified(text):
+    return "".join([t2s_dict[item] if item in t2s_dict else item for item in text])
+
+
+def legacy_text_normalize(text):
+    tx = TextNormalizer()
+    sentences = tx.normalize(text)
+    dest_text = ""
+    for sentence in sentences:
+        dest_text += legacy_replace_punctuation(sentence)
+    return legacy_replace_consecutive_punctuation(dest_text)
+
+
+def timeit(fn, texts):
+    t0 = time.perf_counter()
+    results = [fn(text) for text in texts]
+    return time.perf_counter() - t0, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None, help="utf-8 text file, one sentence per line")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.corpus is not None:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = CORPUS * args.repeat
+    n = len(texts)
+
+    # 预热 jieba / g2pw, 避免首句加载耗时计入
+    clean_text(texts[0], "zh", "v2")
+
+    pairs = [
+        ("tranditional_to_simplified", legacy_tranditional_to_simplified, tranditional_to_simplified),
+        ("replace_punctuation", legacy_replace_punctuation, chinese2.replace_punctuation),
+        (
+            "replace_consecutive_punctuation",
+            legacy_replace_consecutive_punctuation,
+            chinese2.replace_consecutive_punctuation,
+        ),
+        ("text_normalize", legacy_text_normalize, chinese2.text_normalize),
+    ]
+    print(f"sentences: {n}")
+    print(f"{'stage':<34}{'legacy us':>12}{'current us':>12}{'speedup':>10}{'diff':>6}")
+    for name, legacy, current in pairs:
+        t_legacy, r_legacy = timeit(legacy, texts)
+        t_current, r_current = timeit(current, texts)
+        diff = sum(a != b for a, b in zip(r_legacy, r_current))
+        print(
+            f"{name:<34}{t_legacy / n * 1e6:>12.1f}{t_current / n * 1e6:>12.1f}"
+            f"{t_legacy / max(t_current, 1e-9):>9.2f}x{diff:>6}"
+        )
+
+    t_clean, _ = timeit(lambda text: clean_text(text, "zh", "v2"), texts)
+    print(f"{'clean_text (normalize + g2p)':<34}{'':>12}{t_clean / n * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -237,7 +237,7 @@ class ERes2NetV2(nn.Module):
         else:
             return embed_a
 
-    def forward3(self, x):
+    def forward3(self, x, lengths=None):
         x = x.permute(0, 2, 1)  # (B,T,F) => (B,F,T)
         x = x.unsqueeze_(1)
         out = F.relu(self.bn1(self.conv1(x)))
@@ -248,7 +248,15 @@ class ERes2NetV2(nn.Module):
         out3_ds = self.layer3_ds(out3)
         fuse_out34 = self.fuse34(out4, out3_ds)
         # print(111111111,fuse_out34.shape)#111111111 torch.Size([16, 2048, 10, 72])
-        return fuse_out34.flatten(start_dim=1, end_dim=2).mean(-1)
+        if lengths is None:
+            return fuse_out34.flatten(start_dim=1, end_dim=2).mean(-1)
+        # 补零的 batch: 只在每条的有效帧上求均值. layer2/3/4 各做一次 kernel 3, padding 1, stride 2 的下采样
+        fuse_out34 = fuse_out34.flatten(start_dim=1, end_dim=2)
+        for _ in range(3):
+            lengths = (lengths - 1) // 2 + 1
+        mask = torch.arange(fuse_out34.shape[-1], device=fuse_out34.device)[None] < lengths[:, None]
+        out = (fuse_out34.float() * mask[:, None]).sum(-1) / lengths[:, None].float()
+        return out.to(fuse_out34.dtype)
         # stats = self.pool(fuse_out34)
         #
         # embed_a = self.seg_1(stats)
@@ -1,5 +1,5 @@
 import math
-from typing import Tuple
+from typing import Optional, Tuple
 
 import torch
 import torchaudio
@@ -13,6 +13,7 @@ __all__ = [
     "mel_scale_scalar",
     "spectrogram",
     "fbank",
+    "fbank_batch",
     "mfcc",
     "vtln_warp_freq",
     "vtln_warp_mel_freq",
@@ -114,9 +115,9 @@ def _feature_window_function(
 
 
 def _get_log_energy(strided_input: Tensor, epsilon: Tensor, energy_floor: float) -> Tensor:
-    r"""Returns the log energy of size (m) for a strided_input (m,*)"""
+    r"""Returns the log energy of size (m) for a strided_input (m,*), or (b, m) for (b, m,*)"""
     device, dtype = strided_input.device, strided_input.dtype
-    log_energy = torch.max(strided_input.pow(2).sum(1), epsilon).log()  # size (m)
+    log_energy = torch.max(strided_input.pow(2).sum(-1), epsilon).log()  # size (m)
     if energy_floor == 0.0:
         return log_energy
     return torch.max(log_energy, torch.tensor(math.log(energy_floor), device=device, dtype=dtype))
@@ -516,6 +517,46 @@ def get_mel_banks(
 cache = {}
 
 
+def _get_cached_mel_banks(
+    num_mel_bins: int,
+    padded_window_size: int,
+    sample_frequency: float,
+    low_freq: float,
+    high_freq: float,
+    vtln_low: float,
+    vtln_high: float,
+    vtln_warp: float,
+    device: torch.device,
+    dtype: torch.dtype,
+) -> Tensor:
+    cache_key = "%s-%s-%s-%s-%s-%s-%s-%s-%s-%s" % (
+        num_mel_bins,
+        padded_window_size,
+        sample_frequency,
+        low_freq,
+        high_freq,
+        vtln_low,
+        vtln_high,
+        vtln_warp,
+        device,
+        dtype,
+    )
+    if cache_key not in cache:
+        cache[cache_key] = get_mel_banks(
+            num_mel_bins,
+            padded_window_size,
+            sample_frequency,
+            low_freq,
+            high_freq,
+            vtln_low,
+            vtln_high,
+            vtln_warp,
+            device,
+            dtype,
+        )
+    return cache[cache_key]
+
+
 def fbank(
     waveform: Tensor,
     blackman_coeff: float = 0.42,
@@ -625,7 +666,7 @@ def fbank(
     # size (num_mel_bins, padded_window_size // 2)
     # print(num_mel_bins, padded_window_size, sample_frequency, low_freq, high_freq, vtln_low, vtln_high, vtln_warp)
 
-    cache_key = "%s-%s-%s-%s-%s-%s-%s-%s-%s-%s" % (
+    mel_energies = _get_cached_mel_banks(
         num_mel_bins,
         padded_window_size,
         sample_frequency,
@@ -637,22 +678,6 @@ def fbank(
         device,
         dtype,
     )
-    if cache_key not in cache:
-        mel_energies = get_mel_banks(
-            num_mel_bins,
-            padded_window_size,
-            sample_frequency,
-            low_freq,
-            high_freq,
-            vtln_low,
-            vtln_high,
-            vtln_warp,
-            device,
-            dtype,
-        )
-        cache[cache_key] = mel_energies
-    else:
-        mel_energies = cache[cache_key]
 
     # pad right column with zeros and add dimension, size (num_mel_bins, padded_window_size // 2 + 1)
     mel_energies = torch.nn.functional.pad(mel_energies, (0, 1), mode="constant", value=0)
@@ -676,6 +701,130 @@ def fbank(
     return mel_energies
 
 
+def fbank_batch(
+    waveforms: Tensor,
+    lengths: Optional[Tensor] = None,
+    blackman_coeff: float = 0.42,
+    dither: float = 0.0,
+    energy_floor: float = 1.0,
+    frame_length: float = 25.0,
+    frame_shift: float = 10.0,
+    high_freq: float = 0.0,
+    htk_compat: bool = False,
+    low_freq: float = 20.0,
+    num_mel_bins: int = 23,
+    preemphasis_coefficient: float = 0.97,
+    raw_energy: bool = True,
+    remove_dc_offset: bool = True,
+    round_to_power_of_two: bool = True,
+    sample_frequency: float = 16000.0,
+    subtract_mean: bool = False,
+    use_energy: bool = False,
+    use_log_fbank: bool = True,
+    use_power: bool = True,
+    vtln_high: float = -500.0,
+    vtln_low: float = 100.0,
+    vtln_warp: float = 1.0,
+    window_type: str = POVEY,
+) -> Tuple[Tensor, Tensor]:
+    r"""Batched :func:`fbank` over right-padded mono waveforms, with ``snip_edges=True``.
+
+    Every frame only sees samples of its own window, so the first ``num_frames[i]`` rows of
+    ``feats[i]`` match ``fbank(waveforms[i:i+1, :lengths[i]])``; frames past that are zero.
+
+    Args:
+        waveforms (Tensor): Tensor of size (b, n), each row padded on the right
+        lengths (Tensor or None, optional): Valid samples per row, size (b). ``None`` means every row is full.
+        Other arguments are the same as :func:`fbank`.
+
+    Returns:
+        (Tensor, Tensor): feats of size (b, m, ``num_mel_bins + use_energy``) and num_frames of size (b)
+    """
+    device, dtype = waveforms.device, waveforms.dtype
+    assert waveforms.dim() == 2
+    window_shift = int(sample_frequency * frame_shift * MILLISECONDS_TO_SECONDS)
+    window_size = int(sample_frequency * frame_length * MILLISECONDS_TO_SECONDS)
+    padded_window_size = _next_power_of_2(window_size) if round_to_power_of_two else window_size
+    assert 2 <= window_size <= waveforms.size(1), "choose a window size {} that is [2, {}]".format(
+        window_size, waveforms.size(1)
+    )
+    assert 0 < window_shift, "`window_shift` must be greater than 0"
+    assert padded_window_size % 2 == 0, (
+        "the padded `window_size` must be divisible by two. use `round_to_power_of_two` or change `frame_length`"
+    )
+    assert 0.0 <= preemphasis_coefficient <= 1.0, "`preemphasis_coefficient` must be between [0,1]"
+    assert sample_frequency > 0, "`sample_frequency` must be greater than zero"
+
+    if lengths is None:
+        lengths = torch.full((waveforms.size(0),), waveforms.size(1), dtype=torch.long, device=device)
+    num_frames = torch.clamp((lengths - window_size) // window_shift + 1, min=0)
+    epsilon = _get_epsilon(device, dtype)
+
+    # size (b, m, window_size)
+    strided_input = waveforms.unfold(1, window_size, window_shift)
+
+    if dither != 0.0:
+        rand_gauss = torch.randn(strided_input.shape, device=device, dtype=dtype)
+        strided_input = strided_input + rand_gauss * dither
+
+    if remove_dc_offset:
+        strided_input = strided_input - torch.mean(strided_input, dim=2, keepdim=True)
+
+    if raw_energy:
+        signal_log_energy = _get_log_energy(strided_input, epsilon, energy_floor)  # size (b, m)
+
+    if preemphasis_coefficient != 0.0:
+        offset_strided_input = torch.nn.functional.pad(strided_input, (1, 0), mode="replicate")
+        strided_input = strided_input - preemphasis_coefficient * offset_strided_input[:, :, :-1]
+
+    window_function = _feature_window_function(window_type, window_size, blackman_coeff, device, dtype)
+    strided_input = strided_input * window_function  # size (b, m, window_size)
+
+    if padded_window_size != window_size:
+        strided_input = torch.nn.functional.pad(strided_input, (0, padded_window_size - window_size))
+
+    if not raw_energy:
+        signal_log_energy = _get_log_energy(strided_input, epsilon, energy_floor)  # size (b, m)
+
+    # size (b, m, padded_window_size // 2 + 1)
+    spectrum = torch.fft.rfft(strided_input).abs()
+    if use_power:
+        spectrum = spectrum.pow(2.0)
+
+    mel_energies = _get_cached_mel_banks(
+        num_mel_bins,
+        padded_window_size,
+        sample_frequency,
+        low_freq,
+        high_freq,
+        vtln_low,
+        vtln_high,
+        vtln_warp,
+        device,
+        dtype,
+    )
+    mel_energies = torch.nn.functional.pad(mel_energies, (0, 1), mode="constant", value=0)
+
+    # size (b, m, num_mel_bins)
+    mel_energies = torch.matmul(spectrum, mel_energies.T)
+    if use_log_fbank:
+        mel_energies = torch.max(mel_energies, epsilon).log()
+
+    if use_energy:
+        signal_log_energy = signal_log_energy.unsqueeze(2)  # size (b, m, 1)
+        if htk_compat:
+            mel_energies = torch.cat((mel_energies, signal_log_energy), dim=2)
+        else:
+            mel_energies = torch.cat((signal_log_energy, mel_energies), dim=2)
+
+    mask = (torch.arange(mel_energies.size(1), device=device)[None] < num_frames[:, None]).unsqueeze(2)
+    mel_energies = mel_energies.masked_fill(~mask, 0)
+    if subtract_mean:
+        col_means = mel_energies.sum(dim=1, keepdim=True) / num_frames.clamp(min=1)[:, None, None].to(dtype)
+        mel_energies = (mel_energies - col_means).masked_fill(~mask, 0)
+    return mel_energies, num_frames
+
+
 def _get_dct_matrix(num_ceps: int, num_mel_bins: int) -> Tensor:
     # returns a dct matrix of size (num_mel_bins, num_ceps)
     # size (num_mel_bins, num_mel_bins)
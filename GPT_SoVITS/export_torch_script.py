@@ -1,8 +1,9 @@
 # modified from https://github.com/yangdongchao/SoundStorm/blob/master/soundstorm/s1/AR/models/t2s_model.py
 # reference: https://github.com/lifeiteng/vall-e
 import argparse
+import json
 from io import BytesIO
-from typing import Optional
+from typing import List, Optional, Tuple
 from my_utils import load_audio
 import torch
 import torchaudio
@@ -14,7 +15,11 @@ from transformers import AutoModelForMaskedLM, AutoTokenizer
 from feature_extractor import cnhubert
 
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
+from AR.models.utils import logits_to_probs, multinomial_sample_one_no_sync, sample  # noqa: F401
+from module.mel_processing import spectrogram_with_window as spectrogram_torch
 from module.models_onnx import SynthesizerTrn
+from module.prep_manifest import model_id
+from process_ckpt import load_sovits_new, load_t2s_weights
 
 from inference_webui import get_phones_and_bert
 
@@ -44,18 +49,6 @@ def init_sv_cn(device, is_half):
     sv_cn_model = SV(device, is_half)
 
 
-def load_sovits_new(sovits_path):
-    f = open(sovits_path, "rb")
-    meta = f.read(2)
-    if meta != b"PK":
-        data = b"PK" + f.read()
-        bio = BytesIO()
-        bio.write(data)
-        bio.seek(0)
-        return torch.load(bio, map_location="cpu", weights_only=False)
-    return torch.load(sovits_path, map_location="cpu", weights_only=False)
-
-
 def get_raw_t2s_model(dict_s1) -> Text2SemanticLightningModule:
     config = dict_s1["config"]
     config["model"]["dropout"] = float(config["model"]["dropout"])
@@ -65,99 +58,6 @@ def get_raw_t2s_model(dict_s1) -> Text2SemanticLightningModule:
     return t2s_model
 
 
-@torch.jit.script
-def logits_to_probs(
-    logits,
-    previous_tokens: Optional[torch.Tensor] = None,
-    temperature: float = 1.0,
-    top_k: Optional[int] = None,
-    top_p: Optional[int] = None,
-    repetition_penalty: float = 1.0,
-):
-    # if previous_tokens is not None:
-    #     previous_tokens = previous_tokens.squeeze()
-    # print(logits.shape,previous_tokens.shape)
-    # pdb.set_trace()
-    if previous_tokens is not None and repetition_penalty != 1.0:
-        previous_tokens = previous_tokens.long()
-        score = torch.gather(logits, dim=1, index=previous_tokens)
-        score = torch.where(score < 0, score * repetition_penalty, score / repetition_penalty)
-        logits.scatter_(dim=1, index=previous_tokens, src=score)
-
-    if top_p is not None and top_p < 1.0:
-        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
-        cum_probs = torch.cumsum(torch.nn.functional.softmax(sorted_logits, dim=-1), dim=-1)
-        sorted_indices_to_remove = cum_probs > top_p
-        sorted_indices_to_remove[:, 0] = False  # keep at least one option
-        indices_to_remove = sorted_indices_to_remove.scatter(dim=1, index=sorted_indices, src=sorted_indices_to_remove)
-        logits = logits.masked_fill(indices_to_remove, -float("Inf"))
-
-    logits = logits / max(temperature, 1e-5)
-
-    if top_k is not None:
-        v, _ = torch.topk(logits, min(top_k, logits.size(-1)))
-        pivot = v[:, -1].unsqueeze(-1)
-        logits = torch.where(logits < pivot, -float("Inf"), logits)
-
-    probs = torch.nn.functional.softmax(logits, dim=-1)
-    return probs
-
-
-@torch.jit.script
-def multinomial_sample_one_no_sync(probs_sort):
-    # Does multinomial sampling without a cuda synchronization
-    q = torch.empty_like(probs_sort).exponential_(1.0)
-    return torch.argmax(probs_sort / q, dim=-1, keepdim=True).to(dtype=torch.int)
-
-
-@torch.jit.script
-def sample(
-    logits,
-    previous_tokens,
-    temperature: float = 1.0,
-    top_k: Optional[int] = None,
-    top_p: Optional[int] = None,
-    repetition_penalty: float = 1.35,
-):
-    probs = logits_to_probs(
-        logits=logits,
-        previous_tokens=previous_tokens,
-        temperature=temperature,
-        top_k=top_k,
-        top_p=top_p,
-        repetition_penalty=repetition_penalty,
-    )
-    idx_next = multinomial_sample_one_no_sync(probs)
-    return idx_next, probs
-
-
-@torch.jit.script
-def spectrogram_torch(
-    hann_window: Tensor, y: Tensor, n_fft: int, sampling_rate: int, hop_size: int, win_size: int, center: bool = False
-):
-    # hann_window = torch.hann_window(win_size, device=y.device, dtype=y.dtype)
-    y = torch.nn.functional.pad(
-        y.unsqueeze(1),
-        (int((n_fft - hop_size) / 2), int((n_fft - hop_size) / 2)),
-        mode="reflect",
-    )
-    y = y.squeeze(1)
-    spec = torch.stft(
-        y,
-        n_fft,
-        hop_length=hop_size,
-        win_length=win_size,
-        window=hann_window,
-        center=center,
-        pad_mode="reflect",
-        normalized=False,
-        onesided=True,
-        return_complex=False,
-    )
-    spec = torch.sqrt(spec.pow(2).sum(-1) + 1e-6)
-    return spec
-
-
 class DictToAttrRecursive(dict):
     def __init__(self, input_dict):
         super().__init__(input_dict)
@@ -278,7 +178,9 @@ class T2SBlock:
         )
         return x, k_cache, v_cache
 
-    def decode_next_token(self, x: torch.Tensor, k_cache: torch.Tensor, v_cache: torch.Tensor):
+    def decode_next_token(
+        self, x: torch.Tensor, k_cache: torch.Tensor, v_cache: torch.Tensor, attn_mask: Optional[torch.Tensor] = None
+    ):
         q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
 
         k_cache = torch.cat([k_cache, k], dim=1)
@@ -292,7 +194,11 @@ class T2SBlock:
         k = k_cache.view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
         v = v_cache.view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
 
-        attn = F.scaled_dot_product_attention(q, k, v)
+        # batch 推理时 attn_mask 遮住左侧补齐的位置
+        if attn_mask is None:
+            attn = F.scaled_dot_product_attention(q, k, v)
+        else:
+            attn = F.scaled_dot_product_attention(q, k, v, ~attn_mask)
 
         # attn = attn.permute(2, 0, 1, 3).reshape(batch_size * q_len, self.hidden_dim)
         # attn = attn.view(q_len, batch_size, self.hidden_dim).transpose(1, 0)
@@ -327,9 +233,15 @@ class T2STransformer:
             v_cache.append(v_cache_)
         return x, k_cache, v_cache
 
-    def decode_next_token(self, x: torch.Tensor, k_cache: list[torch.Tensor], v_cache: list[torch.Tensor]):
+    def decode_next_token(
+        self,
+        x: torch.Tensor,
+        k_cache: list[torch.Tensor],
+        v_cache: list[torch.Tensor],
+        attn_mask: Optional[torch.Tensor] = None,
+    ):
         for i in range(self.num_blocks):
-            x, k_cache[i], v_cache[i] = self.blocks[i].decode_next_token(x, k_cache[i], v_cache[i])
+            x, k_cache[i], v_cache[i] = self.blocks[i].decode_next_token(x, k_cache[i], v_cache[i], attn_mask)
         return x, k_cache, v_cache
 
 
@@ -504,7 +416,7 @@ class T2SModel(nn.Module):
 
         logits = self.ar_predict_layer(xy_dec[:, -1])
         logits = logits[:, :-1]
-        samples = sample(logits, y, top_k=top_k, top_p=1, repetition_penalty=1.35, temperature=1.0)[0]
+        samples = sample(logits, y, top_k=top_k, top_p=1.0, repetition_penalty=1.35, temperature=1.0)[0]
         y = torch.concat([y, samples], dim=1)
         y_emb = self.ar_audio_embedding(y[:, -1:])
         xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[
@@ -522,7 +434,7 @@ class T2SModel(nn.Module):
             if idx < 11:  ###至少预测出10个token不然不给停止（0.4s）
                 logits = logits[:, :-1]
 
-            samples = sample(logits, y, top_k=top_k, top_p=1, repetition_penalty=1.35, temperature=1.0)[0]
+            samples = sample(logits, y, top_k=top_k, top_p=1.0, repetition_penalty=1.35, temperature=1.0)[0]
 
             y = torch.concat([y, samples], dim=1)
 
@@ -544,6 +456,110 @@ class T2SModel(nn.Module):
 
         return y[:, -idx:].unsqueeze(0)
 
+    @torch.jit.export
+    def infer_panel_batch(
+        self,
+        x: List[torch.Tensor],
+        prompts: torch.Tensor,
+        bert_feature: List[torch.Tensor],
+        top_k: int = 15,
+        top_p: float = 1.0,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        early_stop_num: int = -1,
+    ) -> Tuple[List[torch.Tensor], List[int]]:
+        """
+        同 Text2SemanticDecoder.infer_panel_batch_infer, TorchScript 后端 (TTS_infer_pack/torchscript_backend.py) 调用.
+        x[i]: [N_i], bert_feature[i]: [1024, N_i], prompts: [B, P]; 文本左侧补齐后整批解码,
+        生成完的序列移出 batch. 返回每条的 y (含 prompt) 和生成的 token 数 idx
+        """
+        bsz = len(x)
+        max_len = 0
+        for item in x:
+            max_len = max(max_len, item.shape[0])
+        x_list: List[torch.Tensor] = []
+        pad_lens: List[int] = []
+        for i in range(bsz):
+            x_item = self.ar_text_embedding(x[i].unsqueeze(0))
+            bert = bert_feature[i].to(dtype=self.bert_proj.weight.dtype)
+            x_item = x_item + self.bert_proj(bert.transpose(0, 1).unsqueeze(0))
+            x_item = self.ar_text_position(x_item).squeeze(0)
+            pad_lens.append(max_len - x_item.shape[0])
+            x_list.append(F.pad(x_item, (0, 0, max_len - x_item.shape[0], 0), value=0.0))  ### padding left
+        x_all = torch.stack(x_list, dim=0)
+
+        y = prompts
+        y_emb = self.ar_audio_embedding(y)
+        y_len = y_emb.shape[1]
+        prefix_len = y.shape[1]
+        xy_pos = torch.concat([x_all, self.ar_audio_position(y_emb)], dim=1)
+
+        device = x_all.device
+        src_len = max_len + y_len
+        pad_len = torch.tensor(pad_lens, device=device)
+        x_padding_mask = torch.arange(max_len, device=device).unsqueeze(0) < pad_len.unsqueeze(1)
+        padding_mask = F.pad(x_padding_mask, (0, y_len), value=False)
+        x_mask = F.pad(torch.zeros((max_len, max_len), dtype=torch.bool, device=device), (0, y_len), value=True)
+        y_mask = F.pad(
+            torch.triu(torch.ones((y_len, y_len), dtype=torch.bool, device=device), diagonal=1),
+            (max_len, 0),
+            value=False,
+        )
+        causal_mask = torch.concat([x_mask, y_mask], dim=0).view(1, src_len, src_len)
+        # 补齐的 key 对所有 query 都不可见, 补齐的 query 仍能看到文本, 不会出现 nan
+        attn_mask = causal_mask.logical_or(padding_mask.unsqueeze(1))
+        attn_mask = attn_mask.unsqueeze(1).expand(-1, self.num_head, -1, -1)
+
+        y_list: List[torch.Tensor] = []
+        idx_list: List[int] = []
+        for i in range(bsz):
+            y_list.append(y[i])
+            idx_list.append(1499)
+        batch_index = torch.arange(bsz, device=device)
+
+        xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+        attn_mask = F.pad(attn_mask[:, :, -1].unsqueeze(-2), (0, 1), value=False)
+        for idx in range(1500):
+            if idx > 0:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
+                attn_mask = F.pad(attn_mask, (0, 1), value=False)
+            logits = self.ar_predict_layer(xy_dec[:, -1])
+            if idx < 11:  ###至少预测出10个token不然不给停止（0.4s）
+                logits = logits[:, :-1]
+
+            samples = sample(
+                logits, y, temperature=temperature, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty
+            )[0]
+            y = torch.concat([y, samples], dim=1)
+
+            finished = (samples[:, 0] == self.EOS).logical_or(torch.argmax(logits, dim=-1) == self.EOS)
+            if (early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num) or idx == 1499:
+                finished = torch.ones_like(finished)
+            if bool(finished.any()):
+                rows: List[int] = batch_index.tolist()
+                done: List[bool] = finished.tolist()
+                for i in range(len(rows)):
+                    if done[i]:
+                        y_list[rows[i]] = y[i, :-1]
+                        idx_list[rows[i]] = idx
+                keep = torch.nonzero(finished.logical_not()).squeeze(1)
+                if keep.shape[0] == 0:
+                    break
+                # 只保留 batch 中未生成完毕的序列
+                y = torch.index_select(y, 0, keep)
+                attn_mask = torch.index_select(attn_mask, 0, keep)
+                batch_index = torch.index_select(batch_index, 0, keep)
+                for i in range(len(k_cache)):
+                    k_cache[i] = torch.index_select(k_cache[i], 0, keep)
+                    v_cache[i] = torch.index_select(v_cache[i], 0, keep)
+
+            y_emb = self.ar_audio_embedding(y[:, -1:])
+            xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[
+                :, y_len + idx
+            ].to(dtype=y_emb.dtype, device=y_emb.device)
+
+        return y_list, idx_list
+
 
 bert_path = os.environ.get("bert_path", "GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large")
 cnhubert_base_path = "GPT_SoVITS/pretrained_models/chinese-hubert-base"
@@ -824,6 +840,69 @@ def export_prov2(
         soundfile.write("out.wav", audio.float().detach().cpu().numpy(), 32000)
 
 
+def export_runtime(gpt_path, vits_path, version, output_path, device="cpu", is_half=False):
+    """
+    导出 TTS_infer_pack/torchscript_backend.py 加载的模块 (backend: torchscript):
+        t2s_model.pt    T2SModel, 所有版本; infer_panel_batch 整批解码
+        vits_model.pt   VitsModel (trace, speed 固定为 1), v1/v2/v2Pro/v2ProPlus
+        dit.pt          ExportDiT (trace), v3/v4, 见 export_torch_script_v3v4.export_runtime_v3v4
+        vocoder.pt      BigVGAN (v3) / HiFiGAN (v4) (trace)
+        config.json     版本, 设备, 精度, 权重路径和指纹, 运行时据此判断导出的模块能不能替换当前的模型
+    trace 出来的模块把导出时的设备写进了图里, 只能在同类设备上运行
+    """
+    os.makedirs(output_path, exist_ok=True)
+    dtype = torch.float16 if is_half else torch.float32
+    stages = []
+
+    raw_t2s = get_raw_t2s_model(load_t2s_weights(gpt_path, map_location="cpu"))
+    if is_half:
+        raw_t2s = raw_t2s.half()
+    t2s_m = T2SModel(raw_t2s.to(device))
+    t2s_m.eval()
+    torch.jit.script(t2s_m).save(os.path.join(output_path, "t2s_model.pt"))
+    stages.append("t2s")
+    print("#### exported t2s ####")
+
+    if version in ["v3", "v4"]:
+        from export_torch_script_v3v4 import export_runtime_v3v4
+
+        stages += export_runtime_v3v4(vits_path, version, output_path, device, is_half)
+    else:
+        vits = VitsModel(vits_path, version, is_half=is_half, device=device)
+        vits.eval()
+        # 导出时用随机输入, 长度在运行时可变
+        example_inputs = {
+            "text_seq": torch.randint(1, 300, (1, 60), device=device),
+            "pred_semantic": torch.randint(0, 1024, (1, 1, 150), device=device),
+            "ref_audio": (torch.rand(1, vits.hps.data.sampling_rate * 3, device=device) * 0.2 - 0.1).to(dtype),
+        }
+        if "Pro" in version:
+            example_inputs["sv_emb"] = torch.randn(1, 20480, device=device, dtype=dtype)
+        with torch.no_grad():
+            vits_export = torch.jit.trace(vits, example_kwarg_inputs=example_inputs)
+        vits_export.save(os.path.join(output_path, "vits_model.pt"))
+        stages.append("vits")
+        print("#### exported vits ####")
+
+    with open(os.path.join(output_path, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": version,
+                "device": torch.device(device).type,
+                "is_half": is_half,
+                "t2s_weights_path": gpt_path,
+                "vits_weights_path": vits_path,
+                # 同名文件重新训练/转换后指纹会变, 不能只比路径
+                "t2s_weights_id": model_id(gpt_path),
+                "vits_weights_id": model_id(vits_path),
+                "stages": stages,
+            },
+            f,
+            ensure_ascii=False,
+            indent=4,
+        )
+
+
 @torch.jit.script
 def parse_audio(ref_audio):
     ref_audio_16k = torchaudio.functional.resample(ref_audio, 48000, 16000).float()  # .to(ref_audio.device)
@@ -1022,7 +1101,6 @@ def test():
 
 
 import text
-import json
 
 
 def export_symbel(version="v2"):
@@ -1040,15 +1118,32 @@ def main():
     parser = argparse.ArgumentParser(description="GPT-SoVITS Command Line Tool")
     parser.add_argument("--gpt_model", required=True, help="Path to the GPT model file")
     parser.add_argument("--sovits_model", required=True, help="Path to the SoVITS model file")
-    parser.add_argument("--ref_audio", required=True, help="Path to the reference audio file")
-    parser.add_argument("--ref_text", required=True, help="Path to the reference text file")
+    parser.add_argument("--ref_audio", help="Path to the reference audio file")
+    parser.add_argument("--ref_text", help="Path to the reference text file")
     parser.add_argument("--output_path", required=True, help="Path to the output directory")
     parser.add_argument("--export_common_model", action="store_true", help="Export Bert and SSL model")
-    parser.add_argument("--device", help="Device to use")
-    parser.add_argument("--version", help="version of the model", default="v2")
+    parser.add_argument("--device", help="Device to use", default="cpu")
+    parser.add_argument(
+        "--version",
+        help="version of the model",
+        default="v2",
+        choices=["v1", "v2", "v2Pro", "v2ProPlus", "v3", "v4"],
+    )
     parser.add_argument("--no-half", action="store_true", help="Do not use half precision for model weights")
 
     args = parser.parse_args()
+    # 运行时 (backend: torchscript) 用的模块, 所有版本都导出; CPU 上不用半精度
+    export_runtime(
+        gpt_path=args.gpt_model,
+        vits_path=args.sovits_model,
+        version=args.version,
+        output_path=args.output_path,
+        device=args.device,
+        is_half=not args.no_half and args.device != "cpu",
+    )
+    # 给出参考音频时再导出端到端的 gpt_sovits_model.pt (v1/v2/v2Pro)
+    if args.ref_audio is None or args.ref_text is None or args.version in ["v3", "v4"]:
+        return
     if args.version in ["v2Pro", "v2ProPlus"]:
         is_half = not args.no_half
         print(f"Using half precision: {is_half}")
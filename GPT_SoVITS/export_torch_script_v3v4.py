@@ -1,5 +1,6 @@
 import os
 from export_torch_script import (
+    DictToAttrRecursive,
     T2SModel,
     get_raw_t2s_model,
     resamplex,
@@ -550,46 +551,20 @@ class Sovits:
         self.cfm = cfm
 
 
-class DictToAttrRecursive(dict):
-    def __init__(self, input_dict):
-        super().__init__(input_dict)
-        for key, value in input_dict.items():
-            if isinstance(value, dict):
-                value = DictToAttrRecursive(value)
-            self[key] = value
-            setattr(self, key, value)
-
-    def __getattr__(self, item):
-        try:
-            return self[item]
-        except KeyError:
-            raise AttributeError(f"Attribute {item} not found")
-
-    def __setattr__(self, key, value):
-        if isinstance(value, dict):
-            value = DictToAttrRecursive(value)
-        super(DictToAttrRecursive, self).__setitem__(key, value)
-        super().__setattr__(key, value)
-
-    def __delattr__(self, item):
-        try:
-            del self[item]
-        except KeyError:
-            raise AttributeError(f"Attribute {item} not found")
-
-
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import get_sovits_version_from_path_fast, load_lora_merged, load_sovits_new
 
 v3v4set = {"v3", "v4"}
 
 
 def get_sovits_weights(sovits_path):
-    path_sovits_v3 = "GPT_SoVITS/pretrained_models/s2Gv3.pth"
-    is_exist_s2gv3 = os.path.exists(path_sovits_v3)
-
     version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(sovits_path)
-    if if_lora_v3 == True and is_exist_s2gv3 == False:
-        logger.info("SoVITS V3 底模缺失，无法加载相应 LoRA 权重")
+    path_sovits_base = (
+        "GPT_SoVITS/pretrained_models/s2Gv3.pth"
+        if model_version == "v3"
+        else "GPT_SoVITS/pretrained_models/gsv-v4-pretrained/s2Gv4.pth"
+    )
+    if if_lora_v3 == True and os.path.exists(path_sovits_base) == False:
+        logger.info("SoVITS %s 底模缺失，无法加载相应 LoRA 权重" % model_version)
 
     dict_s2 = load_sovits_new(sovits_path)
     hps = dict_s2["config"]
@@ -617,11 +592,16 @@ def get_sovits_weights(sovits_path):
     model_version = hps.model.version
     logger.info(f"模型版本: {model_version}")
 
+    if if_lora_v3 == True:
+        # 与 TTS.init_vits_weights 一样先加载底模, 再合并 LoRA
+        vq_model.load_state_dict(load_sovits_new(path_sovits_base)["weight"], strict=False)
+        load_lora_merged(vq_model, path_sovits_base, sovits_path, dict_s2)
+    else:
+        vq_model.load_state_dict(dict_s2["weight"], strict=False)
     if is_half == True:
         vq_model = vq_model.half().to(device)
     else:
         vq_model = vq_model.to(device)
-    vq_model.load_state_dict(dict_s2["weight"], strict=False)
     vq_model.eval()
 
     cfm = vq_model.cfm
@@ -705,6 +685,45 @@ def export_cfm(
     return export_cfm
 
 
+def export_runtime_v3v4(sovits_path, version, output_path, export_device="cpu", export_is_half=False):
+    """export_torch_script.export_runtime 的 v3/v4 部分: 导出 CFM 的 DiT 和声码器, 返回导出的阶段"""
+    global device, is_half
+    device, is_half = export_device, export_is_half
+    dtype = torch.float16 if is_half else torch.float32
+    sovits = get_sovits_weights(sovits_path)
+    estimator = sovits.cfm.estimator
+
+    # 长度取 T_chunk (与 TTS.vocoder_configs 一致); batch 为 2, 运行时并行合成会把多个分块一起送进 DiT
+    T = 934 if version == "v3" else 1000
+    x = torch.randn(2, sovits.cfm.in_channels, T, device=device, dtype=dtype)
+    prompt_x = torch.zeros_like(x)
+    x_lens = torch.LongTensor([T, T]).to(device)
+    t = torch.zeros(2, device=device, dtype=dtype)
+    d = torch.ones(2, device=device, dtype=dtype) / 32
+    mu = torch.randn(2, 512, T, device=device, dtype=dtype)
+    with torch.no_grad():
+        dit = torch.jit.trace(estimator, example_inputs=(x, prompt_x, x_lens, t, d, mu))
+        inputs = (x[:1, :, :500], prompt_x[:1, :, :500], x_lens[:1] * 0 + 500, t[:1], d[:1], mu[:1, :, :500])
+        print("dit max abs diff (batch 1, T 500):", (dit(*inputs) - estimator(*inputs)).abs().max().item())
+    dit.save(os.path.join(output_path, "dit.pt"))
+    print("#### exported dit ####")
+
+    if version == "v3":
+        init_bigvgan()
+        vocoder = bigvgan_model
+    else:
+        init_hifigan()
+        vocoder = hifigan_model
+    mel = torch.randn(1, 100, T, device=device, dtype=dtype)
+    with torch.no_grad():
+        vocoder_export = torch.jit.trace(vocoder, example_inputs=(mel,))
+        mel = mel[:, :, :500]
+        print("vocoder max abs diff (T 500):", (vocoder_export(mel) - vocoder(mel)).abs().max().item())
+    vocoder_export.save(os.path.join(output_path, "vocoder.pt"))
+    print("#### exported vocoder ####")
+    return ["dit", "vocoder"]
+
+
 def export_1(ref_wav_path, ref_wav_text, version="v3"):
     if version == "v3":
         sovits = get_sovits_weights("GPT_SoVITS/pretrained_models/s2Gv3.pth")
@@ -1252,7 +1271,8 @@ def test_export_gpt_sovits_v3():
     )
 
 
-with torch.no_grad():
-    # export_1("onnx/ad/ref.wav","你这老坏蛋，我找了你这么久，真没想到在这里找到你。他说。","v4")
-    export_2("v4")
-    # test_export_gpt_sovits_v3()
+if __name__ == "__main__":
+    with torch.no_grad():
+        # export_1("onnx/ad/ref.wav","你这老坏蛋，我找了你这么久，真没想到在这里找到你。他说。","v4")
+        export_2("v4")
+        # test_export_gpt_sovits_v3()
@@ -96,6 +96,47 @@ def get_content(hmodel, wav_16k_tensor):
     return feats.transpose(1, 2)
 
 
+def get_content_batch(hmodel, wav_16k_tensor, wav_lengths):
+    """
+    wav_16k_tensor: (B, T) 右侧补零, wav_lengths: (B,)
+    与逐条调用 hmodel.model(wav[None]) 的有效帧结果一致:
+    第一层 GroupNorm 只在有效帧上统计; 其余卷积无 padding, 有效帧不受补零影响;
+    transformer 部分用 attention_mask 屏蔽补零帧.
+    returns: feats (B, 768, T'), feat_lengths (B,)
+    """
+    model = hmodel.model
+    with torch.no_grad():
+        conv_layers = list(model.feature_extractor.conv_layers)
+        x = wav_16k_tensor[:, None]
+        layer0 = conv_layers[0]
+        if isinstance(getattr(layer0, "layer_norm", None), nn.GroupNorm):
+            norm = layer0.layer_norm
+            x = layer0.conv(x)
+            lengths0 = (wav_lengths - layer0.conv.kernel_size[0]) // layer0.conv.stride[0] + 1
+            mask = torch.arange(x.shape[-1], device=x.device)[None] < lengths0[:, None].to(x.device)
+            mask = mask.unsqueeze(1).float()
+            n = lengths0.to(x.device).float()[:, None, None]
+            # fp16 下长音频的求和会溢出, 统计量用 fp32 算
+            xf = x.float()
+            mean = (xf * mask).sum(-1, keepdim=True) / n
+            var = (((xf - mean) * mask) ** 2).sum(-1, keepdim=True) / n
+            weight = norm.weight.float()[None, :, None]
+            bias = norm.bias.float()[None, :, None]
+            xf = (xf - mean) / torch.sqrt(var + norm.eps) * weight + bias
+            x = layer0.activation(xf.to(x.dtype))
+            conv_layers = conv_layers[1:]
+        for conv_layer in conv_layers:
+            x = conv_layer(x)
+        extract_features = x.transpose(1, 2)
+        feat_lengths = model._get_feat_extract_output_lengths(wav_lengths).to(x.device)
+        attention_mask = torch.arange(extract_features.shape[1], device=x.device)[None] < feat_lengths[:, None]
+        hidden_states = model.feature_projection(extract_features)
+        if isinstance(hidden_states, tuple):
+            hidden_states = hidden_states[0]
+        feats = model.encoder(hidden_states, attention_mask=attention_mask)[0]
+    return feats.transpose(1, 2), feat_lengths
+
+
 if __name__ == "__main__":
     model = get_model()
     src_path = "/Users/Shared/原音频2.wav"
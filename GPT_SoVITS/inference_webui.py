@@ -119,7 +119,6 @@ def set_seed(seed):
 from time import time as ttime
 
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
-from peft import LoraConfig, get_peft_model
 from text import cleaned_text_to_sequence
 from text.cleaner import clean_text
 
@@ -221,7 +220,7 @@ else:
 
 ###todo:put them to process_ckpt and modify my_save func (save sovits weights), gpt save weights use my_save in process_ckpt
 # symbol_version-model_version-if_lora_v3
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import get_sovits_version_from_path_fast, load_lora_merged, load_sovits_new, load_t2s_weights
 
 v3v4set = {"v3", "v4"}
 
@@ -327,17 +326,8 @@ def change_sovits_weights(sovits_path, prompt_language=None, text_language=None)
             "loading sovits_%spretrained_G" % model_version,
             vq_model.load_state_dict(load_sovits_new(path_sovits)["weight"], strict=False),
         )
-        lora_rank = dict_s2["lora_rank"]
-        lora_config = LoraConfig(
-            target_modules=["to_k", "to_q", "to_v", "to_out.0"],
-            r=lora_rank,
-            lora_alpha=lora_rank,
-            init_lora_weights=True,
-        )
-        vq_model.cfm = get_peft_model(vq_model.cfm, lora_config)
-        print("loading sovits_%s_lora%s" % (model_version, lora_rank))
-        vq_model.load_state_dict(dict_s2["weight"], strict=False)
-        vq_model.cfm = vq_model.cfm.merge_and_unload()
+        print("loading sovits_%s_lora%s" % (model_version, dict_s2["lora_rank"]))
+        load_lora_merged(vq_model, path_sovits, sovits_path, dict_s2)
         # torch.save(vq_model.state_dict(),"merge_win.pth")
         vq_model.eval()
 
@@ -378,7 +368,7 @@ def change_gpt_weights(gpt_path):
         gpt_path = name2gpt_path[gpt_path]
     global hz, max_sec, t2s_model, config
     hz = 50
-    dict_s1 = torch.load(gpt_path, map_location="cpu", weights_only=False)
+    dict_s1 = load_t2s_weights(gpt_path)
     config = dict_s1["config"]
     max_sec = config["data"]["max_sec"]
     t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
@@ -0,0 +1,121 @@
+"""
+Background checkpoint writer for the training loops.
+
+utils.save_checkpoint and process_ckpt.savee used to serialise on rank 0 while every
+other rank waited at the next collective. CheckpointWriter.save only takes a snapshot:
+CUDA tensors are copied into pinned CPU buffers with non_blocking copies (ordered on the
+current stream before any later optimizer step), CPU tensors are cloned. A thread then
+waits for the copies, runs torch.save into a temporary file next to the target, fsyncs
+it and renames it into place, so a crash never leaves a truncated checkpoint.
+
+Pinned buffers are kept per slot (e.g. "SynthesizerTrn" for the G checkpoint) and
+reused by the next save of the same slot, which first waits for the previous write of
+that slot. Writer threads are not daemons, so the process only exits once every queued
+checkpoint is on disk. Set async_ckpt=False in the environment to save synchronously.
+"""
+
+import copy
+import os
+import threading
+import traceback
+
+import torch
+
+use_async = eval(os.environ.get("async_ckpt", "True"))
+
+
+def write_checkpoint(obj, path, header=None, fsync=True):
+    """torch.save 到同目录临时文件再原子替换; header 直接覆盖 zip 开头的 b"PK", 不在内存里复制整个文件"""
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    try:
+        # 传文件对象, 不让 torch.save 自己打开路径(中文路径问题)
+        with open(tmp_path, "wb") as f:
+            torch.save(obj, f)
+            if header is not None:
+                f.seek(0)
+                f.write(header)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class CheckpointWriter:
+    def __init__(self):
+        self.lock = threading.Lock()  # 写盘串行, 不让几个大文件抢 IO
+        self.pools = {}
+        self.jobs = {}
+
+    def _snapshot(self, obj, pool, key, devices):
+        if isinstance(obj, torch.Tensor):
+            if obj.is_cuda:
+                devices.add(obj.device)
+            buf = pool.get(key)
+            if buf is None or buf.shape != obj.shape or buf.dtype != obj.dtype:
+                buf = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=obj.is_cuda)
+                pool[key] = buf
+            buf.copy_(obj.detach(), non_blocking=obj.is_cuda)
+            return buf
+        if isinstance(obj, dict):
+            items = [(k, self._snapshot(v, pool, "%s/%s" % (key, k), devices)) for k, v in obj.items()]
+            snapshot = type(obj)(items) if type(obj) is not dict else dict(items)
+            # state_dict 的 _metadata 记录各模块版本, load_state_dict 靠它做兼容迁移
+            metadata = getattr(obj, "_metadata", None)
+            if metadata is not None:
+                snapshot._metadata = copy.deepcopy(metadata)
+            return snapshot
+        if isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+            return type(obj)(self._snapshot(v, pool, "%s/%d" % (key, i), devices) for i, v in enumerate(obj))
+        return obj
+
+    def save(self, obj, path, header=None, slot=None):
+        slot = path if slot is None else slot
+        previous = self.jobs.get(slot)
+        if previous is not None:
+            # 上一次同一 slot 的写盘还在读这些 buffer
+            previous.join()
+        devices = set()
+        snapshot = self._snapshot(obj, self.pools.setdefault(slot, {}), "", devices)
+        events = []
+        for device in devices:
+            event = torch.cuda.Event()
+            event.record(torch.cuda.current_stream(device))
+            events.append(event)
+        thread = threading.Thread(target=self._write, args=(snapshot, path, header, events), name="ckpt-%s" % slot)
+        thread.start()
+        self.jobs[slot] = thread
+
+    def _write(self, snapshot, path, header, events):
+        for event in events:
+            event.synchronize()
+        with self.lock:
+            try:
+                write_checkpoint(snapshot, path, header)
+            except:
+                print("failed to save %s\n%s" % (path, traceback.format_exc()))
+
+    def wait(self):
+        for thread in list(self.jobs.values()):
+            thread.join()
+
+
+_writer = None
+
+
+def save_async(obj, path, header=None, slot=None):
+    """use_async 为 False 时同步写"""
+    global _writer
+    if not use_async:
+        write_checkpoint(obj, path, header)
+        return
+    if _writer is None:
+        _writer = CheckpointWriter()
+    _writer.save(obj, path, header=header, slot=slot)
+
+
+def wait():
+    if _writer is not None:
+        _writer.wait()
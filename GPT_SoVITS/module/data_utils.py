@@ -5,7 +5,9 @@ import torch
 import torch.utils.data
 from tqdm import tqdm
 
+from module.feature_store import has_store, open_features
 from module.mel_processing import spectrogram_torch, spec_to_mel_torch
+from module.spec_cache import get_spec_cache, read_audio
 from text import cleaned_text_to_sequence
 import torch.nn.functional as F
 from tools.my_utils import load_audio
@@ -13,6 +15,13 @@ from tools.my_utils import load_audio
 version = os.environ.get("version", None)
 
 
+def cached(spec_cache, kind, params, key, compute):
+    # 没开 spec_cache 时直接算
+    if spec_cache is None:
+        return compute()
+    return spec_cache.get(kind, params, key, compute)
+
+
 # ZeroDivisionError fixed by Tybost (https://github.com/RVC-Boss/GPT-SoVITS/issues/79)
 class TextAudioSpeakerLoader(torch.utils.data.Dataset):
     """
@@ -27,16 +36,18 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        assert os.path.exists(self.path4) or has_store(self.path4)
         assert os.path.exists(self.path5)
         self.is_v2Pro = version in {"v2Pro", "v2ProPlus"}
         if self.is_v2Pro:
             self.path7 = "%s/7-sv_cn" % exp_dir
-            assert os.path.exists(self.path7)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+            assert os.path.exists(self.path7) or has_store(self.path7)
+        self.ssl_features = open_features(self.path4)
+        names4 = self.ssl_features.names()
         names5 = set(os.listdir(self.path5))
         if self.is_v2Pro:
-            names6 = set([name[:-3] for name in list(os.listdir(self.path7))])  # 去除.pt后缀
+            self.sv_features = open_features(self.path7)
+            names6 = self.sv_features.names()
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
             lines = f.read().strip("\n").split("\n")
@@ -64,6 +75,7 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         self.win_length = hparams.win_length
         self.sampling_rate = hparams.sampling_rate
         self.val = val
+        self.spec_cache = get_spec_cache(hparams)
 
         random.seed(1234)
         random.shuffle(self.audiopaths_sid_text)
@@ -112,13 +124,13 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         try:
             spec, wav = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = self.ssl_features.load(audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
                 ssl.requires_grad = False
                 if self.is_v2Pro:
-                    sv_emb = torch.load("%s/%s.pt" % (self.path7, audiopath), map_location="cpu")
+                    sv_emb = self.sv_features.load(audiopath)
         except:
             traceback.print_exc()
             spec = torch.zeros(1025, 100)
@@ -134,14 +146,19 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
             return (ssl, spec, wav, text)
 
     def get_audio(self, filename):
-        audio_array = load_audio(filename, self.sampling_rate)  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768
+        # 已经归一化到-1~1之间的，不用再/32768; 没开 spec_cache 时不算哈希
+        audio_array, key = read_audio(filename, self.sampling_rate, self.spec_cache is not None)
         audio = torch.FloatTensor(audio_array)  # /32768
         audio_norm = audio
         audio_norm = audio_norm.unsqueeze(0)
-        spec = spectrogram_torch(
-            audio_norm, self.filter_length, self.sampling_rate, self.hop_length, self.win_length, center=False
+        params = [self.filter_length, self.sampling_rate, self.hop_length, self.win_length]
+        spec = cached(
+            self.spec_cache,
+            "spec",
+            params,
+            key,
+            lambda: torch.squeeze(spectrogram_torch(audio_norm, *params, center=False), 0),
         )
-        spec = torch.squeeze(spec, 0)
         return spec, audio_norm
 
     def get_sid(self, sid):
@@ -189,12 +206,29 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         return reference_mel, ssl, wav2, mel
 
 
+def pad_batch(tensors, max_len, dtype=torch.float32):
+    """(..., T_i) 的一组张量右侧补零成 (B, ..., max_len), 返回 (padded, lengths)"""
+    lengths = torch.LongTensor([t.size(-1) for t in tensors])
+    assert int(lengths.max()) <= max_len, (int(lengths.max()), max_len)
+    padded = torch.zeros((len(tensors),) + tuple(tensors[0].shape[:-1]) + (max_len,), dtype=dtype)
+    # 预分配一次, 每条只做一次 copy_ (顺带完成 fp16->fp32 / float->long 转换)
+    for row, t in zip(padded, tensors):
+        row.narrow(-1, 0, t.size(-1)).copy_(t)
+    return padded, lengths
+
+
+def packed_offsets(**lengths):
+    """每路序列的 cu_seqlens (B+1,), 供按 packed 布局(去掉 padding 首尾相接)处理的模块使用"""
+    return {name: F.pad(torch.cumsum(length, 0), (1, 0)) for name, length in lengths.items()}
+
+
 class TextAudioSpeakerCollate:
     """Zero-pads model inputs and targets"""
 
-    def __init__(self, return_ids=False, version=None):
+    def __init__(self, return_ids=False, version=None, return_packed=False):
         self.return_ids = return_ids
         self.is_v2Pro = version in {"v2Pro", "v2ProPlus"}
+        self.return_packed = return_packed
 
     def __call__(self, batch):
         """Collate's training batch from normalized text, audio and speaker identities
@@ -202,9 +236,7 @@ class TextAudioSpeakerCollate:
         ------
         batch: [text_normalized, spec_normalized, wav_normalized, sid]
         """
-        # Right zero-pad all one-hot text sequences to max input length
-        _, ids_sorted_decreasing = torch.sort(torch.LongTensor([x[1].size(1) for x in batch]), dim=0, descending=True)
-
+        # DistributedBucketSampler 已经按长度分好桶, 不再逐 batch 排序, 保持采样顺序
         max_ssl_len = max([x[0].size(2) for x in batch])
         max_ssl_len = int(2 * ((max_ssl_len // 2) + 1))
         max_spec_len = max([x[1].size(1) for x in batch])
@@ -212,47 +244,14 @@ class TextAudioSpeakerCollate:
         max_wav_len = max([x[2].size(1) for x in batch])
         max_text_len = max([x[3].size(0) for x in batch])
 
-        ssl_lengths = torch.LongTensor(len(batch))
-        spec_lengths = torch.LongTensor(len(batch))
-        wav_lengths = torch.LongTensor(len(batch))
-        text_lengths = torch.LongTensor(len(batch))
-
-        spec_padded = torch.FloatTensor(len(batch), batch[0][1].size(0), max_spec_len)
-        wav_padded = torch.FloatTensor(len(batch), 1, max_wav_len)
-        ssl_padded = torch.FloatTensor(len(batch), batch[0][0].size(1), max_ssl_len)
-        text_padded = torch.LongTensor(len(batch), max_text_len)
-
-        spec_padded.zero_()
-        wav_padded.zero_()
-        ssl_padded.zero_()
-        text_padded.zero_()
-
-        if self.is_v2Pro:
-            sv_embs = torch.FloatTensor(len(batch), 20480)
-
-        for i in range(len(ids_sorted_decreasing)):
-            row = batch[ids_sorted_decreasing[i]]
-
-            ssl = row[0]
-            ssl_padded[i, :, : ssl.size(2)] = ssl[0, :, :]
-            ssl_lengths[i] = ssl.size(2)
+        ssl_padded, ssl_lengths = pad_batch([x[0][0] for x in batch], max_ssl_len)
+        spec_padded, spec_lengths = pad_batch([x[1] for x in batch], max_spec_len)
+        wav_padded, wav_lengths = pad_batch([x[2] for x in batch], max_wav_len)
+        text_padded, text_lengths = pad_batch([x[3] for x in batch], max_text_len, torch.long)
 
-            spec = row[1]
-            spec_padded[i, :, : spec.size(1)] = spec
-            spec_lengths[i] = spec.size(1)
-
-            wav = row[2]
-            wav_padded[i, :, : wav.size(1)] = wav
-            wav_lengths[i] = wav.size(1)
-
-            text = row[3]
-            text_padded[i, : text.size(0)] = text
-            text_lengths[i] = text.size(0)
-
-            if self.is_v2Pro:
-                sv_embs[i] = row[4]
         if self.is_v2Pro:
-            return (
+            sv_embs = torch.cat([x[4] for x in batch], 0).float()
+            outputs = (
                 ssl_padded,
                 ssl_lengths,
                 spec_padded,
@@ -264,7 +263,7 @@ class TextAudioSpeakerCollate:
                 sv_embs,
             )
         else:
-            return (
+            outputs = (
                 ssl_padded,
                 ssl_lengths,
                 spec_padded,
@@ -274,6 +273,9 @@ class TextAudioSpeakerCollate:
                 text_padded,
                 text_lengths,
             )
+        if self.return_packed:
+            outputs += (packed_offsets(ssl=ssl_lengths, spec=spec_lengths, wav=wav_lengths, text=text_lengths),)
+        return outputs
 
 
 class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
@@ -289,9 +291,10 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        assert os.path.exists(self.path4) or has_store(self.path4)
         assert os.path.exists(self.path5)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        self.ssl_features = open_features(self.path4)
+        names4 = self.ssl_features.names()
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -318,6 +321,7 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         self.win_length = hparams.win_length
         self.sampling_rate = hparams.sampling_rate
         self.val = val
+        self.spec_cache = get_spec_cache(hparams)
 
         random.seed(1234)
         random.shuffle(self.audiopaths_sid_text)
@@ -378,7 +382,7 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         try:
             spec, mel = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = self.ssl_features.load(audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -394,34 +398,54 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         return (ssl, spec, mel, text)
 
     def get_audio(self, filename):
-        audio_array = load_audio(filename, self.sampling_rate)  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768
+        # 已经归一化到-1~1之间的，不用再/32768; 没开 spec_cache 时不算哈希
+        audio_array, key = read_audio(filename, self.sampling_rate, self.spec_cache is not None)
         audio = torch.FloatTensor(audio_array)  # /32768
         audio_norm = audio
         audio_norm = audio_norm.unsqueeze(0)
-        audio_array24 = load_audio(
-            filename, 24000
-        )  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768######这里可以用GPU重采样加速
-        audio24 = torch.FloatTensor(audio_array24)  # /32768
-        audio_norm24 = audio24
-        audio_norm24 = audio_norm24.unsqueeze(0)
-
-        spec = spectrogram_torch(
-            audio_norm, self.filter_length, self.sampling_rate, self.hop_length, self.win_length, center=False
+        params = [self.filter_length, self.sampling_rate, self.hop_length, self.win_length]
+        spec = cached(
+            self.spec_cache,
+            "spec",
+            params,
+            key,
+            lambda: torch.squeeze(spectrogram_torch(audio_norm, *params, center=False), 0),
         )
-        spec = torch.squeeze(spec, 0)
 
-        spec1 = spectrogram_torch(
-            audio_norm24,
+        def get_mel():
+            audio_array24 = load_audio(
+                filename, 24000
+            )  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768######这里可以用GPU重采样加速
+            audio_norm24 = torch.FloatTensor(audio_array24).unsqueeze(0)  # /32768
+            spec1 = spectrogram_torch(
+                audio_norm24,
+                self.filter_length_mel,
+                self.sampling_rate_mel,
+                self.hop_length_mel,
+                self.win_length_mel,
+                center=False,
+            )
+            mel = spec_to_mel_torch(
+                spec1,
+                self.filter_length_mel,
+                self.n_mel_channels,
+                self.sampling_rate_mel,
+                self.mel_fmin,
+                self.mel_fmax,
+            )
+            return torch.squeeze(mel, 0)
+
+        mel_params = [
             self.filter_length_mel,
+            self.n_mel_channels,
             self.sampling_rate_mel,
             self.hop_length_mel,
             self.win_length_mel,
-            center=False,
-        )
-        mel = spec_to_mel_torch(
-            spec1, self.filter_length_mel, self.n_mel_channels, self.sampling_rate_mel, self.mel_fmin, self.mel_fmax
-        )
-        mel = torch.squeeze(mel, 0)
+            self.mel_fmin,
+            self.mel_fmax,
+        ]
+        # 24k 的 mel 只有缓存未命中时才需要 ffmpeg 重采样
+        mel = cached(self.spec_cache, "mel", mel_params, key, get_mel)
         mel = self.norm_spec(mel)
         # print(1111111,spec.shape,mel.shape)
         return spec, mel
@@ -441,8 +465,9 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
 class TextAudioSpeakerCollateV3:
     """Zero-pads model inputs and targets"""
 
-    def __init__(self, return_ids=False):
+    def __init__(self, return_ids=False, return_packed=False):
         self.return_ids = return_ids
+        self.return_packed = return_packed
 
     def __call__(self, batch):
         """Collate's training batch from normalized text, audio and speaker identities
@@ -450,9 +475,6 @@ class TextAudioSpeakerCollateV3:
         ------
         batch: [text_normalized, spec_normalized, wav_normalized, sid]
         """
-        # ssl, spec, wav,mel, text
-        # Right zero-pad all one-hot text sequences to max input length
-        _, ids_sorted_decreasing = torch.sort(torch.LongTensor([x[1].size(1) for x in batch]), dim=0, descending=True)
         # (ssl, spec,mel, text)
         max_ssl_len = max([x[0].size(2) for x in batch])
 
@@ -464,54 +486,29 @@ class TextAudioSpeakerCollateV3:
 
         max_spec_len = max([x[1].size(1) for x in batch])
         max_spec_len = int(2 * ((max_spec_len // 2) + 1))
-        # max_wav_len = max([x[2].size(1) for x in batch])
 
         max_text_len = max([x[3].size(0) for x in batch])
         max_mel_len = int(max_ssl_len1 * 1.25 * 1.5)  ###24000/256,32000/640=16000/320
 
-        ssl_lengths = torch.LongTensor(len(batch))
-        spec_lengths = torch.LongTensor(len(batch))
-        text_lengths = torch.LongTensor(len(batch))
-        # wav_lengths = torch.LongTensor(len(batch))
-        mel_lengths = torch.LongTensor(len(batch))
-
-        spec_padded = torch.FloatTensor(len(batch), batch[0][1].size(0), max_spec_len)
-        mel_padded = torch.FloatTensor(len(batch), batch[0][2].size(0), max_mel_len)
-        ssl_padded = torch.FloatTensor(len(batch), batch[0][0].size(1), max_ssl_len)
-        text_padded = torch.LongTensor(len(batch), max_text_len)
-        # wav_padded = torch.FloatTensor(len(batch), 1, max_wav_len)
-
-        spec_padded.zero_()
-        mel_padded.zero_()
-        ssl_padded.zero_()
-        text_padded.zero_()
-        # wav_padded.zero_()
-
-        for i in range(len(ids_sorted_decreasing)):
-            row = batch[ids_sorted_decreasing[i]]
-            # ssl, spec, wav,mel, text
-            ssl = row[0]
-            ssl_padded[i, :, : ssl.size(2)] = ssl[0, :, :]
-            ssl_lengths[i] = ssl.size(2)
-
-            spec = row[1]
-            spec_padded[i, :, : spec.size(1)] = spec
-            spec_lengths[i] = spec.size(1)
-
-            # wav = row[2]
-            # wav_padded[i, :, :wav.size(1)] = wav
-            # wav_lengths[i] = wav.size(1)
-
-            mel = row[2]
-            mel_padded[i, :, : mel.size(1)] = mel
-            mel_lengths[i] = mel.size(1)
-
-            text = row[3]
-            text_padded[i, : text.size(0)] = text
-            text_lengths[i] = text.size(0)
+        ssl_padded, ssl_lengths = pad_batch([x[0][0] for x in batch], max_ssl_len)
+        spec_padded, spec_lengths = pad_batch([x[1] for x in batch], max_spec_len)
+        mel_padded, mel_lengths = pad_batch([x[2] for x in batch], max_mel_len)
+        text_padded, text_lengths = pad_batch([x[3] for x in batch], max_text_len, torch.long)
 
         # return ssl_padded, spec_padded,mel_padded, ssl_lengths, spec_lengths, text_padded, text_lengths, wav_padded, wav_lengths,mel_lengths
-        return ssl_padded, spec_padded, mel_padded, ssl_lengths, spec_lengths, text_padded, text_lengths, mel_lengths
+        outputs = (
+            ssl_padded,
+            spec_padded,
+            mel_padded,
+            ssl_lengths,
+            spec_lengths,
+            text_padded,
+            text_lengths,
+            mel_lengths,
+        )
+        if self.return_packed:
+            outputs += (packed_offsets(ssl=ssl_lengths, spec=spec_lengths, mel=mel_lengths, text=text_lengths),)
+        return outputs
 
 
 class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
@@ -527,9 +524,10 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        assert os.path.exists(self.path4) or has_store(self.path4)
         assert os.path.exists(self.path5)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        self.ssl_features = open_features(self.path4)
+        names4 = self.ssl_features.names()
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -556,6 +554,7 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         self.win_length = hparams.win_length
         self.sampling_rate = hparams.sampling_rate
         self.val = val
+        self.spec_cache = get_spec_cache(hparams)
 
         random.seed(1234)
         random.shuffle(self.audiopaths_sid_text)
@@ -616,7 +615,7 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         try:
             spec, mel = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = self.ssl_features.load(audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -632,17 +631,26 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         return (ssl, spec, mel, text)
 
     def get_audio(self, filename):
-        audio_array = load_audio(filename, self.sampling_rate)  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768
+        # 已经归一化到-1~1之间的，不用再/32768; 没开 spec_cache 时不算哈希
+        audio_array, key = read_audio(filename, self.sampling_rate, self.spec_cache is not None)
         audio = torch.FloatTensor(audio_array)  # /32768
         audio_norm = audio
         audio_norm = audio_norm.unsqueeze(0)
-        spec = spectrogram_torch(
-            audio_norm, self.filter_length, self.sampling_rate, self.hop_length, self.win_length, center=False
+        params = [self.filter_length, self.sampling_rate, self.hop_length, self.win_length]
+        spec = cached(
+            self.spec_cache,
+            "spec",
+            params,
+            key,
+            lambda: torch.squeeze(spectrogram_torch(audio_norm, *params, center=False), 0),
         )
-        spec = torch.squeeze(spec, 0)
-        spec1 = spectrogram_torch(audio_norm, 1280, 32000, 320, 1280, center=False)
-        mel = spec_to_mel_torch(spec1, 1280, 100, 32000, 0, None)
-        mel = self.norm_spec(torch.squeeze(mel, 0))
+
+        def get_mel():
+            spec1 = spectrogram_torch(audio_norm, 1280, 32000, 320, 1280, center=False)
+            mel = spec_to_mel_torch(spec1, 1280, 100, 32000, 0, None)
+            return torch.squeeze(mel, 0)
+
+        mel = self.norm_spec(cached(self.spec_cache, "mel", [1280, 100, 32000, 320, 1280, 0, None], key, get_mel))
         return spec, mel
 
     def get_sid(self, sid):
@@ -660,8 +668,9 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
 class TextAudioSpeakerCollateV4:
     """Zero-pads model inputs and targets"""
 
-    def __init__(self, return_ids=False):
+    def __init__(self, return_ids=False, return_packed=False):
         self.return_ids = return_ids
+        self.return_packed = return_packed
 
     def __call__(self, batch):
         """Collate's training batch from normalized text, audio and speaker identities
@@ -669,60 +678,32 @@ class TextAudioSpeakerCollateV4:
         ------
         batch: [text_normalized, spec_normalized, wav_normalized, sid]
         """
-        # ssl, spec, wav,mel, text
-        # Right zero-pad all one-hot text sequences to max input length
-        _, ids_sorted_decreasing = torch.sort(torch.LongTensor([x[1].size(1) for x in batch]), dim=0, descending=True)
         # (ssl, spec,mel, text)
         max_ssl_len = max([x[0].size(2) for x in batch])
         max_ssl_len = int(2 * ((max_ssl_len // 2) + 1))
         max_spec_len = max([x[1].size(1) for x in batch])
         max_spec_len = int(2 * ((max_spec_len // 2) + 1))
-        # max_wav_len = max([x[2].size(1) for x in batch])
         max_text_len = max([x[3].size(0) for x in batch])
 
-        ssl_lengths = torch.LongTensor(len(batch))
-        spec_lengths = torch.LongTensor(len(batch))
-        text_lengths = torch.LongTensor(len(batch))
-        # wav_lengths = torch.LongTensor(len(batch))
-        mel_lengths = torch.LongTensor(len(batch))
-
-        spec_padded = torch.FloatTensor(len(batch), batch[0][1].size(0), max_spec_len)
-        mel_padded = torch.FloatTensor(len(batch), batch[0][2].size(0), max_spec_len * 2)
-        ssl_padded = torch.FloatTensor(len(batch), batch[0][0].size(1), max_ssl_len)
-        text_padded = torch.LongTensor(len(batch), max_text_len)
-        # wav_padded = torch.FloatTensor(len(batch), 1, max_wav_len)
-
-        spec_padded.zero_()
-        mel_padded.zero_()
-        ssl_padded.zero_()
-        text_padded.zero_()
-        # wav_padded.zero_()
-
-        for i in range(len(ids_sorted_decreasing)):
-            row = batch[ids_sorted_decreasing[i]]
-            # ssl, spec, wav,mel, text
-            ssl = row[0]
-            ssl_padded[i, :, : ssl.size(2)] = ssl[0, :, :]
-            ssl_lengths[i] = ssl.size(2)
-
-            spec = row[1]
-            spec_padded[i, :, : spec.size(1)] = spec
-            spec_lengths[i] = spec.size(1)
-
-            # wav = row[2]
-            # wav_padded[i, :, :wav.size(1)] = wav
-            # wav_lengths[i] = wav.size(1)
-
-            mel = row[2]
-            mel_padded[i, :, : mel.size(1)] = mel
-            mel_lengths[i] = mel.size(1)
-
-            text = row[3]
-            text_padded[i, : text.size(0)] = text
-            text_lengths[i] = text.size(0)
+        ssl_padded, ssl_lengths = pad_batch([x[0][0] for x in batch], max_ssl_len)
+        spec_padded, spec_lengths = pad_batch([x[1] for x in batch], max_spec_len)
+        mel_padded, mel_lengths = pad_batch([x[2] for x in batch], max_spec_len * 2)
+        text_padded, text_lengths = pad_batch([x[3] for x in batch], max_text_len, torch.long)
 
         # return ssl_padded, spec_padded,mel_padded, ssl_lengths, spec_lengths, text_padded, text_lengths, wav_padded, wav_lengths,mel_lengths
-        return ssl_padded, spec_padded, mel_padded, ssl_lengths, spec_lengths, text_padded, text_lengths, mel_lengths
+        outputs = (
+            ssl_padded,
+            spec_padded,
+            mel_padded,
+            ssl_lengths,
+            spec_lengths,
+            text_padded,
+            text_lengths,
+            mel_lengths,
+        )
+        if self.return_packed:
+            outputs += (packed_offsets(ssl=ssl_lengths, spec=spec_lengths, mel=mel_lengths, text=text_lengths),)
+        return outputs
 
 
 class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
@@ -738,9 +719,10 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         self.path4 = "%s/4-cnhubert" % exp_dir
         self.path5 = "%s/5-wav32k" % exp_dir
         assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
+        assert os.path.exists(self.path4) or has_store(self.path4)
         assert os.path.exists(self.path5)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        self.ssl_features = open_features(self.path4)
+        names4 = self.ssl_features.names()
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -767,6 +749,7 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         self.win_length = hparams.win_length
         self.sampling_rate = hparams.sampling_rate
         self.val = val
+        self.spec_cache = get_spec_cache(hparams)
 
         random.seed(1234)
         random.shuffle(self.audiopaths_sid_text)
@@ -827,7 +810,7 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         try:
             spec, mel, wav = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = self.ssl_features.load(audiopath)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -843,34 +826,54 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         return (ssl, spec, wav, mel, text)
 
     def get_audio(self, filename):
-        audio_array = load_audio(filename, self.sampling_rate)  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768
+        # 已经归一化到-1~1之间的，不用再/32768; 没开 spec_cache 时不算哈希
+        audio_array, key = read_audio(filename, self.sampling_rate, self.spec_cache is not None)
         audio = torch.FloatTensor(audio_array)  # /32768
         audio_norm = audio
         audio_norm = audio_norm.unsqueeze(0)
-        audio_array24 = load_audio(
-            filename, 24000
-        )  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768######这里可以用GPU重采样加速
-        audio24 = torch.FloatTensor(audio_array24)  # /32768
-        audio_norm24 = audio24
-        audio_norm24 = audio_norm24.unsqueeze(0)
-
-        spec = spectrogram_torch(
-            audio_norm, self.filter_length, self.sampling_rate, self.hop_length, self.win_length, center=False
+        params = [self.filter_length, self.sampling_rate, self.hop_length, self.win_length]
+        spec = cached(
+            self.spec_cache,
+            "spec",
+            params,
+            key,
+            lambda: torch.squeeze(spectrogram_torch(audio_norm, *params, center=False), 0),
         )
-        spec = torch.squeeze(spec, 0)
 
-        spec1 = spectrogram_torch(
-            audio_norm24,
+        def get_mel():
+            audio_array24 = load_audio(
+                filename, 24000
+            )  # load_audio的方法是已经归一化到-1~1之间的，不用再/32768######这里可以用GPU重采样加速
+            audio_norm24 = torch.FloatTensor(audio_array24).unsqueeze(0)  # /32768
+            spec1 = spectrogram_torch(
+                audio_norm24,
+                self.filter_length_mel,
+                self.sampling_rate_mel,
+                self.hop_length_mel,
+                self.win_length_mel,
+                center=False,
+            )
+            mel = spec_to_mel_torch(
+                spec1,
+                self.filter_length_mel,
+                self.n_mel_channels,
+                self.sampling_rate_mel,
+                self.mel_fmin,
+                self.mel_fmax,
+            )
+            return torch.squeeze(mel, 0)
+
+        mel_params = [
             self.filter_length_mel,
+            self.n_mel_channels,
             self.sampling_rate_mel,
             self.hop_length_mel,
             self.win_length_mel,
-            center=False,
-        )
-        mel = spec_to_mel_torch(
-            spec1, self.filter_length_mel, self.n_mel_channels, self.sampling_rate_mel, self.mel_fmin, self.mel_fmax
-        )
-        mel = torch.squeeze(mel, 0)
+            self.mel_fmin,
+            self.mel_fmax,
+        ]
+        # 24k 的 mel 只有缓存未命中时才需要 ffmpeg 重采样
+        mel = cached(self.spec_cache, "mel", mel_params, key, get_mel)
         mel = self.norm_spec(mel)
         # print(1111111,spec.shape,mel.shape)
         return spec, mel, audio_norm
@@ -890,8 +893,9 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
 class TextAudioSpeakerCollateV3b:
     """Zero-pads model inputs and targets"""
 
-    def __init__(self, return_ids=False):
+    def __init__(self, return_ids=False, return_packed=False):
         self.return_ids = return_ids
+        self.return_packed = return_packed
 
     def __call__(self, batch):
         """Collate's training batch from normalized text, audio and speaker identities
@@ -900,9 +904,6 @@ class TextAudioSpeakerCollateV3b:
         batch: [text_normalized, spec_normalized, wav_normalized, sid]
         """
         # ssl, spec, wav,mel, text
-        # Right zero-pad all one-hot text sequences to max input length
-        _, ids_sorted_decreasing = torch.sort(torch.LongTensor([x[1].size(1) for x in batch]), dim=0, descending=True)
-        # (ssl, spec,mel, text)
         max_ssl_len = max([x[0].size(2) for x in batch])
 
         max_ssl_len1 = int(8 * ((max_ssl_len // 8) + 1))
@@ -917,48 +918,13 @@ class TextAudioSpeakerCollateV3b:
         max_text_len = max([x[4].size(0) for x in batch])
         max_mel_len = int(max_ssl_len1 * 1.25 * 1.5)  ###24000/256,32000/640=16000/320
 
-        ssl_lengths = torch.LongTensor(len(batch))
-        spec_lengths = torch.LongTensor(len(batch))
-        text_lengths = torch.LongTensor(len(batch))
-        wav_lengths = torch.LongTensor(len(batch))
-        mel_lengths = torch.LongTensor(len(batch))
-
-        spec_padded = torch.FloatTensor(len(batch), batch[0][1].size(0), max_spec_len)
-        mel_padded = torch.FloatTensor(len(batch), batch[0][3].size(0), max_mel_len)
-        ssl_padded = torch.FloatTensor(len(batch), batch[0][0].size(1), max_ssl_len)
-        text_padded = torch.LongTensor(len(batch), max_text_len)
-        wav_padded = torch.FloatTensor(len(batch), 1, max_wav_len)
-
-        spec_padded.zero_()
-        mel_padded.zero_()
-        ssl_padded.zero_()
-        text_padded.zero_()
-        wav_padded.zero_()
-
-        for i in range(len(ids_sorted_decreasing)):
-            row = batch[ids_sorted_decreasing[i]]
-            # ssl, spec, wav,mel, text
-            ssl = row[0]
-            ssl_padded[i, :, : ssl.size(2)] = ssl[0, :, :]
-            ssl_lengths[i] = ssl.size(2)
-
-            spec = row[1]
-            spec_padded[i, :, : spec.size(1)] = spec
-            spec_lengths[i] = spec.size(1)
-
-            wav = row[2]
-            wav_padded[i, :, : wav.size(1)] = wav
-            wav_lengths[i] = wav.size(1)
-
-            mel = row[3]
-            mel_padded[i, :, : mel.size(1)] = mel
-            mel_lengths[i] = mel.size(1)
-
-            text = row[4]
-            text_padded[i, : text.size(0)] = text
-            text_lengths[i] = text.size(0)
-
-        return (
+        ssl_padded, ssl_lengths = pad_batch([x[0][0] for x in batch], max_ssl_len)
+        spec_padded, spec_lengths = pad_batch([x[1] for x in batch], max_spec_len)
+        wav_padded, wav_lengths = pad_batch([x[2] for x in batch], max_wav_len)
+        mel_padded, mel_lengths = pad_batch([x[3] for x in batch], max_mel_len)
+        text_padded, text_lengths = pad_batch([x[4] for x in batch], max_text_len, torch.long)
+
+        outputs = (
             ssl_padded,
             spec_padded,
             mel_padded,
@@ -971,6 +937,11 @@ class TextAudioSpeakerCollateV3b:
             mel_lengths,
         )
         # return ssl_padded, spec_padded,mel_padded, ssl_lengths, spec_lengths, text_padded, text_lengths,mel_lengths
+        if self.return_packed:
+            outputs += (
+                packed_offsets(ssl=ssl_lengths, spec=spec_lengths, wav=wav_lengths, mel=mel_lengths, text=text_lengths),
+            )
+        return outputs
 
 
 class DistributedBucketSampler(torch.utils.data.distributed.DistributedSampler):
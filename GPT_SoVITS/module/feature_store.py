@@ -0,0 +1,269 @@
+"""
+Sharded feature store for the dataset-prep outputs (3-bert, 4-cnhubert, 7-sv_cn, ...).
+
+Instead of one torch.save file per utterance, features are appended to a few large
+shard files and located through a json-lines index:
+
+    4-cnhubert.shards/
+        index-0.jsonl       {"name": ..., "shard": "0-00000.bin", "offset": ..., "dtype": ..., "shape": [...]}
+        0-00000.bin         raw little-endian arrays, 64-byte aligned by default
+        ...
+
+Each prepare process writes its own index/shards (tagged by i_part), so no locking is
+needed; readers merge every index-*.jsonl in the directory. Every record carries a write
+time ("seq"), and when a name appears more than once the most recent record wins no
+matter which index file it is in, which keeps reruns append-only. remove() appends a
+{"name": ..., "deleted": true} record that hides older features of that name. add() can
+attach extra fields to the record (e.g. "model": the id of the model that produced the
+feature), and is_current() checks them before a rerun skips an item.
+
+Readers map the shards with np.memmap, so loading an item is a slice instead of an
+open + unpickle. open_features() falls back to the per-utterance .pt directory when
+no store exists, so loaders can use one code path for both layouts.
+
+convert an existing experiment (from the repository root):
+    python GPT_SoVITS/module/feature_store.py logs/my_exp
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+STORE_SUFFIX = ".shards"
+SHARD_SIZE = 1 << 30
+ALIGN = 64
+
+torch2numpy_dtype = {
+    torch.float32: "float32",
+    torch.float16: "float16",
+    torch.float64: "float64",
+    torch.int64: "int64",
+    torch.int32: "int32",
+    torch.int16: "int16",
+    torch.uint8: "uint8",
+    torch.bool: "bool",
+}
+
+
+def store_path(feature_dir):
+    return "%s%s" % (feature_dir.rstrip("/\\"), STORE_SUFFIX)
+
+
+def has_store(feature_dir):
+    return len(glob.glob(os.path.join(store_path(feature_dir), "index-*.jsonl"))) > 0
+
+
+def _to_numpy(fea):
+    if isinstance(fea, np.ndarray):
+        return np.ascontiguousarray(fea), fea.dtype.name
+    fea = fea.detach().cpu().contiguous()
+    if fea.dtype == torch.bfloat16:
+        # numpy 没有 bf16, 按 int16 原样存字节
+        return fea.view(torch.int16).numpy(), "bfloat16"
+    return fea.numpy(), torch2numpy_dtype[fea.dtype]
+
+
+def read_index(root):
+    entries = {}
+    for index_path in sorted(glob.glob(os.path.join(root, "index-*.jsonl"))):
+        with open(index_path, "r", encoding="utf8") as f:
+            for line in f:
+                if not line.endswith("\n"):  # 写到一半被中断的记录
+                    break
+                entry = json.loads(line)
+                # 按写入时间取最新的一条, 与 index 文件名的排序无关; 旧版记录没有 seq, 视为最早
+                old = entries.get(entry["name"])
+                if old is None or entry.get("seq", 0) >= old.get("seq", 0):
+                    entries[entry["name"]] = entry
+    return {name: entry for name, entry in entries.items() if not entry.get("deleted", False)}
+
+
+def _drop_partial_line(path):
+    """截掉文件末尾没写完的一行, 否则追加的记录会接在它后面, 整行都解析不了"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class FeatureStoreWriter:
+    def __init__(self, root, tag="0", shard_size=SHARD_SIZE, align=ALIGN):
+        self.root = root
+        self.tag = str(tag)
+        self.shard_size = shard_size
+        self.align = align
+        os.makedirs(root, exist_ok=True)
+        self.entries = read_index(root)
+        # 续写时总是开新分片, 不去拼接可能被截断的旧分片尾部
+        self.shard_id = len(glob.glob(os.path.join(root, "%s-*.bin" % self.tag)))
+        self.shard = None
+        self.offset = 0
+        index_path = os.path.join(root, "index-%s.jsonl" % self.tag)
+        _drop_partial_line(index_path)
+        self.index = open(index_path, "a", encoding="utf8")
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def is_current(self, name, **extra):
+        """已有这一项, 且 extra 里的字段 (如 model) 与记录一致"""
+        entry = self.entries.get(name)
+        return entry is not None and all(entry.get(k) == v for k, v in extra.items())
+
+    def _open_shard(self):
+        if self.shard is not None:
+            self.shard.close()
+            self.shard_id += 1
+        self.shard_name = "%s-%05d.bin" % (self.tag, self.shard_id)
+        self.shard = open(os.path.join(self.root, self.shard_name), "wb")
+        self.offset = 0
+
+    def _write_entry(self, entry):
+        entry["seq"] = time.time_ns()
+        self.index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.index.flush()
+
+    def add(self, name, fea, **extra):
+        arr, dtype = _to_numpy(fea)
+        if self.shard is None or (self.offset > 0 and self.offset + arr.nbytes > self.shard_size):
+            self._open_shard()
+        pad = -self.offset % self.align
+        if pad:
+            self.shard.write(b"\0" * pad)
+            self.offset += pad
+        self.shard.write(arr.data)
+        self.shard.flush()
+        entry = {
+            "name": name,
+            "shard": self.shard_name,
+            "offset": self.offset,
+            "dtype": dtype,
+            "shape": list(arr.shape),
+        }
+        entry.update(extra)
+        self.offset += arr.nbytes
+        # 数据先落盘再写索引, 中断时最多丢掉最后一条
+        self._write_entry(entry)
+        self.entries[name] = entry
+
+    def remove(self, name):
+        """写一条删除记录, 盖掉之前各个 index 里这个 name 的特征"""
+        if name not in self.entries:
+            return
+        self._write_entry({"name": name, "deleted": True})
+        del self.entries[name]
+
+    def close(self):
+        if self.shard is not None:
+            self.shard.close()
+            self.shard = None
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FeatureStoreReader:
+    def __init__(self, root):
+        self.root = root
+        self.entries = read_index(root)
+        self.mmaps = {}
+
+    def __getstate__(self):
+        # DataLoader worker 里各自重新 mmap
+        state = self.__dict__.copy()
+        state["mmaps"] = {}
+        return state
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self):
+        return set(self.entries)
+
+    def load_numpy(self, name):
+        entry = self.entries[name]
+        shard = entry["shard"]
+        if shard not in self.mmaps:
+            self.mmaps[shard] = np.memmap(os.path.join(self.root, shard), dtype=np.uint8, mode="r")
+        dtype = np.dtype("int16" if entry["dtype"] == "bfloat16" else entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        offset = entry["offset"]
+        buf = self.mmaps[shard][offset : offset + count * dtype.itemsize]
+        return buf.view(dtype).reshape(entry["shape"])
+
+    def load(self, name):
+        fea = torch.from_numpy(np.array(self.load_numpy(name)))
+        if self.entries[name]["dtype"] == "bfloat16":
+            fea = fea.view(torch.bfloat16)
+        return fea
+
+
+class FeatureDir:
+    """per-utterance .pt 目录, 与 FeatureStoreReader 接口一致"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __contains__(self, name):
+        return os.path.exists("%s/%s.pt" % (self.root, name))
+
+    def names(self):
+        return set([name[:-3] for name in os.listdir(self.root) if name.endswith(".pt")])  # 去除.pt后缀
+
+    def load(self, name):
+        return torch.load("%s/%s.pt" % (self.root, name), map_location="cpu")
+
+
+def open_features(feature_dir):
+    if has_store(feature_dir):
+        return FeatureStoreReader(store_path(feature_dir))
+    return FeatureDir(feature_dir)
+
+
+def convert(feature_dir, remove=False):
+    names = sorted(FeatureDir(feature_dir).names())
+    with FeatureStoreWriter(store_path(feature_dir), tag="convert") as writer:
+        for name in names:
+            if name in writer:
+                continue
+            writer.add(name, torch.load("%s/%s.pt" % (feature_dir, name), map_location="cpu"))
+    reader = FeatureStoreReader(store_path(feature_dir))
+    missing = [name for name in names if name not in reader]
+    assert len(missing) == 0, missing[:10]
+    if remove:
+        for name in names:
+            os.remove("%s/%s.pt" % (feature_dir, name))
+    return len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert per-utterance .pt features into a sharded store")
+    parser.add_argument("exp_dir", help="experiment dir, e.g. logs/my_exp")
+    parser.add_argument("--dirs", nargs="*", default=["3-bert", "4-cnhubert", "7-sv_cn"])
+    parser.add_argument("--remove", action="store_true", help="delete the .pt files after converting")
+    args = parser.parse_args()
+
+    for sub in args.dirs:
+        feature_dir = os.path.join(args.exp_dir, sub)
+        if not os.path.isdir(feature_dir):
+            continue
+        n = convert(feature_dir, remove=args.remove)
+        print("%s: %d items -> %s" % (feature_dir, n, store_path(feature_dir)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Weight-only INT8 for CPU inference ("int8: true" in tts_infer.yaml).
+
+Weights are stored as int8 with one fp32 scale per output channel (symmetric, absmax /
+127); activations stay fp32 and the matmul runs through torch.ops.aten._weight_int8pack_mm,
+which dequantises inside the kernel. T2S decoding is one token at a time, so it is bound by
+reading the weights, and reading a quarter of the bytes is where the speedup comes from.
+
+torch.ao.quantization.quantize_dynamic only swaps nn.Linear modules: the T2S blocks keep
+their weights as plain tensors in TorchScript classes (T2SMLP / T2SBlock call linear()
+below) and the SoVITS TextEncoder is built from Conv1d, so neither is reached by it.
+quantize_int8_ swaps the Conv1d / Linear layers of an nn.Module for Int8Conv1d / Int8Linear.
+
+The int8 tensors are not parameters and do not follow .to() / .half(), so this is CPU only.
+"""
+
+from typing import List, Optional, Tuple
+
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+
+@torch.jit.script
+def quantize_weight(weight: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """[out, ...] -> int8 [out, in], fp32 scale [out]"""
+    weight = weight.detach().float().reshape(weight.shape[0], -1)
+    scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127.0
+    weight = torch.round(weight / scale.unsqueeze(1)).clamp(-127, 127).to(torch.int8)
+    return weight.contiguous(), scale
+
+
+@torch.jit.script
+def linear(
+    x: torch.Tensor, weight: torch.Tensor, bias: Optional[torch.Tensor] = None, scale: Optional[torch.Tensor] = None
+) -> torch.Tensor:
+    """scale 为 None 时就是 F.linear, 否则 weight 是 quantize_weight 得到的 int8 权重"""
+    if scale is None:
+        return F.linear(x, weight, bias)
+    out_shape: List[int] = x.shape[:-1]
+    out_shape.append(weight.shape[0])
+    x = torch.ops.aten._weight_int8pack_mm(x.reshape(-1, x.shape[-1]).contiguous(), weight, scale.to(x.dtype))
+    x = x.view(out_shape)
+    if bias is not None:
+        x = x + bias
+    return x
+
+
+class Int8Linear(nn.Module):
+    def __init__(self, layer: nn.Linear):
+        super().__init__()
+        weight, scale = quantize_weight(layer.weight)
+        self.register_buffer("weight", weight)
+        self.register_buffer("scale", scale)
+        self.register_buffer("bias", None if layer.bias is None else layer.bias.detach().clone())
+
+    def forward(self, x):
+        return linear(x, self.weight, self.bias, self.scale)
+
+
+class Int8Conv1d(nn.Module):
+    """stride / dilation 为 1 且不分组的 Conv1d, 按 unfold 后的 int8 矩阵乘计算"""
+
+    def __init__(self, layer: nn.Conv1d):
+        super().__init__()
+        self.kernel_size = layer.kernel_size[0]
+        self.padding = layer.padding[0]
+        weight, scale = quantize_weight(layer.weight)  # [out, in * kernel_size], 与 unfold 的排列一致
+        self.register_buffer("weight", weight)
+        self.register_buffer("scale", scale)
+        self.register_buffer("bias", None if layer.bias is None else layer.bias.detach().clone())
+
+    def forward(self, x):
+        if self.padding > 0:
+            x = F.pad(x, (self.padding, self.padding))
+        if self.kernel_size == 1:
+            x = x.transpose(1, 2)
+        else:
+            # [b, c, t] -> [b, t, c * k]
+            x = x.unfold(2, self.kernel_size, 1).transpose(1, 2).flatten(2)
+        return linear(x, self.weight, self.bias, self.scale).transpose(1, 2)
+
+
+def _supported_conv(layer: nn.Conv1d):
+    return (
+        layer.stride == (1,)
+        and layer.dilation == (1,)
+        and layer.groups == 1
+        and isinstance(layer.padding, tuple)
+        and layer.padding_mode == "zeros"
+    )
+
+
+def quantize_int8_(model: nn.Module):
+    """原地把 model 里的 Linear / Conv1d 换成 int8 权重版本, 返回替换的层数"""
+    count = 0
+    for name, child in model.named_children():
+        if isinstance(child, nn.Linear):
+            setattr(model, name, Int8Linear(child))
+            count += 1
+        elif isinstance(child, nn.Conv1d) and _supported_conv(child):
+            setattr(model, name, Int8Conv1d(child))
+            count += 1
+        else:
+            count += quantize_int8_(child)
+    return count
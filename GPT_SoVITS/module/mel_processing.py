@@ -37,32 +37,26 @@ mel_basis = {}
 hann_window = {}
 
 
-def spectrogram_torch(y, n_fft, sampling_rate, hop_size, win_size, center=False):
-    if torch.min(y) < -1.2:
-        print("min value is ", torch.min(y))
-    if torch.max(y) > 1.2:
-        print("max value is ", torch.max(y))
-
-    global hann_window
-    dtype_device = str(y.dtype) + "_" + str(y.device)
-    # wnsize_dtype_device = str(win_size) + '_' + dtype_device
-    key = "%s-%s-%s-%s-%s" % (dtype_device, n_fft, sampling_rate, hop_size, win_size)
-    # if wnsize_dtype_device not in hann_window:
-    if key not in hann_window:
-        # hann_window[wnsize_dtype_device] = torch.hann_window(win_size).to(dtype=y.dtype, device=y.device)
-        hann_window[key] = torch.hann_window(win_size).to(dtype=y.dtype, device=y.device)
-
+def spectrogram_with_window(
+    hann_window: torch.Tensor,
+    y: torch.Tensor,
+    n_fft: int,
+    sampling_rate: int,
+    hop_size: int,
+    win_size: int,
+    center: bool = False,
+):
+    # 窗函数由调用方给出, 可以被 torch.jit.script, export_torch_script.py 导出的模块也用这个
     y = torch.nn.functional.pad(
         y.unsqueeze(1), (int((n_fft - hop_size) / 2), int((n_fft - hop_size) / 2)), mode="reflect"
     )
     y = y.squeeze(1)
-    # spec = torch.stft(y, n_fft, hop_length=hop_size, win_length=win_size, window=hann_window[wnsize_dtype_device],
     spec = torch.stft(
         y,
         n_fft,
         hop_length=hop_size,
         win_length=win_size,
-        window=hann_window[key],
+        window=hann_window,
         center=center,
         pad_mode="reflect",
         normalized=False,
@@ -74,6 +68,24 @@ def spectrogram_torch(y, n_fft, sampling_rate, hop_size, win_size, center=False)
     return spec
 
 
+def spectrogram_torch(y, n_fft, sampling_rate, hop_size, win_size, center=False):
+    if torch.min(y) < -1.2:
+        print("min value is ", torch.min(y))
+    if torch.max(y) > 1.2:
+        print("max value is ", torch.max(y))
+
+    global hann_window
+    dtype_device = str(y.dtype) + "_" + str(y.device)
+    # wnsize_dtype_device = str(win_size) + '_' + dtype_device
+    key = "%s-%s-%s-%s-%s" % (dtype_device, n_fft, sampling_rate, hop_size, win_size)
+    # if wnsize_dtype_device not in hann_window:
+    if key not in hann_window:
+        # hann_window[wnsize_dtype_device] = torch.hann_window(win_size).to(dtype=y.dtype, device=y.device)
+        hann_window[key] = torch.hann_window(win_size).to(dtype=y.dtype, device=y.device)
+
+    return spectrogram_with_window(hann_window[key], y, n_fft, sampling_rate, hop_size, win_size, center)
+
+
 def spec_to_mel_torch(spec, n_fft, num_mels, sampling_rate, fmin, fmax):
     global mel_basis
     dtype_device = str(spec.dtype) + "_" + str(spec.device)
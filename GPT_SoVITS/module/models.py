@@ -635,13 +635,14 @@ class MultiPeriodDiscriminator(torch.nn.Module):
         discs = discs + [DiscriminatorP(i, use_spectral_norm=use_spectral_norm) for i in periods]
         self.discriminators = nn.ModuleList(discs)
 
-    def forward(self, y, y_hat):
+    def forward(self, y, y_hat, grad_real=True):
         y_d_rs = []
         y_d_gs = []
         fmap_rs = []
         fmap_gs = []
         for i, d in enumerate(self.discriminators):
-            y_d_r, fmap_r = d(y)
+            with torch.set_grad_enabled(grad_real and torch.is_grad_enabled()):
+                y_d_r, fmap_r = d(y)
             y_d_g, fmap_g = d(y_hat)
             y_d_rs.append(y_d_r)
             y_d_gs.append(y_d_g)
@@ -1097,6 +1098,33 @@ class SynthesizerTrn(nn.Module):
         return codes.transpose(0, 1)
 
 
+class SemanticExtractor(nn.Module):
+    """
+    只含 ssl_proj + quantizer, 数据集预处理提取语义 token 用, 不用实例化整个 SynthesizerTrn.
+    参数名与 SynthesizerTrn* 一致, 可直接从 s2G 权重里加载
+    """
+
+    def __init__(self, semantic_frame_rate="25hz", ssl_dim=768):
+        super().__init__()
+        assert semantic_frame_rate in ["25hz", "50hz"]
+        if semantic_frame_rate == "25hz":
+            self.ssl_proj = nn.Conv1d(ssl_dim, ssl_dim, 2, stride=2)
+        else:
+            self.ssl_proj = nn.Conv1d(ssl_dim, ssl_dim, 1, stride=1)
+        self.quantizer = ResidualVectorQuantizer(dimension=ssl_dim, n_q=1, bins=1024)
+
+    def load_from_synthesizer(self, state_dict):
+        state_dict = {k: v for k, v in state_dict.items() if k.startswith(("ssl_proj.", "quantizer."))}
+        return self.load_state_dict(state_dict, strict=False)
+
+    def get_lengths(self, ssl_lengths):
+        # ssl_proj 不补零, 补零帧不影响有效帧的 token
+        return (ssl_lengths - self.ssl_proj.kernel_size[0]) // self.ssl_proj.stride[0] + 1
+
+    def forward(self, ssl):  # (B, 768, T) -> (B, T')
+        return self.quantizer.encode(self.ssl_proj(ssl))[0]
+
+
 class CFM(torch.nn.Module):
     def __init__(self, in_channels, dit):
         super().__init__()
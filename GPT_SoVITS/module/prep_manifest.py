@@ -0,0 +1,158 @@
+"""
+Per-utterance manifest for incremental dataset preparation.
+
+For every (stage, utterance) the manifest records the hash of the stage input and an
+id of the model that produced the output:
+
+    logs/my_exp/manifest/
+        text-t0.jsonl       {"name": ..., "key": <sha1 of language|text>, "model": <version|bert id>}
+        audio-a0.jsonl      {"name": ..., "key": <sha1 of the wav>, "stat": [size, mtime_ns], "model": ...}
+        semantic-a0.jsonl   {"name": ..., "key": <audio key>, "model": <s2G id>}
+
+A rerun only processes items whose key or model changed (or that have no record).
+Like the feature store index, every writer appends to its own file and every record
+carries its write time ("seq"); the most recent record for a name wins, whatever file it
+is in. Records for stages whose output is a merged file (2-name2text.txt,
+6-name2semantic.tsv) are first written as .pending and only committed after the merged
+file has been atomically replaced, so a crash in between just redoes those items.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import time
+
+STAGES = ("text", "audio", "semantic")
+
+
+def text_key(language, text):
+    return hashlib.sha1(("%s|%s" % (language, text)).encode("utf8")).hexdigest()
+
+
+def file_stat(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def file_key(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def model_id(path):
+    """模型文件/目录的指纹(文件名+大小+修改时间), 不读内容"""
+    if path is None or not os.path.exists(path):
+        return str(path)
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = sorted(
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names if not name.startswith(".")
+        )
+    sha1 = hashlib.sha1()
+    for file in files:
+        st = os.stat(file)
+        sha1.update(("%s:%d:%d\n" % (os.path.relpath(file, path), st.st_size, int(st.st_mtime))).encode("utf8"))
+    return "%s@%s" % (os.path.basename(path.rstrip("/\\")), sha1.hexdigest()[:16])
+
+
+def _read_jsonl(path, records):
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            if not line.endswith("\n"):  # 写到一半被中断的记录
+                break
+            record = json.loads(line)
+            # 按写入时间取最新的一条; 旧版记录没有 seq, 视为最早, 之间按读入顺序
+            old = records.get(record["name"])
+            if old is None or record.get("seq", 0) >= old.get("seq", 0):
+                records[record["name"]] = record
+
+
+def _stage_paths(root, stage):
+    """compact 留下的 merged 文件总是最先读, 它里面都是更早的记录"""
+    paths = sorted(glob.glob(os.path.join(root, "%s-*.jsonl" % stage)))
+    merged = os.path.join(root, "%s-merged.jsonl" % stage)
+    return sorted(paths, key=lambda path: path != merged)
+
+
+class Manifest:
+    def __init__(self, root):
+        self.root = root
+        self.records = {stage: {} for stage in STAGES}
+        for stage in STAGES:
+            for path in _stage_paths(root, stage):
+                _read_jsonl(path, self.records[stage])
+
+    def get(self, stage, name):
+        return self.records[stage].get(name)
+
+    def is_current(self, stage, name, key, model):
+        record = self.records[stage].get(name)
+        return record is not None and record["key"] == key and record["model"] == model
+
+    def audio_key(self, name, path):
+        """大小和修改时间都没变就沿用记录里的哈希, 否则返回 None 让调用方重新算"""
+        record = self.records["audio"].get(name)
+        if record is not None and record.get("stat") == file_stat(path):
+            return record["key"]
+        return None
+
+    def compact(self, stage):
+        """把某个阶段的所有记录合并成一个文件, 防止每周增量后越积越多"""
+        paths = glob.glob(os.path.join(self.root, "%s-*.jsonl" % stage))
+        if len(paths) <= 1:
+            return
+        merged = os.path.join(self.root, "%s-merged.jsonl" % stage)
+        with open(merged + ".tmp", "w", encoding="utf8") as f:
+            for record in self.records[stage].values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(merged + ".tmp", merged)
+        for path in paths:
+            if path != merged:
+                os.remove(path)
+
+
+class ManifestWriter:
+    def __init__(self, root, stage, tag, pending=False):
+        assert stage in STAGES, stage
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, "%s-%s.jsonl" % (stage, tag))
+        self.f = open(self.path + (".pending" if pending else ""), "a", encoding="utf8")
+
+    def add(self, name, key, model, **extra):
+        record = {"name": name, "key": key, "model": model}
+        record.update(extra)
+        record["seq"] = time.time_ns()
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def commit(root, stage):
+    """合并文件替换完成后再调用, 把 .pending 记录并入正式记录"""
+    for pending in glob.glob(os.path.join(root, "%s-*.jsonl.pending" % stage)):
+        with open(pending, "r", encoding="utf8") as f:
+            lines = [line for line in f if line.endswith("\n")]
+        with open(pending[: -len(".pending")], "a", encoding="utf8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(pending)
+
+
+def discard(root, stage):
+    """上一次中断留下的 .pending 对应的结果没有合并进去, 直接丢弃"""
+    for pending in glob.glob(os.path.join(root, "%s-*.jsonl.pending" % stage)):
+        os.remove(pending)
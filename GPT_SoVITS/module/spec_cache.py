@@ -0,0 +1,128 @@
+"""
+On-disk spectrogram / mel cache for the SoVITS training loaders.
+
+The loaders used to decode every 5-wav32k file through an ffmpeg subprocess and redo
+spectrogram_torch (plus a mel for v3/v4) for every sample in every epoch. With
+"spec_cache": true in the "data" section of the s2 config, each result is stored once
+as a .npy file and read back with one np.load:
+
+    logs/my_exp/spec_cache/
+        spec-<params hash>/ab/<audio sha1>.npy
+        mel-<params hash>/ab/<audio sha1>.npy
+
+Entries are keyed by the sha1 of the wav bytes and the STFT / mel parameters, so
+re-prepared audio or a changed config never hits a stale entry. The wav is only hashed
+when the cache is on; without it read_audio does not touch the bytes twice. The cache fills on first
+touch; to fill it ahead of training (from the repository root):
+
+    python GPT_SoVITS/module/spec_cache.py -c GPT_SoVITS/configs/tmp_s2.json
+
+5-wav32k files are mono 16-bit PCM at 32k, so they are read with soundfile directly
+(same float values as ffmpeg's f32le output); other sample rates still go through
+load_audio.
+"""
+
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import soundfile
+import torch
+
+CACHE_DIR = "spec_cache"
+
+
+def read_audio(filename, sr, with_key=True):
+    """返回 (float32 波形, 音频内容哈希), 采样率一致时不起 ffmpeg 子进程; with_key=False 时不算哈希, 返回 None"""
+    key = None
+    if with_key:
+        with open(filename, "rb") as f:
+            data = f.read()
+        key = hashlib.sha1(data).hexdigest()
+    try:
+        audio, file_sr = soundfile.read(io.BytesIO(data) if with_key else filename, dtype="float32", always_2d=True)
+    except RuntimeError:
+        file_sr = None
+    if file_sr != sr:
+        from tools.my_utils import load_audio
+
+        return load_audio(filename, sr), key
+    return np.ascontiguousarray(audio.mean(axis=1) if audio.shape[1] > 1 else audio[:, 0]), key
+
+
+class SpecCache:
+    def __init__(self, root, dtype="float32"):
+        self.root = root
+        self.dtype = np.dtype(dtype)
+
+    def _path(self, kind, params, key):
+        params_hash = hashlib.sha1(json.dumps(params).encode("utf8")).hexdigest()[:12]
+        return os.path.join(self.root, "%s-%s" % (kind, params_hash), key[:2], "%s.npy" % key)
+
+    def get(self, kind, params, key, compute):
+        path = self._path(kind, params, key)
+        if os.path.exists(path):
+            try:
+                return torch.from_numpy(np.load(path).astype(np.float32, copy=False))
+            except (ValueError, OSError):  # 写到一半的文件, 重新算
+                pass
+        value = compute()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 多个 DataLoader worker 可能同时写同一项, 先写临时文件再原子替换
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.save(f, value.detach().cpu().numpy().astype(self.dtype))
+        os.replace(tmp_path, path)
+        return value
+
+
+def _skip(item):
+    return None
+
+
+def get_spec_cache(hparams):
+    if "spec_cache" not in hparams or not hparams.spec_cache:
+        return None
+    dtype = hparams.spec_cache_dtype if "spec_cache_dtype" in hparams else "float32"
+    return SpecCache("%s/%s" % (hparams.exp_dir, CACHE_DIR), dtype)
+
+
+def main():
+    import argparse
+    import sys
+
+    from tqdm import tqdm
+
+    now_dir = os.getcwd()
+    sys.path.append(now_dir)
+    sys.path.append("%s/GPT_SoVITS" % (now_dir))
+    import utils
+    from module import data_utils
+
+    parser = argparse.ArgumentParser(description="fill the spectrogram / mel cache of an s2 experiment")
+    parser.add_argument("-c", "--config", required=True, help="s2 training config (json)")
+    parser.add_argument("--num_workers", type=int, default=min(8, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    hps = utils.get_hparams_from_file(args.config)
+    hps.data.spec_cache = True
+    version = hps.model.version if "version" in hps.model else "v2"
+    if version == "v3":
+        dataset = data_utils.TextAudioSpeakerLoaderV3(hps.data)
+    elif version == "v4":
+        dataset = data_utils.TextAudioSpeakerLoaderV4(hps.data)
+    else:
+        dataset = data_utils.TextAudioSpeakerLoader(hps.data, version=version)
+    # 去掉小数据集的重复条目
+    dataset.audiopaths_sid_text = list({item[0]: item for item in dataset.audiopaths_sid_text}.values())
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=None, num_workers=args.num_workers, collate_fn=_skip
+    )
+    for _ in tqdm(loader):
+        pass
+
+
+if __name__ == "__main__":
+    main()
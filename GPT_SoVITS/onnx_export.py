@@ -3,6 +3,7 @@ import torchaudio
 from AR.models.t2s_lightning_module_onnx import Text2SemanticLightningModule
 from feature_extractor import cnhubert
 from module.models_onnx import SynthesizerTrn, symbols_v1, symbols_v2
+from module.prep_manifest import model_id
 from torch import nn
 
 cnhubert_base_path = "GPT_SoVITS/pretrained_models/chinese-hubert-base"
@@ -112,7 +113,7 @@ class T2SModel(nn.Module):
         prefix_len = prompts.shape[1]
 
         # [1,N,512] [1,N]
-        y, k, v, y_emb, x_example = self.first_stage_decoder(x, prompts)
+        y, k, v, y_emb, x_example, _ = self.first_stage_decoder(x, prompts)
 
         stop = False
         for idx in range(1, 1500):
@@ -161,7 +162,8 @@ class T2SModel(nn.Module):
             (x, prompts),
             f"onnx/{project_name}/{project_name}_t2s_fsdec.onnx",
             input_names=["x", "prompts"],
-            output_names=["y", "k", "v", "y_emb", "x_example"],
+            # logits 给 TTS_infer_pack/onnx_backend.py 按 run() 的采样参数采第一个 token
+            output_names=["y", "k", "v", "y_emb", "x_example", "logits"],
             dynamic_axes={
                 "x": {1: "x_length"},
                 "prompts": {1: "prompts_length"},
@@ -169,7 +171,7 @@ class T2SModel(nn.Module):
             verbose=False,
             opset_version=16,
         )
-        y, k, v, y_emb, x_example = self.first_stage_decoder(x, prompts)
+        y, k, v, y_emb, x_example, _ = self.first_stage_decoder(x, prompts)
 
         torch.onnx.export(
             self.stage_decoder,
@@ -382,6 +384,21 @@ def export(vits_path, gpt_path, project_name, vits_model="v2"):
     MoeVSConfJson = json.dumps(MoeVSConf)
     with open(f"onnx/{project_name}.json", "w") as MoeVsConfFile:
         json.dump(MoeVSConf, MoeVsConfFile, indent=4)
+    # TTS_infer_pack/onnx_backend.py 据此判断导出的图是否对应当前加载的权重
+    with open(f"onnx/{project_name}/export.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": vits.hps.model.version,
+                "t2s_weights_path": gpt_path,
+                "vits_weights_path": vits_path,
+                # 同名文件重新训练/转换后指纹会变, 不能只比路径
+                "t2s_weights_id": model_id(gpt_path),
+                "vits_weights_id": model_id(vits_path),
+            },
+            f,
+            ensure_ascii=False,
+            indent=4,
+        )
 
 
 if __name__ == "__main__":
@@ -14,12 +14,14 @@ bert_pretrained_dir = os.environ.get("bert_pretrained_dir")
 import torch
 
 is_half = eval(os.environ.get("is_half", "True")) and torch.cuda.is_available()
+use_feature_store = eval(os.environ.get("feature_store", "False"))
 version = os.environ.get("version", None)
 import traceback
 import os.path
 from text.cleaner import clean_text
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from tools.my_utils import clean_path
+from module.feature_store import FeatureStoreWriter, store_path
 
 # inp_text=sys.argv[1]
 # inp_wav_dir=sys.argv[2]
@@ -48,6 +50,8 @@ if os.path.exists(txt_path) == False:
     bert_dir = "%s/3-bert" % (opt_dir)
     os.makedirs(opt_dir, exist_ok=True)
     os.makedirs(bert_dir, exist_ok=True)
+    if use_feature_store:
+        bert_store = FeatureStoreWriter(store_path(bert_dir), i_part)
     if torch.cuda.is_available():
         device = "cuda:0"
     # elif torch.backends.mps.is_available():
@@ -91,11 +95,18 @@ if os.path.exists(txt_path) == False:
                 print(name)
                 phones, word2ph, norm_text = clean_text(text.replace("%", "-").replace("￥", ","), lan, version)
                 path_bert = "%s/%s.pt" % (bert_dir, name)
-                if os.path.exists(path_bert) == False and lan == "zh":
+                if use_feature_store:
+                    bert_exists = name in bert_store
+                else:
+                    bert_exists = os.path.exists(path_bert)
+                if bert_exists == False and lan == "zh":
                     bert_feature = get_bert_feature(norm_text, word2ph)
                     assert bert_feature.shape[-1] == len(phones)
                     # torch.save(bert_feature, path_bert)
-                    my_save(bert_feature, path_bert)
+                    if use_feature_store:
+                        bert_store.add(name, bert_feature)
+                    else:
+                        my_save(bert_feature, path_bert)
                 phones = " ".join(phones)
                 # res.append([name,phones])
                 res.append([name, phones, word2ph, norm_text])
@@ -136,6 +147,8 @@ if os.path.exists(txt_path) == False:
             print(line, traceback.format_exc())
 
     process(todo, res)
+    if use_feature_store:
+        bert_store.close()
     opt = []
     for name, phones, word2ph, norm_text in res:
         opt.append("%s\t%s\t%s\t%s" % (name, phones, word2ph, norm_text))
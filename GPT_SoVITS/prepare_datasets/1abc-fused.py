@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+# 一遍跑完 1a(文本+bert) / 1b(hubert+32k音频+sv) / 1c(语义token):
+# 音频 worker 对每条音频只解码一次, hubert 特征留在显存里直接算 sv 和语义 token;
+# 文本 worker 与之并行. 各 worker 从共享队列按块领活, 不再静态切分 lines[i_part::all_parts],
+# 慢卡少干、快卡多干. 输出格式与 1-get-text.py / 2-get-hubert-wav32k.py / 2-get-sv.py / 3-get-semantic.py 相同.
+# 增量: opt_dir/manifest 里按条记录输入哈希和模型版本(见 module/prep_manifest.py), 重跑时只处理新增或改动的条目,
+# 再与已有的 2-name2text.txt / 6-name2semantic.tsv 原子合并.
+# 语义 token 的卡号 (gpu_numbers_semantic) 与音频相同时在音频 worker 里顺带算; 不同时等音频阶段结束后,
+# 在这些卡上另起 worker 读回 hubert 特征再算.
+
+import sys
+import os
+
+inp_text = os.environ.get("inp_text")
+inp_wav_dir = os.environ.get("inp_wav_dir")
+exp_name = os.environ.get("exp_name")
+opt_dir = os.environ.get("opt_dir")
+bert_pretrained_dir = os.environ.get("bert_pretrained_dir")
+cnhubert_base_dir = os.environ.get("cnhubert_base_dir")
+pretrained_s2G = os.environ.get("pretrained_s2G")
+s2config_path = os.environ.get("s2config_path")
+sv_path = os.environ.get("sv_path")
+version = os.environ.get("version", "v2")
+# 形如 "0-1", 每个编号起一个 worker, 同一张卡可以重复写
+gpu_numbers_text = os.environ.get("gpu_numbers_text", "0")
+gpu_numbers_audio = os.environ.get("gpu_numbers_audio", "0")
+gpu_numbers_semantic = os.environ.get("gpu_numbers_semantic", gpu_numbers_audio)
+chunk_size = int(os.environ.get("chunk_size", "64"))
+use_feature_store = eval(os.environ.get("feature_store", "False"))
+batch_size = int(os.environ.get("hubert_batch_size", "16"))
+batch_seconds = float(os.environ.get("hubert_batch_seconds", "160"))
+decode_workers = int(os.environ.get("decode_workers", str(min(8, os.cpu_count() or 1))))
+sv_batch_size = int(os.environ.get("sv_batch_size", "16"))
+sv_max_pad_frames = int(os.environ.get("sv_max_pad_frames", "0"))
+
+import copy
+import multiprocessing
+import shutil
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import time as ttime
+
+import torch
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+from tools.my_utils import clean_path
+from module.prep_manifest import Manifest, ManifestWriter, commit, discard, file_key, file_stat, model_id, text_key
+
+bert_dir = "%s/3-bert" % (opt_dir)
+hubert_dir = "%s/4-cnhubert" % (opt_dir)
+wav32dir = "%s/5-wav32k" % (opt_dir)
+sv_cn_dir = "%s/7-sv_cn" % (opt_dir)
+path_text = "%s/2-name2text.txt" % (opt_dir)
+path_semantic = "%s/6-name2semantic.tsv" % (opt_dir)
+manifest_dir = "%s/manifest" % (opt_dir)
+extract_sv = "Pro" in version
+
+maxx = 0.95
+alpha = 0.5
+
+language_v1_to_language_v2 = {
+    "ZH": "zh",
+    "zh": "zh",
+    "JP": "ja",
+    "jp": "ja",
+    "JA": "ja",
+    "ja": "ja",
+    "EN": "en",
+    "en": "en",
+    "En": "en",
+    "KO": "ko",
+    "Ko": "ko",
+    "ko": "ko",
+    "yue": "yue",
+    "YUE": "yue",
+    "Yue": "yue",
+}
+
+
+def my_save(fea, path, tag):  #####fix issue: torch.save doesn't support chinese path
+    dir = os.path.dirname(path)
+    name = os.path.basename(path)
+    tmp_path = "%s%s.pth" % (ttime(), tag)
+    torch.save(fea, tmp_path)
+    shutil.move(tmp_path, "%s/%s" % (dir, name))
+
+
+def get_device():
+    if torch.cuda.is_available():
+        return "cuda:0"
+    # elif torch.backends.mps.is_available():
+    #     return "mps"
+    return "cpu"
+
+
+def get_is_half():
+    return eval(os.environ.get("is_half", "True")) and torch.cuda.is_available()
+
+
+def parse_lines():
+    with open(inp_text, "r", encoding="utf8") as f:
+        lines = f.read().strip("\n").split("\n")
+    items = []
+    for line in lines:
+        try:
+            wav_name, spk_name, language, text = line.split("|")
+            wav_name = clean_path(wav_name)
+            if inp_wav_dir != "" and inp_wav_dir != None:
+                wav_name = os.path.basename(wav_name)
+                wav_path = "%s/%s" % (inp_wav_dir, wav_name)
+            else:
+                wav_path = wav_name
+                wav_name = os.path.basename(wav_name)
+            items.append((wav_name, wav_path, language, text))
+        except:
+            print(line, traceback.format_exc())
+    return items
+
+
+def iter_chunks(queue):
+    while True:
+        chunk = queue.get()
+        if chunk is None:
+            return
+        yield chunk
+
+
+########################################## 1a: 文本 + bert
+def text_worker(tag, queue, text_model):
+    from transformers import AutoModelForMaskedLM, AutoTokenizer
+    from text.cleaner import clean_text
+    from module.feature_store import FeatureStoreWriter, store_path
+
+    device = get_device()
+    is_half = get_is_half()
+    if os.path.exists(bert_pretrained_dir) == False:
+        raise FileNotFoundError(bert_pretrained_dir)
+    tokenizer = AutoTokenizer.from_pretrained(bert_pretrained_dir)
+    bert_model = AutoModelForMaskedLM.from_pretrained(bert_pretrained_dir)
+    if is_half == True:
+        bert_model = bert_model.half().to(device)
+    else:
+        bert_model = bert_model.to(device)
+    if use_feature_store:
+        bert_store = FeatureStoreWriter(store_path(bert_dir), tag)
+    # 合并进 2-name2text.txt 之后才由主进程提交
+    text_manifest = ManifestWriter(manifest_dir, "text", tag, pending=True)
+
+    def get_bert_feature(text, word2ph):
+        with torch.no_grad():
+            inputs = tokenizer(text, return_tensors="pt")
+            for i in inputs:
+                inputs[i] = inputs[i].to(device)
+            res = bert_model(**inputs, output_hidden_states=True)
+            res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
+
+        assert len(word2ph) == len(text)
+        phone_level_feature = []
+        for i in range(len(word2ph)):
+            repeat_feature = res[i].repeat(word2ph[i], 1)
+            phone_level_feature.append(repeat_feature)
+
+        phone_level_feature = torch.cat(phone_level_feature, dim=0)
+
+        return phone_level_feature.T
+
+    opt = []
+    for chunk in iter_chunks(queue):
+        for name, wav_path, language, text, key in chunk:
+            if language not in language_v1_to_language_v2.keys():
+                print(f"\033[33m[Waring] The {language = } of {name} is not supported for training.\033[0m")
+                continue
+            lan = language_v1_to_language_v2[language]
+            try:
+                phones, word2ph, norm_text = clean_text(text.replace("%", "-").replace("￥", ","), lan, version)
+                path_bert = "%s/%s.pt" % (bert_dir, name)
+                # 走到这里说明文本是新的或改过的, 旧的 bert 特征不能复用
+                if lan == "zh":
+                    bert_feature = get_bert_feature(norm_text, word2ph)
+                    assert bert_feature.shape[-1] == len(phones)
+                    if use_feature_store:
+                        bert_store.add(name, bert_feature)
+                    else:
+                        my_save(bert_feature, path_bert, tag)
+                elif use_feature_store:
+                    bert_store.remove(name)  # 写删除记录, 盖掉以前按中文存的特征
+                elif os.path.exists(path_bert):
+                    os.remove(path_bert)
+                opt.append("%s\t%s\t%s\t%s" % (name, " ".join(phones), word2ph, norm_text))
+                text_manifest.add(name, key, text_model)
+            except:
+                print(name, text, traceback.format_exc())
+    if use_feature_store:
+        bert_store.close()
+    with open("%s/2-name2text-%s.txt" % (opt_dir, tag), "w", encoding="utf8") as f:
+        f.write("\n".join(opt) + "\n")
+    text_manifest.close()
+
+
+########################################## 1b + 1c: 解码 -> hubert -> sv -> 语义 token
+def audio_worker(tag, queue, load_hubert, load_vq, audio_model, semantic_model):
+    import librosa
+    import numpy as np
+    from scipy.io import wavfile
+
+    import utils
+    from feature_extractor import cnhubert
+    from module.feature_store import FeatureStoreWriter, open_features, store_path
+    from module.models import SemanticExtractor
+    from tools.my_utils import load_audio
+
+    device = get_device()
+    is_half = get_is_half()
+    # load_hubert=False: 只算语义 token 的 worker, 条目都走 semantic_only
+    if load_hubert:
+        cnhubert.cnhubert_base_path = cnhubert_base_dir
+        model = cnhubert.get_model()
+        if is_half == True:
+            model = model.half().to(device)
+        else:
+            model = model.to(device)
+    model_fp32 = []
+    if extract_sv and load_hubert:
+        from sv import SV
+
+        sv_model = SV(device, is_half, sv_path)
+    if load_vq:
+        hps = utils.get_hparams_from_file(s2config_path)
+        vq_model = SemanticExtractor(hps.model.semantic_frame_rate)
+        print(
+            vq_model.load_from_synthesizer(
+                torch.load(pretrained_s2G, map_location="cpu", weights_only=False)["weight"]
+            )
+        )
+        if is_half == True:
+            vq_model = vq_model.half().to(device)
+        else:
+            vq_model = vq_model.to(device)
+        vq_model.eval()
+    hubert_features = open_features(hubert_dir)
+    if use_feature_store:
+        if load_hubert:
+            hubert_store = FeatureStoreWriter(store_path(hubert_dir), tag)
+        if extract_sv and load_hubert:
+            sv_store = FeatureStoreWriter(store_path(sv_cn_dir), tag)
+        if load_vq:
+            semantic_store = FeatureStoreWriter(store_path("%s/6-name2semantic" % (opt_dir)), tag, align=2)
+    # 特征文件直接落盘, 写完即可记录; 语义 token 要等合并进 6-name2semantic.tsv 后再提交
+    audio_manifest = ManifestWriter(manifest_dir, "audio", tag)
+    semantic_manifest = ManifestWriter(manifest_dir, "semantic", tag, pending=True)
+
+    def decode(wav_name, wav_path, key, need_semantic):
+        stat = file_stat(wav_path)
+        if key is None:
+            key = file_key(wav_path)
+        tmp_audio = load_audio(wav_path, 32000)
+        tmp_max = np.abs(tmp_audio).max()
+        if tmp_max > 2.2:
+            print("%s-filtered,%s" % (wav_name, tmp_max))
+            return None
+        tmp_audio32 = (tmp_audio / tmp_max * (maxx * alpha * 32768)) + ((1 - alpha) * 32768) * tmp_audio
+        tmp_audio32b = (tmp_audio / tmp_max * (maxx * alpha * 1145.14)) + ((1 - alpha) * 1145.14) * tmp_audio
+        tmp_audio = librosa.resample(tmp_audio32b, orig_sr=32000, target_sr=16000)  # 不是重采样问题
+        return wav_name, tmp_audio32, tmp_audio, key, stat, need_semantic
+
+    def make_batches(items):
+        items = sorted(items, key=lambda item: len(item[2]))
+        batch = []
+        for item in items:
+            max_len = max(len(item[2]), len(batch[-1][2]) if batch else 0)
+            if batch and (len(batch) >= batch_size or max_len * (len(batch) + 1) > batch_seconds * 16000):
+                yield batch
+                batch = []
+            batch.append(item)
+        if batch:
+            yield batch
+
+    def extract(hmodel, batch):
+        dtype = next(hmodel.parameters()).dtype
+        wav_lengths = torch.LongTensor([len(item[2]) for item in batch])
+        wavs = torch.zeros(len(batch), int(wav_lengths.max()))
+        for i, item in enumerate(batch):
+            wavs[i, : len(item[2])] = torch.from_numpy(item[2])
+        feats, feat_lengths = cnhubert.get_content_batch(hmodel, wavs.to(device, dtype), wav_lengths.to(device))
+        valid = torch.arange(feats.shape[-1], device=feats.device)[None] < feat_lengths[:, None]
+        nan_rows = (torch.isnan(feats) & valid[:, None]).flatten(1).any(1).tolist()
+        return feats, feat_lengths, nan_rows
+
+    def quantize(feats, feat_lengths):  # hubert 特征不落盘回读, 直接在显存里算语义 token
+        with torch.no_grad():
+            codes = vq_model(feats.to(next(vq_model.parameters()).dtype))
+        codes = codes.cpu().numpy().astype(np.int16)
+        lengths = vq_model.get_lengths(feat_lengths.cpu()).tolist()
+        return [codes[i, : lengths[i]] for i in range(len(lengths))]
+
+    semantic_lines = []
+
+    def save_semantic(wav_name, codes, key):
+        if use_feature_store:
+            semantic_store.add(wav_name, codes, model=semantic_model)
+            semantic_lines.append(wav_name)
+        else:
+            semantic_lines.append("%s\t%s" % (wav_name, " ".join(map(str, codes.tolist()))))
+        semantic_manifest.add(wav_name, key, semantic_model)
+
+    def save(item, feats, feat_length, codes):
+        wav_name, tmp_audio32, _, key, _, need_semantic = item
+        wavfile.write("%s/%s" % (wav32dir, wav_name), 32000, tmp_audio32.astype("int16"))
+        ssl = feats[None, :, :feat_length].contiguous().cpu()  # torch.Size([1, 768, 215])
+        if use_feature_store:
+            hubert_store.add(wav_name, ssl)
+        else:
+            my_save(ssl, "%s/%s.pt" % (hubert_dir, wav_name), tag)
+        if need_semantic:
+            save_semantic(wav_name, codes, key)
+
+    def save_sv(items):
+        wavs = [torch.from_numpy(item[1].astype("int16")).float() / 32768 for item in items]
+        embs = sv_model.compute_embedding_list(wavs, 32000, sv_batch_size, sv_max_pad_frames)
+        for item, emb in zip(items, embs):
+            if emb is None:  # 太短或单独计算也出错
+                print("sv filtered:%s" % item[0])
+                continue
+            if use_feature_store:
+                sv_store.add(item[0], emb)
+            else:
+                my_save(emb, "%s/%s.pt" % (sv_cn_dir, item[0]), tag)
+
+    def process(batch):
+        saved = []
+        hmodel = model
+        while len(batch) > 0:
+            feats, feat_lengths, nan_rows = extract(hmodel, batch)
+            if any(item[5] for item in batch):
+                codes = quantize(feats, feat_lengths)
+            else:
+                codes = [None] * len(batch)
+            lengths = feat_lengths.tolist()
+            nan_fails = []
+            for i, item in enumerate(batch):
+                if nan_rows[i]:
+                    nan_fails.append(item)
+                else:
+                    save(item, feats[i], lengths[i], codes[i])
+                    saved.append(item)
+            if len(nan_fails) == 0 or is_half == False or hmodel is not model:
+                for item in nan_fails:
+                    print("nan filtered:%s" % item[0])
+                break
+            # 只把出 nan 的那几条用 fp32 重跑
+            if len(model_fp32) == 0:
+                model_fp32.append(copy.deepcopy(model).float())
+            hmodel = model_fp32[0]
+            batch = nan_fails
+        if extract_sv and len(saved) > 0:
+            save_sv(saved)
+        for wav_name, _, _, key, stat, _ in saved:
+            audio_manifest.add(wav_name, key, audio_model, stat=stat)
+
+    def semantic_only(todo):  # 音频没变, hubert 特征直接复用, 只重算语义 token
+        ssl_list = [(name, key, hubert_features.load(name)) for name, key in todo]
+        ssl_list.sort(key=lambda item: item[2].shape[-1])
+        for i in range(0, len(ssl_list), batch_size):
+            batch = ssl_list[i : i + batch_size]
+            ssl_lengths = torch.LongTensor([ssl.shape[-1] for _, _, ssl in batch])
+            feats = torch.zeros(len(batch), 768, int(ssl_lengths.max()))
+            for j, (_, _, ssl) in enumerate(batch):
+                feats[j, :, : ssl.shape[-1]] = ssl[0]
+            for (name, key, _), codes in zip(batch, quantize(feats.to(device), ssl_lengths)):
+                save_semantic(name, codes, key)
+
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        for chunk in iter_chunks(queue):
+            features_ready = []
+            futures = deque()
+            for wav_name, wav_path, key, need_audio, need_semantic in chunk:
+                if need_audio:
+                    futures.append((wav_name, pool.submit(decode, wav_name, wav_path, key, need_semantic)))
+                elif need_semantic:
+                    features_ready.append((wav_name, key))
+            items = []
+            while futures:
+                wav_name, future = futures.popleft()
+                try:
+                    item = future.result()
+                except:
+                    print(wav_name, traceback.format_exc())
+                    continue
+                if item is not None:
+                    items.append(item)
+            for batch in make_batches(items):
+                try:
+                    process(batch)
+                except:
+                    print([item[0] for item in batch], traceback.format_exc())
+            if len(features_ready) > 0:
+                try:
+                    semantic_only(features_ready)
+                except:
+                    print([name for name, _ in features_ready], traceback.format_exc())
+
+    if use_feature_store:
+        if load_hubert:
+            hubert_store.close()
+        if extract_sv and load_hubert:
+            sv_store.close()
+        if load_vq:
+            semantic_store.close()
+    audio_manifest.close()
+    with open("%s/6-name2semantic-%s.tsv" % (opt_dir, tag), "w", encoding="utf8") as f:
+        f.write("\n".join(semantic_lines))
+    semantic_manifest.close()
+
+
+def start_workers(ctx, target, gpu_numbers, prefix, items, *args):
+    queue = ctx.Queue()
+    for i in range(0, len(items), chunk_size):
+        queue.put(items[i : i + chunk_size])
+    gpu_names = gpu_numbers.split("-")
+    for _ in gpu_names:
+        queue.put(None)
+    procs = []
+    for i, gpu in enumerate(gpu_names):
+        tag = "%s%s" % (prefix, i)
+        # 子进程启动时继承环境变量, 在初始化 CUDA 之前就限定好显卡
+        os.environ["CUDA_VISIBLE_DEVICES"] = gpu
+        p = ctx.Process(target=target, args=(tag, queue) + args)
+        p.start()
+        procs.append((tag, p))
+    return procs
+
+
+def join_workers(procs):
+    failed = []
+    for tag, p in procs:
+        p.join()
+        if p.exitcode != 0:
+            failed.append(tag)
+    assert len(failed) == 0, "workers failed: %s" % failed
+
+
+def read_lines(path, header=None):
+    """已合并文件 -> {name: line}"""
+    lines = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf8") as f:
+            for line in f.read().strip("\n").split("\n"):
+                if line != "" and line != header:
+                    lines[line.split("\t")[0]] = line
+    return lines
+
+
+def merge(paths, path, names, existing, todo, header=None):
+    """旧结果去掉本次重算的条目, 并上各 worker 的新结果, 按 inp_text 的顺序原子写回"""
+    merged = {name: line for name, line in existing.items() if name not in todo}
+    for part_path in paths:
+        with open(part_path, "r", encoding="utf8") as f:
+            for line in f.read().strip("\n").split("\n"):
+                if line != "":
+                    merged[line.split("\t")[0]] = line
+    opt = [merged[name] for name in names if name in merged]
+    tmp_path = "%s.tmp" % path
+    with open(tmp_path, "w", encoding="utf8") as f:
+        f.write("\n".join(([] if header is None else [header]) + opt) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    for part_path in paths:
+        os.remove(part_path)
+    return opt
+
+
+if __name__ == "__main__":
+    from module.feature_store import open_features
+
+    os.makedirs(opt_dir, exist_ok=True)
+    for dir in [bert_dir, hubert_dir, wav32dir] + ([sv_cn_dir] if extract_sv else []):
+        os.makedirs(dir, exist_ok=True)
+    # 上次在合并前中断留下的未提交记录
+    discard(manifest_dir, "text")
+    discard(manifest_dir, "semantic")
+    manifest = Manifest(manifest_dir)
+    text_model = "%s|%s" % (version, model_id(bert_pretrained_dir))
+    audio_model = model_id(cnhubert_base_dir)
+    if extract_sv:
+        audio_model += "|%s" % model_id(sv_path)
+    semantic_model = model_id(pretrained_s2G)
+
+    items = parse_lines()
+    names = list(dict.fromkeys(item[0] for item in items))
+    semantic_header = "item_name\tsemantic_audio"
+    existing_text = read_lines(path_text)
+    existing_semantic = read_lines(path_semantic, semantic_header)
+    hubert_features = open_features(hubert_dir)
+    sv_features = open_features(sv_cn_dir) if extract_sv else None
+
+    text_items = []
+    audio_items = []
+    stat_writer = ManifestWriter(manifest_dir, "audio", "driver")
+    for wav_name, wav_path, language, text in items:
+        key = text_key(language, text)
+        if not (wav_name in existing_text and manifest.is_current("text", wav_name, key, text_model)):
+            text_items.append((wav_name, wav_path, language, text, key))
+
+        record = manifest.get("audio", wav_name)
+        key = None
+        if os.path.exists(wav_path):
+            key = manifest.audio_key(wav_name, wav_path)
+            if key is None and record is not None:
+                key = file_key(wav_path)  # 只是 touch 过的话内容哈希不变, 不必重算
+                if record["key"] == key:
+                    stat_writer.add(wav_name, key, record["model"], stat=file_stat(wav_path))
+        audio_ok = (
+            key is not None
+            and manifest.is_current("audio", wav_name, key, audio_model)
+            and wav_name in hubert_features
+            and (extract_sv == False or wav_name in sv_features)
+            and os.path.exists("%s/%s" % (wav32dir, wav_name))
+        )
+        semantic_ok = (
+            audio_ok
+            and wav_name in existing_semantic
+            and manifest.is_current("semantic", wav_name, key, semantic_model)
+        )
+        if audio_ok == False or semantic_ok == False:
+            audio_items.append((wav_name, wav_path, key, audio_ok == False, semantic_ok == False))
+    stat_writer.close()
+    text_todo = set(item[0] for item in text_items)
+    semantic_todo = set(item[0] for item in audio_items if item[4])
+    print(
+        "items: %s, text todo: %s, audio todo: %s, semantic todo: %s"
+        % (len(names), len(text_todo), sum(item[3] for item in audio_items), len(semantic_todo))
+    )
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = []
+    if len(text_items) > 0:
+        procs += start_workers(ctx, text_worker, gpu_numbers_text, "t", text_items, text_model)
+    # 语义 token 指定了别的卡时, 音频 worker 不算 token
+    split_semantic = gpu_numbers_semantic != gpu_numbers_audio
+    if split_semantic:
+        audio_phase_items = [item[:4] + (False,) for item in audio_items if item[3]]
+    else:
+        audio_phase_items = audio_items
+    if len(audio_phase_items) > 0:
+        load_vq = len(semantic_todo) > 0 and split_semantic == False
+        audio_procs = start_workers(
+            ctx, audio_worker, gpu_numbers_audio, "a", audio_phase_items, True, load_vq, audio_model, semantic_model
+        )
+        procs += audio_procs
+        if split_semantic:
+            join_workers(audio_procs)
+    if split_semantic and len(semantic_todo) > 0:
+        # 音频阶段写完的 hubert 特征和内容哈希
+        manifest = Manifest(manifest_dir)
+        hubert_features = open_features(hubert_dir)
+        semantic_items = []
+        for wav_name, wav_path, _, _, need_semantic in audio_items:
+            record = manifest.get("audio", wav_name)
+            if need_semantic and record is not None and wav_name in hubert_features:
+                semantic_items.append((wav_name, wav_path, record["key"], False, True))
+        if len(semantic_items) > 0:
+            procs += start_workers(
+                ctx, audio_worker, gpu_numbers_semantic, "s", semantic_items, False, True, audio_model, semantic_model
+            )
+    join_workers(procs)
+
+    text_parts = ["%s/2-name2text-%s.txt" % (opt_dir, tag) for tag, _ in procs if tag.startswith("t")]
+    opt = merge(text_parts, path_text, names, existing_text, text_todo)
+    assert len("".join(opt)) > 0, "1a failed"
+    commit(manifest_dir, "text")
+    semantic_parts = ["%s/6-name2semantic-%s.tsv" % (opt_dir, tag) for tag, _ in procs if tag[0] in "as"]
+    merge(semantic_parts, path_semantic, names, existing_semantic, semantic_todo, header=semantic_header)
+    commit(manifest_dir, "semantic")
+
+    manifest = Manifest(manifest_dir)
+    for stage in ["text", "audio", "semantic"]:
+        manifest.compact(stage)
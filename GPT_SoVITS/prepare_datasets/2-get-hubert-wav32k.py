@@ -17,8 +17,20 @@ cnhubert.cnhubert_base_path = os.environ.get("cnhubert_base_dir")
 import torch
 
 is_half = eval(os.environ.get("is_half", "True")) and torch.cuda.is_available()
+use_feature_store = eval(os.environ.get("feature_store", "False"))
+# 按有效音频总时长凑 batch, 同一 batch 内长度相近, 补零少
+batch_size = int(os.environ.get("hubert_batch_size", "16"))
+batch_seconds = float(os.environ.get("hubert_batch_seconds", "160"))
+decode_workers = int(os.environ.get("decode_workers", str(min(8, os.cpu_count() or 1))))
+# v2Pro: 顺便用这里已经解码好的波形算 sv embedding, 不用 2-get-sv.py 再读一遍
+extract_sv = eval(os.environ.get("extract_sv", "False"))
+sv_batch_size = int(os.environ.get("sv_batch_size", "16"))
+sv_max_pad_frames = int(os.environ.get("sv_max_pad_frames", "0"))
 
+import copy
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from scipy.io import wavfile
 import librosa
@@ -26,6 +38,7 @@ import librosa
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 from tools.my_utils import load_audio, clean_path
+from module.feature_store import FeatureStoreWriter, store_path
 
 # from config import cnhubert_base_path
 # cnhubert.cnhubert_base_path=cnhubert_base_path
@@ -56,6 +69,15 @@ wav32dir = "%s/5-wav32k" % (opt_dir)
 os.makedirs(opt_dir, exist_ok=True)
 os.makedirs(hubert_dir, exist_ok=True)
 os.makedirs(wav32dir, exist_ok=True)
+if use_feature_store:
+    hubert_store = FeatureStoreWriter(store_path(hubert_dir), i_part)
+if extract_sv:
+    from sv import SV
+
+    sv_cn_dir = "%s/7-sv_cn" % (opt_dir)
+    os.makedirs(sv_cn_dir, exist_ok=True)
+    if use_feature_store:
+        sv_store = FeatureStoreWriter(store_path(sv_cn_dir), i_part)
 
 maxx = 0.95
 alpha = 0.5
@@ -71,43 +93,134 @@ if is_half == True:
     model = model.half().to(device)
 else:
     model = model.to(device)
+if extract_sv:
+    sv_model = SV(device, is_half, os.environ.get("sv_path"))
+
+model_fp32 = None
+
+
+def get_model_fp32():
+    global model_fp32
+    if model_fp32 is None:
+        model_fp32 = copy.deepcopy(model).float()
+    return model_fp32
 
-nan_fails = []
 
+def is_done(wav_name):
+    if use_feature_store:
+        return wav_name in hubert_store
+    return os.path.exists("%s/%s.pt" % (hubert_dir, wav_name))
 
-def name2go(wav_name, wav_path):
-    hubert_path = "%s/%s.pt" % (hubert_dir, wav_name)
-    if os.path.exists(hubert_path):
-        return
+
+def decode(wav_name, wav_path):  # 在线程池里跑, ffmpeg 解码和重采样都不占主线程
     tmp_audio = load_audio(wav_path, 32000)
     tmp_max = np.abs(tmp_audio).max()
     if tmp_max > 2.2:
         print("%s-filtered,%s" % (wav_name, tmp_max))
-        return
+        return None
     tmp_audio32 = (tmp_audio / tmp_max * (maxx * alpha * 32768)) + ((1 - alpha) * 32768) * tmp_audio
     tmp_audio32b = (tmp_audio / tmp_max * (maxx * alpha * 1145.14)) + ((1 - alpha) * 1145.14) * tmp_audio
     tmp_audio = librosa.resample(tmp_audio32b, orig_sr=32000, target_sr=16000)  # 不是重采样问题
-    tensor_wav16 = torch.from_numpy(tmp_audio)
-    if is_half == True:
-        tensor_wav16 = tensor_wav16.half().to(device)
-    else:
-        tensor_wav16 = tensor_wav16.to(device)
-    ssl = model.model(tensor_wav16.unsqueeze(0))["last_hidden_state"].transpose(1, 2).cpu()  # torch.Size([1, 768, 215])
-    if np.isnan(ssl.detach().numpy()).sum() != 0:
-        nan_fails.append((wav_name, wav_path))
-        print("nan filtered:%s" % wav_name)
-        return
+    return wav_name, tmp_audio32, tmp_audio
+
+
+def decode_all(todo):
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        futures = deque()
+        for wav_name, wav_path in todo:
+            futures.append((wav_name, pool.submit(decode, wav_name, wav_path)))
+            if len(futures) >= decode_workers * 4:
+                yield futures.popleft()
+        while futures:
+            yield futures.popleft()
+
+
+def make_batches(items):
+    # 在一个窗口内按长度排序再切 batch, 兼顾补零量和内存
+    items = sorted(items, key=lambda item: len(item[2]))
+    batch = []
+    for item in items:
+        max_len = max(len(item[2]), len(batch[-1][2]) if batch else 0)
+        if batch and (len(batch) >= batch_size or max_len * (len(batch) + 1) > batch_seconds * 16000):
+            yield batch
+            batch = []
+        batch.append(item)
+    if batch:
+        yield batch
+
+
+def extract(hmodel, batch):
+    dtype = next(hmodel.parameters()).dtype
+    wav_lengths = torch.LongTensor([len(item[2]) for item in batch])
+    wavs = torch.zeros(len(batch), int(wav_lengths.max()))
+    for i, item in enumerate(batch):
+        wavs[i, : len(item[2])] = torch.from_numpy(item[2])
+    feats, feat_lengths = cnhubert.get_content_batch(hmodel, wavs.to(device, dtype), wav_lengths.to(device))
+    valid = torch.arange(feats.shape[-1], device=feats.device)[None] < feat_lengths[:, None]
+    # 只检查有效帧, 整个 batch 一次同步
+    nan_rows = (torch.isnan(feats) & valid[:, None]).flatten(1).any(1).tolist()
+    feat_lengths = feat_lengths.tolist()
+    return [
+        (item, feats[i : i + 1, :, : feat_lengths[i]].contiguous().cpu(), nan_rows[i]) for i, item in enumerate(batch)
+    ]  # torch.Size([1, 768, 215])
+
+
+def save(item, ssl):
+    wav_name, tmp_audio32, _ = item
     wavfile.write(
         "%s/%s" % (wav32dir, wav_name),
         32000,
         tmp_audio32.astype("int16"),
     )
-    my_save(ssl, hubert_path)
+    if use_feature_store:
+        hubert_store.add(wav_name, ssl)
+    else:
+        my_save(ssl, "%s/%s.pt" % (hubert_dir, wav_name))
+
+
+def save_sv(items):
+    # 与 2-get-sv.py 用 torchaudio.load 读回 5-wav32k 的 int16 结果一致
+    wavs = [torch.from_numpy(tmp_audio32.astype("int16")).float() / 32768 for _, tmp_audio32, _ in items]
+    embs = sv_model.compute_embedding_list(wavs, 32000, sv_batch_size, sv_max_pad_frames)
+    for (wav_name, _, _), emb in zip(items, embs):  # torch.Size([1, 20480])
+        if emb is None:  # 太短或单独计算也出错
+            print("sv filtered:%s" % wav_name)
+            continue
+        if use_feature_store:
+            sv_store.add(wav_name, emb)
+        else:
+            my_save(emb, "%s/%s.pt" % (sv_cn_dir, wav_name))
+
+
+def process(batch):
+    nan_fails = []
+    saved = []
+    for item, ssl, is_nan in extract(model, batch):
+        if is_nan:
+            nan_fails.append(item)
+        else:
+            save(item, ssl)
+            saved.append(item)
+    if len(nan_fails) > 0 and is_half == True:
+        # 只把出 nan 的那几条用 fp32 重跑
+        results = extract(get_model_fp32(), nan_fails)
+        nan_fails = []
+        for item, ssl, is_nan in results:
+            if is_nan:
+                nan_fails.append(item)
+            else:
+                save(item, ssl)
+                saved.append(item)
+    for item in nan_fails:
+        print("nan filtered:%s" % item[0])
+    if extract_sv and len(saved) > 0:
+        save_sv(saved)
 
 
 with open(inp_text, "r", encoding="utf8") as f:
     lines = f.read().strip("\n").split("\n")
 
+todo = []
 for line in lines[int(i_part) :: int(all_parts)]:
     try:
         # wav_name,text=line.split("\t")
@@ -120,15 +233,36 @@ for line in lines[int(i_part) :: int(all_parts)]:
         else:
             wav_path = wav_name
             wav_name = os.path.basename(wav_name)
-        name2go(wav_name, wav_path)
+        if is_done(wav_name) == False:
+            todo.append((wav_name, wav_path))
     except:
         print(line, traceback.format_exc())
 
-if len(nan_fails) > 0 and is_half == True:
-    is_half = False
-    model = model.float()
-    for wav in nan_fails:
+
+def run_window(window):
+    for batch in make_batches(window):
         try:
-            name2go(wav[0], wav[1])
+            process(batch)
         except:
-            print(wav_name, traceback.format_exc())
+            print([item[0] for item in batch], traceback.format_exc())
+
+
+window = []
+for wav_name, future in decode_all(todo):
+    try:
+        item = future.result()
+    except:
+        print(wav_name, traceback.format_exc())
+        continue
+    if item is None:
+        continue
+    window.append(item)
+    if len(window) >= batch_size * 8:
+        run_window(window)
+        window = []
+run_window(window)
+
+if use_feature_store:
+    hubert_store.close()
+    if extract_sv:
+        sv_store.close()
@@ -16,18 +16,24 @@ sv_path = os.environ.get("sv_path")
 import torch
 
 is_half = eval(os.environ.get("is_half", "True")) and torch.cuda.is_available()
+use_feature_store = eval(os.environ.get("feature_store", "False"))
+batch_size = int(os.environ.get("sv_batch_size", "16"))
+# 0: 同一 batch 的 fbank 帧数完全相同, 结果与逐条计算一致
+max_pad_frames = int(os.environ.get("sv_max_pad_frames", "0"))
+decode_workers = int(os.environ.get("decode_workers", str(min(8, os.cpu_count() or 1))))
 
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 import torchaudio
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 sys.path.append(f"{now_dir}/GPT_SoVITS/eres2net")
 from tools.my_utils import clean_path
+from module.feature_store import FeatureStoreWriter, store_path
 from time import time as ttime
 import shutil
-from ERes2NetV2 import ERes2NetV2
-import kaldi as Kaldi
+from sv import SV
 
 
 def my_save(fea, path):  #####fix issue: torch.save doesn't support chinese path
@@ -44,6 +50,8 @@ wav32dir = "%s/5-wav32k" % (opt_dir)
 os.makedirs(opt_dir, exist_ok=True)
 os.makedirs(sv_cn_dir, exist_ok=True)
 os.makedirs(wav32dir, exist_ok=True)
+if use_feature_store:
+    sv_store = FeatureStoreWriter(store_path(sv_cn_dir), i_part)
 
 maxx = 0.95
 alpha = 0.5
@@ -55,61 +63,65 @@ else:
     device = "cpu"
 
 
-class SV:
-    def __init__(self, device, is_half):
-        pretrained_state = torch.load(sv_path, map_location="cpu")
-        embedding_model = ERes2NetV2(baseWidth=24, scale=4, expansion=4)
-        embedding_model.load_state_dict(pretrained_state)
-        embedding_model.eval()
-        self.embedding_model = embedding_model
-        self.res = torchaudio.transforms.Resample(32000, 16000).to(device)
-        if is_half == False:
-            self.embedding_model = self.embedding_model.to(device)
-        else:
-            self.embedding_model = self.embedding_model.half().to(device)
-        self.is_half = is_half
-
-    def compute_embedding3(self, wav):  # (1,x)#-1~1
-        with torch.no_grad():
-            wav = self.res(wav)
-            if self.is_half == True:
-                wav = wav.half()
-            feat = torch.stack(
-                [Kaldi.fbank(wav0.unsqueeze(0), num_mel_bins=80, sample_frequency=16000, dither=0) for wav0 in wav]
-            )
-            sv_emb = self.embedding_model.forward3(feat)
-        return sv_emb
-
-
-sv = SV(device, is_half)
-
-
-def name2go(wav_name, wav_path):
-    sv_cn_path = "%s/%s.pt" % (sv_cn_dir, wav_name)
-    if os.path.exists(sv_cn_path):
-        return
-    wav_path = "%s/%s" % (wav32dir, wav_name)
-    wav32k, sr0 = torchaudio.load(wav_path)
+def is_done(wav_name):
+    if use_feature_store:
+        return wav_name in sv_store
+    return os.path.exists("%s/%s.pt" % (sv_cn_dir, wav_name))
+
+
+def load_wav(wav_name):
+    wav32k, sr0 = torchaudio.load("%s/%s" % (wav32dir, wav_name))
     assert sr0 == 32000
-    wav32k = wav32k.to(device)
-    emb = sv.compute_embedding3(wav32k).cpu()  # torch.Size([1, 20480])
-    my_save(emb, sv_cn_path)
+    return wav32k[0]
+
+
+def save(wav_name, emb):  # torch.Size([1, 20480])
+    if use_feature_store:
+        sv_store.add(wav_name, emb)
+    else:
+        my_save(emb, "%s/%s.pt" % (sv_cn_dir, wav_name))
+
+
+def name2go(names):
+    wavs = []
+    for wav_name, future in zip(names, [pool.submit(load_wav, wav_name) for wav_name in names]):
+        try:
+            wavs.append((wav_name, future.result()))
+        except:
+            print(wav_name, traceback.format_exc())
+    try:
+        embs = sv.compute_embedding_list([wav for _, wav in wavs], 32000, batch_size, max_pad_frames)
+    except:
+        print([wav_name for wav_name, _ in wavs], traceback.format_exc())
+        return
+    for (wav_name, _), emb in zip(wavs, embs):
+        if emb is None:  # 太短或单独计算也出错
+            print("sv filtered:%s" % wav_name)
+            continue
+        save(wav_name, emb)
 
 
 with open(inp_text, "r", encoding="utf8") as f:
     lines = f.read().strip("\n").split("\n")
 
+todo = []
 for line in lines[int(i_part) :: int(all_parts)]:
     try:
         wav_name, spk_name, language, text = line.split("|")
         wav_name = clean_path(wav_name)
-        if inp_wav_dir != "" and inp_wav_dir != None:
-            wav_name = os.path.basename(wav_name)
-            wav_path = "%s/%s" % (inp_wav_dir, wav_name)
-
-        else:
-            wav_path = wav_name
-            wav_name = os.path.basename(wav_name)
-        name2go(wav_name, wav_path)
+        wav_name = os.path.basename(wav_name)
+        # 2-get-hubert-wav32k.py 开了 extract_sv 时大部分已经算过了
+        if is_done(wav_name) == False and os.path.exists("%s/%s" % (wav32dir, wav_name)):
+            todo.append(wav_name)
     except:
         print(line, traceback.format_exc())
+
+if len(todo) > 0:
+    sv = SV(device, is_half, sv_path)
+    window = batch_size * 8
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        for i in range(0, len(todo), window):
+            name2go(todo[i : i + window])
+
+if use_feature_store:
+    sv_store.close()
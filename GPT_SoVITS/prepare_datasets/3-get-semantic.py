@@ -9,23 +9,13 @@ if "_CUDA_VISIBLE_DEVICES" in os.environ:
 opt_dir = os.environ.get("opt_dir")
 pretrained_s2G = os.environ.get("pretrained_s2G")
 s2config_path = os.environ.get("s2config_path")
+use_feature_store = eval(os.environ.get("feature_store", "False"))
+batch_size = int(os.environ.get("semantic_batch_size", "64"))
 
 if os.path.exists(pretrained_s2G):
     ...
 else:
     raise FileNotFoundError(pretrained_s2G)
-# version=os.environ.get("version","v2")
-size = os.path.getsize(pretrained_s2G)
-if size < 82978 * 1024:
-    version = "v1"
-elif size < 100 * 1024 * 1024:
-    version = "v2"
-elif size < 103520 * 1024:
-    version = "v1"
-elif size < 700 * 1024 * 1024:
-    version = "v2"
-else:
-    version = "v3"
 import torch
 
 is_half = eval(os.environ.get("is_half", "True")) and torch.cuda.is_available()
@@ -35,13 +25,13 @@ import sys
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 import logging
+import numpy as np
 import utils
 
-if version != "v3":
-    from module.models import SynthesizerTrn
-else:
-    from module.models import SynthesizerTrnV3 as SynthesizerTrn
+from module.models import SemanticExtractor
 from tools.my_utils import clean_path
+from module.feature_store import FeatureStoreWriter, open_features, store_path
+from module.prep_manifest import model_id
 
 logging.getLogger("numba").setLevel(logging.WARNING)
 # from config import pretrained_s2G
@@ -56,6 +46,8 @@ logging.getLogger("numba").setLevel(logging.WARNING)
 
 hubert_dir = "%s/4-cnhubert" % (opt_dir)
 semantic_path = "%s/6-name2semantic-%s.tsv" % (opt_dir, i_part)
+# token 库: int16 数组 + 偏移索引, 各 part 写到同一目录, Text2SemanticDataset 直接读
+semantic_store_dir = store_path("%s/6-name2semantic" % (opt_dir))
 if os.path.exists(semantic_path) == False:
     os.makedirs(opt_dir, exist_ok=True)
 
@@ -66,43 +58,60 @@ if os.path.exists(semantic_path) == False:
     else:
         device = "cpu"
     hps = utils.get_hparams_from_file(s2config_path)
-    vq_model = SynthesizerTrn(
-        hps.data.filter_length // 2 + 1,
-        hps.train.segment_size // hps.data.hop_length,
-        n_speakers=hps.data.n_speakers,
-        version=version,
-        **hps.model,
+    # 只需要 ssl_proj + quantizer, 不实例化整个 SynthesizerTrn
+    vq_model = SemanticExtractor(hps.model.semantic_frame_rate)
+    print(
+        vq_model.load_from_synthesizer(torch.load(pretrained_s2G, map_location="cpu", weights_only=False)["weight"])
     )
     if is_half == True:
         vq_model = vq_model.half().to(device)
     else:
         vq_model = vq_model.to(device)
     vq_model.eval()
-    # utils.load_checkpoint(utils.latest_checkpoint_path(hps.s2_ckpt_dir, "G_*.pth"), vq_model, None, True)
-    # utils.load_checkpoint(pretrained_s2G, vq_model, None, True)
-    print(
-        vq_model.load_state_dict(
-            torch.load(pretrained_s2G, map_location="cpu", weights_only=False)["weight"], strict=False
-        )
-    )
 
-    def name2go(wav_name, lines):
-        hubert_path = "%s/%s.pt" % (hubert_dir, wav_name)
-        if os.path.exists(hubert_path) == False:
-            return
-        ssl_content = torch.load(hubert_path, map_location="cpu")
+    hubert_features = open_features(hubert_dir)
+    if use_feature_store:
+        semantic_store = FeatureStoreWriter(semantic_store_dir, i_part, align=2)
+        # 换了 s2G 底模 (量化器) 后库里的旧 token 不能沿用, 按模型指纹判断
+        semantic_model = model_id(pretrained_s2G)
+
+    def extract(batch, results):
+        ssl_lengths = torch.LongTensor([ssl.shape[-1] for name, ssl in batch])
+        ssl_content = torch.zeros(len(batch), batch[0][1].shape[1], int(ssl_lengths.max()))
+        for i, (name, ssl) in enumerate(batch):
+            ssl_content[i, :, : ssl.shape[-1]] = ssl[0]
         if is_half == True:
             ssl_content = ssl_content.half().to(device)
         else:
             ssl_content = ssl_content.to(device)
-        codes = vq_model.extract_latent(ssl_content)
-        semantic = " ".join([str(i) for i in codes[0, 0, :].tolist()])
-        lines.append("%s\t%s" % (wav_name, semantic))
+        with torch.no_grad():
+            codes = vq_model(ssl_content)
+        # 整个 batch 只拷回一次
+        codes = codes.cpu().numpy().astype(np.int16)
+        lengths = vq_model.get_lengths(ssl_lengths).tolist()
+        for i, (name, ssl) in enumerate(batch):
+            results[name] = codes[i, : lengths[i]]
+
+    def name2go(names, results):
+        ssl_list = []
+        for name in names:
+            try:
+                ssl_list.append((name, hubert_features.load(name)))
+            except:
+                print(name, traceback.format_exc())
+        # 按长度排序再切 batch, 补零少
+        ssl_list.sort(key=lambda item: item[1].shape[-1])
+        for i in range(0, len(ssl_list), batch_size):
+            batch = ssl_list[i : i + batch_size]
+            try:
+                extract(batch, results)
+            except:
+                print([name for name, ssl in batch], traceback.format_exc())
 
     with open(inp_text, "r", encoding="utf8") as f:
         lines = f.read().strip("\n").split("\n")
 
-    lines1 = []
+    todo = []
     for line in lines[int(i_part) :: int(all_parts)]:
         # print(line)
         try:
@@ -110,9 +119,28 @@ if os.path.exists(semantic_path) == False:
             wav_name, spk_name, language, text = line.split("|")
             wav_name = clean_path(wav_name)
             wav_name = os.path.basename(wav_name)
-            # name2go(name,lines1)
-            name2go(wav_name, lines1)
+            if wav_name in hubert_features:
+                todo.append(wav_name)
         except:
             print(line, traceback.format_exc())
+
+    lines1 = []
+    window = batch_size * 4  # 按窗口读 hubert 特征, 不一次性全部载入内存
+    for i in range(0, len(todo), window):
+        names = todo[i : i + window]
+        if use_feature_store:
+            names = [name for name in names if not semantic_store.is_current(name, model=semantic_model)]
+        results = {}
+        name2go(names, results)
+        for name in todo[i : i + window]:
+            if use_feature_store:
+                if name in results:
+                    semantic_store.add(name, results[name], model=semantic_model)
+                if semantic_store.is_current(name, model=semantic_model):
+                    lines1.append(name)  # token 在库里, tsv 只记名字
+            elif name in results:
+                lines1.append("%s\t%s" % (name, " ".join(map(str, results[name].tolist()))))
+    if use_feature_store:
+        semantic_store.close()
     with open(semantic_path, "w", encoding="utf8") as f:
         f.write("\n".join(lines1))
@@ -1,20 +1,20 @@
+import json
+import re
 import traceback
 from collections import OrderedDict
-from time import time as ttime
-import shutil
 import os
+import sys
 import torch
+
+sys.path.append(os.getcwd())  # 直接运行本文件时(在仓库根目录下)也能找到 tools
+from module.ckpt_writer import save_async, write_checkpoint
 from tools.i18n.i18n import I18nAuto
 
 i18n = I18nAuto()
 
 
 def my_save(fea, path):  #####fix issue: torch.save doesn't support chinese path
-    dir = os.path.dirname(path)
-    name = os.path.basename(path)
-    tmp_path = "%s.pth" % (ttime())
-    torch.save(fea, tmp_path)
-    shutil.move(tmp_path, "%s/%s" % (dir, name))
+    write_checkpoint(fea, path)
 
 
 from io import BytesIO
@@ -28,14 +28,8 @@ model_version2byte = {
 
 
 def my_save2(fea, path, model_version):
-    bio = BytesIO()
-    torch.save(fea, bio)
-    bio.seek(0)
-    data = bio.getvalue()
-    byte = model_version2byte[model_version]
-    data = byte + data[2:]
-    with open(path, "wb") as f:
-        f.write(data)
+    # 写完后把开头的 b"PK" 改成版本号, 不再整份复制到内存里
+    write_checkpoint(fea, path, header=model_version2byte[model_version])
 
 
 def savee(ckpt, name, epoch, steps, hps, model_version=None, lora_rank=None):
@@ -50,11 +44,11 @@ def savee(ckpt, name, epoch, steps, hps, model_version=None, lora_rank=None):
         opt["info"] = "%sepoch_%siteration" % (epoch, steps)
         if lora_rank:
             opt["lora_rank"] = lora_rank
-            my_save2(opt, "%s/%s.pth" % (hps.save_weight_dir, name), model_version)
-        elif model_version != None and "Pro" in model_version:
-            my_save2(opt, "%s/%s.pth" % (hps.save_weight_dir, name), model_version)
-        else:
-            my_save(opt, "%s/%s.pth" % (hps.save_weight_dir, name))
+        header = None
+        if lora_rank or (model_version != None and "Pro" in model_version):
+            header = model_version2byte[model_version]
+        # 拷到 CPU 后就返回, 写盘失败会在后台线程里打印
+        save_async(opt, "%s/%s.pth" % (hps.save_weight_dir, name), header=header, slot="savee")
         return "Success."
     except:
         return traceback.format_exc()
@@ -98,6 +92,12 @@ def get_hash_from_file(sovits_path):
 
 
 def get_sovits_version_from_path_fast(sovits_path):
+    ###0-safetensors weights, by metadata
+    if is_safetensors(sovits_path):
+        meta = read_safetensors_metadata(sovits_path)
+        if "model_version" in meta:
+            return meta["version"], meta["model_version"], meta["if_lora_v3"] == "true"
+        return head2version[meta["head"].encode()]  # 早期导出的文件只有 head
     ###1-if it is pretrained sovits models, by hash
     hash = get_hash_from_file(sovits_path)
     if hash in hash_pretrained_dict:
@@ -127,12 +127,206 @@ def get_sovits_version_from_path_fast(sovits_path):
 
 
 def load_sovits_new(sovits_path):
-    f = open(sovits_path, "rb")
-    meta = f.read(2)
-    if meta != b"PK":
-        data = b"PK" + f.read()
-        bio = BytesIO()
-        bio.write(data)
-        bio.seek(0)
-        return torch.load(bio, map_location="cpu", weights_only=False)
+    if is_safetensors(sovits_path):
+        return load_safetensors_weights(sovits_path)
+    with open(sovits_path, "rb") as f:
+        meta = f.read(2)
+        if meta != b"PK":
+            data = b"PK" + f.read()
+            bio = BytesIO()
+            bio.write(data)
+            bio.seek(0)
+            return torch.load(bio, map_location="cpu", weights_only=False)
     return torch.load(sovits_path, map_location="cpu", weights_only=False)
+
+
+def load_t2s_weights(gpt_path, map_location="cpu"):
+    if is_safetensors(gpt_path):
+        return load_safetensors_weights(gpt_path, map_location)
+    return torch.load(gpt_path, map_location=map_location, weights_only=False)
+
+
+"""
+safetensors 权重: 张量按 mmap 读取, 不经过 pickle; 原来 .pth/.ckpt 里的其他内容放在头部的 metadata 里
+    version, model_version, if_lora_v3: SoVITS 的版本三元组 (get_sovits_version_from_path_fast 的返回值), GPT 权重没有;
+        不是每个三元组都有对应的版本字节码 (如 v4 底模), 所以直接存三元组. 早期导出的文件存的是 head (版本字节码)
+    config: json 格式的训练配置(hps / s1 yaml)
+    info, lora_rank: 同 .pth
+"""
+
+
+def is_safetensors(path):
+    return path.endswith(".safetensors")
+
+
+def read_safetensors_metadata(path):
+    """只读 json 头, 不碰张量数据"""
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))
+    return header.get("__metadata__", {})
+
+
+def load_safetensors_weights(path, device="cpu"):
+    """返回与 torch.load 出来的 .pth/.ckpt 同样结构的 dict; device 不是 cpu 时张量直接读到 device 上"""
+    from safetensors.torch import load_file
+
+    meta = read_safetensors_metadata(path)
+    dict_weights = {
+        "weight": load_file(path, device=str(device)),
+        "config": json.loads(meta["config"]),
+        "info": meta.get("info", ""),
+    }
+    if "lora_rank" in meta:
+        dict_weights["lora_rank"] = int(meta["lora_rank"])
+    return dict_weights
+
+
+def _to_plain(obj):
+    # 旧权重里的 config 可能是 utils.HParams
+    if hasattr(obj, "items"):
+        return {k: _to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_plain(v) for v in obj]
+    return obj
+
+
+def export_safetensors(path, out_path=None):
+    """.pth(SoVITS) / .ckpt(GPT) 转成 safetensors, 默认写在同目录下"""
+    from safetensors.torch import save_file
+
+    if out_path is None:
+        out_path = os.path.splitext(path)[0] + ".safetensors"
+    meta = {"format": "gpt-sovits"}
+    if path.endswith(".ckpt"):
+        dict_weights = load_t2s_weights(path)
+    else:
+        version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(path)
+        meta["version"] = version
+        meta["model_version"] = model_version
+        meta["if_lora_v3"] = "true" if if_lora_v3 else "false"
+        dict_weights = load_sovits_new(path)
+    meta["config"] = json.dumps(_to_plain(dict_weights["config"]), ensure_ascii=False)
+    meta["info"] = str(dict_weights.get("info", ""))
+    if "lora_rank" in dict_weights:
+        meta["lora_rank"] = str(dict_weights["lora_rank"])
+    weights = {key: value.contiguous() for key, value in dict_weights["weight"].items()}
+    tmp_path = out_path + ".tmp"
+    save_file(weights, tmp_path, metadata=meta)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+"""
+v3/v4 LoRA: 第一次加载时用 peft 把 LoRA 合并进 cfm, 合并后的 cfm 权重(fp32)按 (底模, LoRA) 的指纹缓存到
+LoRA 所在目录的 .lora_merged/ 下, 之后直接读缓存, 推理时不再需要 peft.
+每个 LoRA 文件在缓存里占一份完整的 fp32 cfm (几百 MB); 同一个 LoRA 文件只保留最新指纹的那份,
+重新保存或换了底模时旧的会被删掉. 不再用的 LoRA 的缓存需要手动删除 .lora_merged/ 下对应的文件
+"""
+LORA_CACHE_DIR = ".lora_merged"
+
+
+def lora_cache_path(base_path, lora_path):
+    from module.prep_manifest import model_id
+
+    key = hashlib.sha1(("%s|%s" % (model_id(base_path), model_id(lora_path))).encode("utf8")).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(lora_path))[0]
+    return os.path.join(os.path.dirname(lora_path), LORA_CACHE_DIR, "%s-%s.safetensors" % (name, key))
+
+
+def merge_lora(vits_model, dict_lora):
+    from peft import LoraConfig, get_peft_model
+
+    lora_rank = dict_lora["lora_rank"]
+    lora_config = LoraConfig(
+        target_modules=["to_k", "to_q", "to_v", "to_out.0"],
+        r=lora_rank,
+        lora_alpha=lora_rank,
+        init_lora_weights=True,
+    )
+    vits_model.cfm = get_peft_model(vits_model.cfm, lora_config)
+    vits_model.load_state_dict(dict_lora["weight"], strict=False)
+    vits_model.cfm = vits_model.cfm.merge_and_unload()
+
+
+def remove_stale_lora_cache(cache_path):
+    """删掉同一个 LoRA 文件旧指纹的缓存 (<name>-<16 位十六进制 key>.safetensors)"""
+    cache_dir, current = os.path.split(cache_path)
+    pattern = re.compile(re.escape(current[: -len("0123456789abcdef.safetensors")]) + r"[0-9a-f]{16}\.safetensors")
+    for file in os.listdir(cache_dir):
+        if file != current and pattern.fullmatch(file):
+            try:
+                os.remove(os.path.join(cache_dir, file))
+            except OSError:
+                pass
+
+
+def load_lora_merged(vits_model, base_path, lora_path, dict_lora):
+    """vits_model 已加载 base_path 的底模权重; 返回是否命中缓存"""
+    from safetensors.torch import load_file, save_file
+
+    cache_path = lora_cache_path(base_path, lora_path)
+    if os.path.exists(cache_path):
+        # LoRA 文件里 cfm 以外的权重照常加载, cfm 的 LoRA 权重(peft 的 key)会被忽略
+        vits_model.load_state_dict(dict_lora["weight"], strict=False)
+        vits_model.cfm.load_state_dict(load_file(cache_path))
+        return True
+    merge_lora(vits_model, dict_lora)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        weights = {key: value.detach().float().cpu().contiguous() for key, value in vits_model.cfm.state_dict().items()}
+        save_file(weights, cache_path + ".tmp", metadata={"base": base_path, "lora": lora_path})
+        os.replace(cache_path + ".tmp", cache_path)
+        remove_stale_lora_cache(cache_path)
+    except OSError:
+        print("failed to cache merged LoRA weights to %s\n%s" % (cache_path, traceback.format_exc()))
+    return False
+
+
+def precompute_lora(lora_path, base_path=None):
+    """merge_lora 命令: 在 cpu 上合并一次并写缓存, 底模默认用 config.pretrained_sovits_name"""
+    from module.models import SynthesizerTrnV3
+
+    version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(lora_path)
+    assert if_lora_v3, "%s is not a v3/v4 LoRA checkpoint" % lora_path
+    if base_path is None:
+        from config import pretrained_sovits_name
+
+        base_path = pretrained_sovits_name[model_version]
+    dict_lora = load_sovits_new(lora_path)
+    hps = _to_plain(dict_lora["config"])
+    hps["model"]["semantic_frame_rate"] = "25hz"
+    hps["model"]["version"] = model_version
+    vits_model = SynthesizerTrnV3(
+        hps["data"]["filter_length"] // 2 + 1,
+        hps["train"]["segment_size"] // hps["data"]["hop_length"],
+        n_speakers=hps["data"]["n_speakers"],
+        **hps["model"],
+    )
+    vits_model.load_state_dict(load_sovits_new(base_path)["weight"], strict=False)
+    load_lora_merged(vits_model, base_path, lora_path, dict_lora)
+    return lora_cache_path(base_path, lora_path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="GPT-SoVITS weight tools (run from the repository root)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_st = subparsers.add_parser("safetensors", help="convert .pth / .ckpt weights to .safetensors")
+    parser_st.add_argument("paths", nargs="+")
+    parser_lora = subparsers.add_parser("merge_lora", help="precompute the merged-LoRA cache of v3/v4 LoRA weights")
+    parser_lora.add_argument("paths", nargs="+")
+    parser_lora.add_argument("--base", default=None, help="base SoVITS weights, default: the v3/v4 pretrained model")
+    args = parser.parse_args()
+
+    if args.command == "safetensors":
+        for path in args.paths:
+            print("%s -> %s" % (path, export_safetensors(path)))
+    elif args.command == "merge_lora":
+        for path in args.paths:
+            print("%s -> %s" % (path, precompute_lora(path, args.base)))
+
+
+if __name__ == "__main__":
+    main()
@@ -394,15 +394,15 @@ def train_and_evaluate(rank, epoch, hps, nets, optims, schedulers, scaler, loade
                     stats_ssl,
                 ) = net_g(ssl, spec, spec_lengths, text, text_lengths)
 
-            mel = spec_to_mel_torch(
-                spec,
+            # mel 逐帧由 spec 算出, 先切片再转 mel, 结果相同, 不用每步算整段
+            y_mel = spec_to_mel_torch(
+                commons.slice_segments(spec, ids_slice, hps.train.segment_size // hps.data.hop_length),
                 hps.data.filter_length,
                 hps.data.n_mel_channels,
                 hps.data.sampling_rate,
                 hps.data.mel_fmin,
                 hps.data.mel_fmax,
             )
-            y_mel = commons.slice_segments(mel, ids_slice, hps.train.segment_size // hps.data.hop_length)
             y_hat_mel = mel_spectrogram_torch(
                 y_hat.squeeze(1),
                 hps.data.filter_length,
@@ -432,7 +432,8 @@ def train_and_evaluate(rank, epoch, hps, nets, optims, schedulers, scaler, loade
 
         with autocast(enabled=hps.train.fp16_run):
             # Generator
-            y_d_hat_r, y_d_hat_g, fmap_r, fmap_g = net_d(y, y_hat)
+            # 真实音频这一支只作为 feature loss 的目标(会被 detach), 不需要建计算图
+            y_d_hat_r, y_d_hat_g, fmap_r, fmap_g = net_d(y, y_hat, grad_real=False)
             with autocast(enabled=False):
                 loss_mel = F.l1_loss(y_mel, y_hat_mel) * hps.train.c_mel
                 loss_kl = kl_loss(z_p, logs_q, m_p, logs_p, z_mask) * hps.train.c_kl
@@ -480,6 +481,15 @@ def train_and_evaluate(rank, epoch, hps, nets, optims, schedulers, scaler, loade
                 # scalar_dict.update({"loss/d_r/{}".format(i): v for i, v in enumerate(losses_disc_r)})
                 # scalar_dict.update({"loss/d_g/{}".format(i): v for i, v in enumerate(losses_disc_g)})
                 image_dict = None
+                with torch.no_grad():
+                    mel = spec_to_mel_torch(
+                        spec[:1],
+                        hps.data.filter_length,
+                        hps.data.n_mel_channels,
+                        hps.data.sampling_rate,
+                        hps.data.mel_fmin,
+                        hps.data.mel_fmax,
+                    )
                 try:  ###Some people installed the wrong version of matplotlib.
                     image_dict = {
                         "slice/mel_org": utils.plot_spectrogram_to_numpy(
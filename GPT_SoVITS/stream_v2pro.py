@@ -76,7 +76,7 @@ class StreamT2SModel(nn.Module):
         logits = self.t2s.ar_predict_layer(xy_dec[:, -1])
         logits = logits[:, :-1]
         samples = sample(
-            logits, y, top_k=top_k, top_p=1, repetition_penalty=1.35, temperature=1.0
+            logits, y, top_k=top_k, top_p=1.0, repetition_penalty=1.35, temperature=1.0
         )[0]
         y = torch.concat([y, samples], dim=1)
         y_emb: Tensor = self.t2s.ar_audio_embedding(y[:, -1:])
@@ -112,7 +112,7 @@ class StreamT2SModel(nn.Module):
             logits = logits[:, :-1]
 
         samples = sample(
-            logits, y, top_k=top_k, top_p=1, repetition_penalty=1.35, temperature=1.0
+            logits, y, top_k=top_k, top_p=1.0, repetition_penalty=1.35, temperature=1.0
         )[0]
 
         y = torch.concat([y, samples], dim=1)
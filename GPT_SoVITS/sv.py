@@ -1,6 +1,8 @@
 import sys
 import os
+import traceback
 import torch
+import torchaudio
 
 sys.path.append(f"{os.getcwd()}/GPT_SoVITS/eres2net")
 sv_path = "GPT_SoVITS/pretrained_models/sv/pretrained_eres2netv2w24s4ep4.ckpt"
@@ -8,8 +10,32 @@ from ERes2NetV2 import ERes2NetV2
 import kaldi as Kaldi
 
 
+def get_fbank_frames(length):  # 16k 下 kaldi fbank 的帧数, 25ms 窗 10ms 移
+    return 1 + (length - 400) // 160
+
+
+def bucket_by_frames(lengths, batch_size, max_pad_frames=0):
+    """
+    lengths: 每条 16k 音频的采样点数, 返回按 fbank 帧数分好的下标列表.
+    max_pad_frames=0 时同一 batch 帧数完全相同, 结果与逐条计算一致;
+    放宽后补零帧会经卷积影响尾部几帧, embedding 有微小差异
+    """
+    frames = [get_fbank_frames(length) for length in lengths]
+    order = sorted(range(len(lengths)), key=lambda i: frames[i])
+    buckets = []
+    bucket = []
+    for i in order:
+        if bucket and (len(bucket) >= batch_size or frames[i] - frames[bucket[0]] > max_pad_frames):
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
 class SV:
-    def __init__(self, device, is_half):
+    def __init__(self, device, is_half, sv_path=sv_path):
         pretrained_state = torch.load(sv_path, map_location="cpu", weights_only=False)
         embedding_model = ERes2NetV2(baseWidth=24, scale=4, expansion=4)
         embedding_model.load_state_dict(pretrained_state)
@@ -20,6 +46,8 @@ class SV:
         else:
             self.embedding_model = self.embedding_model.half().to(device)
         self.is_half = is_half
+        self.device = device
+        self.resamplers = {}
 
     def compute_embedding3(self, wav):
         with torch.no_grad():
@@ -30,3 +58,56 @@ class SV:
             )
             sv_emb = self.embedding_model.forward3(feat)
         return sv_emb
+
+    def compute_embedding_batch(self, wavs, lengths, sr=16000):
+        """
+        wavs: (B, T) 右侧补零, lengths: (B,) 有效采样点数, sr 不是 16k 时先在 device 上重采样.
+        重采样和 fbank 都只依赖各自窗口内的采样点, 补零不影响有效部分
+        """
+        with torch.no_grad():
+            wavs = wavs.to(self.device)
+            lengths = lengths.to(self.device)
+            if sr != 16000:
+                if sr not in self.resamplers:
+                    self.resamplers[sr] = torchaudio.transforms.Resample(sr, 16000).to(self.device)
+                wavs = self.resamplers[sr](wavs.float())
+                lengths = (lengths * 16000 + sr - 1) // sr
+            if self.is_half == True:
+                wavs = wavs.half()
+            else:
+                wavs = wavs.float()
+            feat, num_frames = Kaldi.fbank_batch(wavs, lengths, num_mel_bins=80, sample_frequency=16000, dither=0)
+            sv_emb = self.embedding_model.forward3(feat, num_frames)
+        return sv_emb
+
+    def compute_embedding_list(self, wavs, sr=16000, batch_size=16, max_pad_frames=0):
+        """
+        wavs: 一维波形列表, 按 fbank 帧数分桶后批量计算, 按输入顺序返回 (1, 20480) 的 embedding.
+        不足一个 fbank 窗的音频和单独计算也出错的音频返回 None, 不影响同批的其他音频
+        """
+        lengths = [(len(wav) * 16000 + sr - 1) // sr for wav in wavs]
+        embs = [None] * len(wavs)
+        valid = [i for i in range(len(wavs)) if get_fbank_frames(lengths[i]) >= 1]
+        for bucket in bucket_by_frames([lengths[i] for i in valid], batch_size, max_pad_frames):
+            bucket = [valid[i] for i in bucket]
+            try:
+                sv_emb = self._embedding_bucket(wavs, bucket, sr)
+            except:
+                # 整批失败时逐条重算, 只丢掉真正出错的那条
+                print("sv batch failed, retry one by one:", traceback.format_exc())
+                for i in bucket:
+                    try:
+                        embs[i] = self._embedding_bucket(wavs, [i], sr)[0:1].clone()
+                    except:
+                        print("sv failed on item %d:" % i, traceback.format_exc())
+                continue
+            for j, i in enumerate(bucket):
+                embs[i] = sv_emb[j : j + 1].clone()
+        return embs
+
+    def _embedding_bucket(self, wavs, bucket, sr):
+        batch_lengths = torch.LongTensor([len(wavs[i]) for i in bucket])
+        batch = torch.zeros(len(bucket), int(batch_lengths.max()))
+        for j, i in enumerate(bucket):
+            batch[j, : len(wavs[i])] = wavs[i]
+        return self.compute_embedding_batch(batch, batch_lengths, sr).cpu()
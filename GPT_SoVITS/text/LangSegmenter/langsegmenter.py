@@ -66,6 +66,37 @@ def split_jako(tag_lang,item):
     return lang_list
 
 
+# 无需语种检测即可判定的输入: 纯 ASCII 英文 / 不含假名谚文拉丁字母的纯汉字
+ascii_letter_pattern = re.compile(r'[A-Za-z]')
+digit_pattern = re.compile(r'[0-9]')
+full_ascii_pattern = re.compile(r'^[\x00-\x7F]+$')
+full_han_pattern = re.compile(
+    r'^[\u4E00-\u9FFF\u3400-\u4DBF\u3000-\u3040\uFF01-\uFF20\uFF5B-\uFF65\u2010-\u2027'
+    r'0-9\s!-/:-@\[-`{-~]+$'
+)
+han_pattern = re.compile(r'[\u4E00-\u9FFF\u3400-\u4DBF]')
+
+
+def fast_path(text, default_lang = ""):
+    """
+    单一文字体系的输入直接给出结果, 跳过 LangSplitter; 无法判定时返回 None
+    """
+    if not text:
+        return None
+    if ascii_letter_pattern.search(text) is None:
+        # 指定语种且不含英文字母时, 只可能得到一个 default_lang 段
+        if default_lang != "":
+            return [{'lang':default_lang,'text':text}]
+        if han_pattern.search(text) and full_han_pattern.match(text):
+            return [{'lang':'zh','text':text}]
+        return None
+    if full_ascii_pattern.match(text):
+        # 指定语种时数字会被归为 default_lang, 交给完整流程
+        if default_lang == "" or digit_pattern.search(text) is None:
+            return [{'lang':'en','text':text}]
+    return None
+
+
 def merge_lang(lang_list, item):
     if lang_list and item['lang'] == lang_list[-1]['lang']:
         lang_list[-1]['text'] += item['text']
@@ -88,9 +119,13 @@ class LangSegmenter():
     }
 
     def getTexts(text,default_lang = ""):
-        lang_splitter = LangSplitter(lang_map=LangSegmenter.DEFAULT_LANG_MAP)
-        lang_splitter.merge_across_digit = False
-        substr = lang_splitter.split_by_lang(text=text)
+        lang_list = fast_path(text,default_lang)
+        if lang_list is not None:
+            return lang_list
+        return LangSegmenter.splitTexts(text,default_lang)
+
+    def splitTexts(text,default_lang = ""):
+        substr = get_lang_splitter().split_by_lang(text=text)
 
         lang_list: list[dict] = []
 
@@ -213,6 +248,18 @@ class LangSegmenter():
         return lang_list
     
 
+lang_splitter = None
+
+
+def get_lang_splitter():
+    # LangSplitter 构造开销较大, 全局复用一个实例
+    global lang_splitter
+    if lang_splitter is None:
+        lang_splitter = LangSplitter(lang_map=LangSegmenter.DEFAULT_LANG_MAP)
+        lang_splitter.merge_across_digit = False
+    return lang_splitter
+
+
 if __name__ == "__main__":
     text = "MyGO?,你也喜欢まいご吗？"
     print(LangSegmenter.getTexts(text))
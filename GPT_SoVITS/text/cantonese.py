@@ -91,21 +91,26 @@ rep_map = {
     "」": "'",
 }
 
+rep_multi = [(k, v) for k, v in rep_map.items() if len(k) > 1]
+rep_table = str.maketrans({k: v for k, v in rep_map.items() if len(k) == 1})
+punctuation_filter_pattern = re.compile(r"[^\u4e00-\u9fa5" + "".join(punctuation) + r"]+")
+
+text_normalizer = TextNormalizer()
+
 
 def replace_punctuation(text):
     # text = text.replace("嗯", "恩").replace("呣", "母")
-    pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
-
-    replaced_text = pattern.sub(lambda x: rep_map[x.group()], text)
+    for k, v in rep_multi:
+        text = text.replace(k, v)
+    replaced_text = text.translate(rep_table)
 
-    replaced_text = re.sub(r"[^\u4e00-\u9fa5" + "".join(punctuation) + r"]+", "", replaced_text)
+    replaced_text = punctuation_filter_pattern.sub("", replaced_text)
 
     return replaced_text
 
 
 def text_normalize(text):
-    tx = TextNormalizer()
-    sentences = tx.normalize(text)
+    sentences = text_normalizer.normalize(text)
     dest_text = ""
     for sentence in sentences:
         dest_text += replace_punctuation(sentence)
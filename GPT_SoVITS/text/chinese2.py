@@ -31,12 +31,26 @@ if is_g2pw:
     from text.g2pw import G2PWPinyin, correct_pronunciation
 
     parent_directory = os.path.dirname(current_file_path)
-    g2pw = G2PWPinyin(
-        model_dir="GPT_SoVITS/text/G2PWModel",
-        model_source=os.environ.get("bert_path", "GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large"),
-        v_to_u=False,
-        neutral_tone_with_five=True,
-    )
+
+# g2pw 的 onnx 模型与分词器在第一次做中文 g2p 时才加载
+g2pw = None
+
+
+def get_g2pw():
+    global g2pw
+    if g2pw is None:
+        g2pw = G2PWPinyin(
+            model_dir="GPT_SoVITS/text/G2PWModel",
+            model_source=os.environ.get("bert_path", "GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large"),
+            v_to_u=False,
+            neutral_tone_with_five=True,
+        )
+    return g2pw
+
+
+def preload():
+    if is_g2pw:
+        get_g2pw()
 
 rep_map = {
     "：": ",",
@@ -56,23 +70,34 @@ rep_map = {
     "～": "…",
 }
 
+# 单字符替换合并为 str.translate 表; 唯一的多字符键 "..." 不与单字符键重叠, 先行替换结果不变
+rep_multi = [(k, v) for k, v in rep_map.items() if len(k) > 1]
+rep_table = str.maketrans({"嗯": "恩", "呣": "母", **{k: v for k, v in rep_map.items() if len(k) == 1}})
+punctuation_filter_pattern = re.compile(r"[^\u4e00-\u9fa5" + "".join(punctuation) + r"]+")
+punctuation_filter_pattern_with_en = re.compile(r"[^\u4e00-\u9fa5A-Za-z" + "".join(punctuation) + r"]+")
+consecutive_punctuation_pattern = re.compile(
+    "([{0}])([{0}])+".format("".join(re.escape(p) for p in punctuation))
+)
+sentence_split_pattern = re.compile(r"(?<=[{0}])\s*".format("".join(punctuation)))
+english_word_pattern = re.compile("[a-zA-Z]+")
+
+text_normalizer = TextNormalizer()
+
 tone_modifier = ToneSandhi()
 
 
 def replace_punctuation(text):
-    text = text.replace("嗯", "恩").replace("呣", "母")
-    pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
+    for k, v in rep_multi:
+        text = text.replace(k, v)
+    replaced_text = text.translate(rep_table)
 
-    replaced_text = pattern.sub(lambda x: rep_map[x.group()], text)
-
-    replaced_text = re.sub(r"[^\u4e00-\u9fa5" + "".join(punctuation) + r"]+", "", replaced_text)
+    replaced_text = punctuation_filter_pattern.sub("", replaced_text)
 
     return replaced_text
 
 
 def g2p(text):
-    pattern = r"(?<=[{0}])\s*".format("".join(punctuation))
-    sentences = [i for i in re.split(pattern, text) if i.strip() != ""]
+    sentences = [i for i in sentence_split_pattern.split(text) if i.strip() != ""]
     phones, word2ph = _g2p(sentences)
     return phones, word2ph
 
@@ -183,7 +208,7 @@ def _g2p(segments):
     for seg in segments:
         pinyins = []
         # Replace all English words in the sentence
-        seg = re.sub("[a-zA-Z]+", "", seg)
+        seg = english_word_pattern.sub("", seg)
         seg_cut = psg.lcut(seg)
         seg_cut = tone_modifier.pre_merge_for_modify(seg_cut)
         initials = []
@@ -205,7 +230,7 @@ def _g2p(segments):
             print("pypinyin结果", initials, finals)
         else:
             # g2pw采用整句推理
-            pinyins = g2pw.lazy_pinyin(seg, neutral_tone_with_five=True, style=Style.TONE3)
+            pinyins = get_g2pw().lazy_pinyin(seg, neutral_tone_with_five=True, style=Style.TONE3)
 
             pre_word_length = 0
             for word, pos in seg_cut:
@@ -296,27 +321,23 @@ def _g2p(segments):
 
 
 def replace_punctuation_with_en(text):
-    text = text.replace("嗯", "恩").replace("呣", "母")
-    pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
-
-    replaced_text = pattern.sub(lambda x: rep_map[x.group()], text)
+    for k, v in rep_multi:
+        text = text.replace(k, v)
+    replaced_text = text.translate(rep_table)
 
-    replaced_text = re.sub(r"[^\u4e00-\u9fa5A-Za-z" + "".join(punctuation) + r"]+", "", replaced_text)
+    replaced_text = punctuation_filter_pattern_with_en.sub("", replaced_text)
 
     return replaced_text
 
 
 def replace_consecutive_punctuation(text):
-    punctuations = "".join(re.escape(p) for p in punctuation)
-    pattern = f"([{punctuations}])([{punctuations}])+"
-    result = re.sub(pattern, r"\1", text)
+    result = consecutive_punctuation_pattern.sub(r"\1", text)
     return result
 
 
 def text_normalize(text):
     # https://github.com/PaddlePaddle/PaddleSpeech/tree/develop/paddlespeech/t2s/frontend/zh_normalization
-    tx = TextNormalizer()
-    sentences = tx.normalize(text)
+    sentences = text_normalizer.normalize(text)
     dest_text = ""
     for sentence in sentences:
         dest_text += replace_punctuation(sentence)
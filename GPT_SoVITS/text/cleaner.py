@@ -1,5 +1,6 @@
 from text import cleaned_text_to_sequence
 import os
+import importlib
 # if os.environ.get("version","v1")=="v1":
 #     from text import chinese
 #     from text.symbols import symbols
@@ -17,16 +18,51 @@ special = [
     # ('@', 'zh', "SP4")#不搞鬼畜了，和第二版保持一致吧
 ]
 
+language_module_map_v1 = {"zh": "chinese", "ja": "japanese", "en": "english"}
+language_module_map_v2 = {"zh": "chinese2", "ja": "japanese", "en": "english", "ko": "korean", "yue": "cantonese"}
+language_modules = {}
+
+symbols_v1_set = set(symbols_v1.symbols)
+symbols_v2_set = set(symbols_v2.symbols)
+
+
+def get_language_module_map(version=None):
+    if version is None:
+        version = os.environ.get("version", "v2")
+    return language_module_map_v1 if version == "v1" else language_module_map_v2
+
+
+def load_language_module(language, version=None):
+    """
+    按需导入语种前端模块, 各语种的词典/模型只在第一次用到该语种时加载
+    """
+    module_name = get_language_module_map(version)[language]
+    language_module = language_modules.get(module_name)
+    if language_module is None:
+        language_module = importlib.import_module("text." + module_name)
+        language_modules[module_name] = language_module
+    return language_module
+
+
+def preload_languages(languages, version=None):
+    """
+    提前加载指定语种的前端及其重资源(如 g2pw), 避免首个请求承担加载耗时
+    """
+    language_module_map = get_language_module_map(version)
+    for language in languages:
+        language = language.replace("all_", "").replace("auto_", "")
+        if language not in language_module_map:
+            continue
+        language_module = load_language_module(language, version)
+        if hasattr(language_module, "preload"):
+            language_module.preload()
+
 
 def clean_text(text, language, version=None):
     if version is None:
         version = os.environ.get("version", "v2")
-    if version == "v1":
-        symbols = symbols_v1.symbols
-        language_module_map = {"zh": "chinese", "ja": "japanese", "en": "english"}
-    else:
-        symbols = symbols_v2.symbols
-        language_module_map = {"zh": "chinese2", "ja": "japanese", "en": "english", "ko": "korean", "yue": "cantonese"}
+    symbols = symbols_v1_set if version == "v1" else symbols_v2_set
+    language_module_map = get_language_module_map(version)
 
     if language not in language_module_map:
         language = "en"
@@ -34,7 +70,7 @@ def clean_text(text, language, version=None):
     for special_s, special_l, target_symbol in special:
         if special_s in text and language == special_l:
             return clean_special(text, language, special_s, target_symbol, version)
-    language_module = __import__("text." + language_module_map[language], fromlist=[language_module_map[language]])
+    language_module = load_language_module(language, version)
     if hasattr(language_module, "text_normalize"):
         norm_text = language_module.text_normalize(text)
     else:
@@ -58,18 +94,13 @@ def clean_text(text, language, version=None):
 def clean_special(text, language, special_s, target_symbol, version=None):
     if version is None:
         version = os.environ.get("version", "v2")
-    if version == "v1":
-        symbols = symbols_v1.symbols
-        language_module_map = {"zh": "chinese", "ja": "japanese", "en": "english"}
-    else:
-        symbols = symbols_v2.symbols
-        language_module_map = {"zh": "chinese2", "ja": "japanese", "en": "english", "ko": "korean", "yue": "cantonese"}
+    symbols = symbols_v1_set if version == "v1" else symbols_v2_set
 
     """
     特殊静音段sp符号处理
     """
     text = text.replace(special_s, ",")
-    language_module = __import__("text." + language_module_map[language], fromlist=[language_module_map[language]])
+    language_module = load_language_module(language, version)
     norm_text = language_module.text_normalize(text)
     phones = language_module.g2p(norm_text)
     new_ph = []
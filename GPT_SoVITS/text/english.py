@@ -1,6 +1,11 @@
 import pickle
 import os
 import re
+import mmap
+import struct
+import threading
+from array import array
+from functools import lru_cache
 import wordsegment
 from g2p_en import G2p
 
@@ -19,9 +24,15 @@ current_file_path = os.path.dirname(__file__)
 CMU_DICT_PATH = os.path.join(current_file_path, "cmudict.rep")
 CMU_DICT_FAST_PATH = os.path.join(current_file_path, "cmudict-fast.rep")
 CMU_DICT_HOT_PATH = os.path.join(current_file_path, "engdict-hot.rep")
-CACHE_PATH = os.path.join(current_file_path, "engdict_cache.pickle")
+LEXICON_PATH = os.path.join(current_file_path, "engdict_cache.lex")
+OOV_CACHE_PATH = os.path.join(current_file_path, "engdict_oov_cache.rep")
 NAMECACHE_PATH = os.path.join(current_file_path, "namedict_cache.pickle")
 
+LEXICON_MAGIC = b"GSLX"
+LEXICON_HEADER = struct.Struct("<4sI")
+# qryword 结果的 LRU 容量, 覆盖常见词与最近出现过的 oov
+QRYWORD_CACHE_SIZE = 65536
+
 
 # 适配中文及 g2p_en 标点
 rep_map = {
@@ -108,11 +119,19 @@ arpa = {
 }
 
 
+symbols_set = set(symbols)
+letter_pattern = re.compile("[a-z]")
+text_rep_pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
+consecutive_punctuation_pattern = re.compile(
+    "([{0}\\s])([{0}])+".format("".join(re.escape(p) for p in punctuation))
+)
+
+
 def replace_phs(phs):
     rep_map = {"'": "-"}
     phs_new = []
     for ph in phs:
-        if ph in symbols:
+        if ph in symbols_set:
             phs_new.append(ph)
         elif ph in rep_map.keys():
             phs_new.append(rep_map[ph])
@@ -122,9 +141,7 @@ def replace_phs(phs):
 
 
 def replace_consecutive_punctuation(text):
-    punctuations = "".join(re.escape(p) for p in punctuation)
-    pattern = f"([{punctuations}\s])([{punctuations}])+"
-    result = re.sub(pattern, r"\1", text)
+    result = consecutive_punctuation_pattern.sub(r"\1", text)
     return result
 
 
@@ -207,13 +224,106 @@ def cache_dict(g2p_dict, file_path):
         pickle.dump(g2p_dict, pickle_file)
 
 
+def build_lexicon(g2p_dict, file_path):
+    """
+    将 {word: [phones, ...]} 写成紧凑词典, 仅保留第一种读音:
+    头部(magic, 词条数 n) | uint32 偏移表 (n + 1 项) | 按 utf-8 字节序排序的 b"word\\0PH PH PH" 记录
+    """
+    records = sorted(word.encode("utf-8") + b"\0" + " ".join(prons[0]).encode("utf-8") for word, prons in g2p_dict.items())
+    offsets = array("I", [0])
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(LEXICON_HEADER.pack(LEXICON_MAGIC, len(records)))
+        f.write(offsets.tobytes())
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, file_path)
+
+
+class CompactLexicon:
+    """
+    mmap 映射的只读 CMU 词典, 二分查找, 不把十几万词条展开成 Python 对象。
+    覆盖 / 删除操作只记录在内存中, 供热词表与缩写剔除使用。
+    """
+
+    def __init__(self, file_path):
+        with open(file_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._size = LEXICON_HEADER.unpack_from(self._mm, 0)
+        if magic != LEXICON_MAGIC:
+            raise ValueError(f"{file_path} is not a lexicon file")
+        offsets_start = LEXICON_HEADER.size
+        self._data_start = offsets_start + 4 * (self._size + 1)
+        self._offsets = memoryview(self._mm)[offsets_start : self._data_start].cast("I")
+        self._overrides = {}
+        self._removed = set()
+
+    def _record(self, index):
+        start = self._data_start + self._offsets[index]
+        end = self._data_start + self._offsets[index + 1]
+        sep = self._mm.find(b"\0", start, end)
+        return start, sep, end
+
+    def _lookup(self, word):
+        key = word.encode("utf-8")
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, sep, _ = self._record(mid)
+            if self._mm[start:sep] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._size:
+            start, sep, end = self._record(lo)
+            if self._mm[start:sep] == key:
+                return self._mm[sep + 1 : end].decode("utf-8").split(" ")
+        return None
+
+    def __getitem__(self, word):
+        if word in self._overrides:
+            return self._overrides[word]
+        if word not in self._removed:
+            phones = self._lookup(word)
+            if phones is not None:
+                return [phones]
+        raise KeyError(word)
+
+    def __setitem__(self, word, prons):
+        self._overrides[word] = prons
+        self._removed.discard(word)
+
+    def __delitem__(self, word):
+        self[word]
+        self._overrides.pop(word, None)
+        self._removed.add(word)
+
+    def __contains__(self, word):
+        try:
+            self[word]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+
 def get_dict():
-    if os.path.exists(CACHE_PATH):
-        with open(CACHE_PATH, "rb") as pickle_file:
-            g2p_dict = pickle.load(pickle_file)
-    else:
+    sources_mtime = max(os.path.getmtime(CMU_DICT_PATH), os.path.getmtime(CMU_DICT_FAST_PATH))
+    try:
+        if not os.path.exists(LEXICON_PATH) or os.path.getmtime(LEXICON_PATH) < sources_mtime:
+            build_lexicon(read_dict_new(), LEXICON_PATH)
+        g2p_dict = CompactLexicon(LEXICON_PATH)
+    except (OSError, ValueError):
+        # 目录只读或缓存损坏时退回内存字典
         g2p_dict = read_dict_new()
-        cache_dict(g2p_dict, CACHE_PATH)
 
     g2p_dict = hot_reload_hot(g2p_dict)
 
@@ -230,12 +340,35 @@ def get_namedict():
     return name_dict
 
 
+def get_oov_dict():
+    oov_dict = {}
+    if os.path.exists(OOV_CACHE_PATH):
+        with open(OOV_CACHE_PATH) as f:
+            for line in f:
+                word_split = line.strip().split(" ")
+                if len(word_split) > 1:
+                    oov_dict[word_split[0].lower()] = word_split[1:]
+
+    return oov_dict
+
+
+_oov_lock = threading.Lock()
+
+
+def save_oov(word, phones):
+    # 追加写入, 与 engdict-hot.rep 同格式; 写失败不影响推理
+    try:
+        with _oov_lock, open(OOV_CACHE_PATH, "a") as f:
+            f.write(word.upper() + " " + " ".join(phones) + "\n")
+    except OSError:
+        pass
+
+
 def text_normalize(text):
     # todo: eng text normalize
 
     # 效果相同，和 chinese.py 保持一致
-    pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
-    text = pattern.sub(lambda x: rep_map[x.group()], text)
+    text = text_rep_pattern.sub(lambda x: rep_map[x.group()], text)
 
     text = unicode(text)
     text = normalize(text)
@@ -254,6 +387,10 @@ class en_G2p(G2p):
         # 扩展过时字典, 添加姓名字典
         self.cmu = get_dict()
         self.namedict = get_namedict()
+        # 已预测过的 oov 读音, 跨进程复用
+        self.oov_dict = get_oov_dict()
+        # 记忆化整词查询; 返回的列表被共享, 调用方不得原地修改
+        self.qryword = lru_cache(maxsize=QRYWORD_CACHE_SIZE)(self.qryword)
 
         # 剔除读音错误的几个缩写
         for word in ["AE", "AI", "AR", "IOS", "HUD", "OS"]:
@@ -278,7 +415,7 @@ class en_G2p(G2p):
             # 还原 g2p_en 小写操作逻辑
             word = o_word.lower()
 
-            if re.search("[a-z]", word) is None:
+            if letter_pattern.search(word) is None:
                 pron = [word]
             # 先把单字母推出去
             elif len(word) == 1:
@@ -356,6 +493,14 @@ class en_G2p(G2p):
         # 可以分词的递归处理
         return [phone for comp in comps for phone in self.qryword(comp)]
 
+    def predict(self, word):
+        if word in self.oov_dict:
+            return self.oov_dict[word]
+        phones = super().predict(word)
+        self.oov_dict[word] = phones
+        save_oov(word, phones)
+        return phones
+
 
 _g2p = en_G2p()
 
@@ -24,7 +24,6 @@ from .chronology import replace_date2
 from .chronology import replace_time
 from .constants import F2H_ASCII_LETTERS
 from .constants import F2H_DIGITS
-from .constants import F2H_SPACE
 from .num import RE_VERSION_NUM
 from .num import RE_DECIMAL_NUM
 from .num import RE_DEFAULT_NUM
@@ -58,9 +57,80 @@ from .quantifier import replace_measure
 from .quantifier import replace_temperature
 
 
+# 全角字母/数字转半角合并为一张表; F2H_SPACE 的键是 str, 对 str.translate 不生效, 不并入以保持输出不变
+F2H_TABLE = {**F2H_ASCII_LETTERS, **F2H_DIGITS}
+
+RE_SPECIAL = re.compile(r"[——《》【】<>{}()（）#&@“”^_|\\]")
+RE_POST_SPECIAL = re.compile(r"[-——《》【】<=>{}()（）#&@“”^_|\\]")
+RE_NEWLINES = re.compile(r"\n+")
+
+# _post_replace 的单字符替换, 各替换结果不含其他键, 一次 translate 与逐个 replace 等价
+POST_REPLACE_TABLE = str.maketrans(
+    {
+        "/": "每",
+        # '~': '至',
+        # '～': '至',
+        "①": "一",
+        "②": "二",
+        "③": "三",
+        "④": "四",
+        "⑤": "五",
+        "⑥": "六",
+        "⑦": "七",
+        "⑧": "八",
+        "⑨": "九",
+        "⑩": "十",
+        "α": "阿尔法",
+        "β": "贝塔",
+        "γ": "伽玛",
+        "Γ": "伽玛",
+        "δ": "德尔塔",
+        "Δ": "德尔塔",
+        "ε": "艾普西龙",
+        "ζ": "捷塔",
+        "η": "依塔",
+        "θ": "西塔",
+        "Θ": "西塔",
+        "ι": "艾欧塔",
+        "κ": "喀帕",
+        "λ": "拉姆达",
+        "Λ": "拉姆达",
+        "μ": "缪",
+        "ν": "拗",
+        "ξ": "克西",
+        "Ξ": "克西",
+        "ο": "欧米克伦",
+        "π": "派",
+        "Π": "派",
+        "ρ": "肉",
+        "ς": "西格玛",
+        "Σ": "西格玛",
+        "σ": "西格玛",
+        "τ": "套",
+        "υ": "宇普西龙",
+        "φ": "服艾",
+        "Φ": "服艾",
+        "χ": "器",
+        "ψ": "普赛",
+        "Ψ": "普赛",
+        "ω": "欧米伽",
+        "Ω": "欧米伽",
+        # 兜底数学运算，顺便兼容懒人用语
+        "+": "加",
+        "-": "减",
+        "×": "乘",
+        "÷": "除",
+        "=": "等",
+    }
+)
+
+
+RE_SENTENCE_SPLITOR = re.compile(r"([：、，；。？！,;?!][”’]?)")
+
+
 class TextNormalizer:
     def __init__(self):
-        self.SENTENCE_SPLITOR = re.compile(r"([：、，；。？！,;?!][”’]?)")
+        self.SENTENCE_SPLITOR = RE_SENTENCE_SPLITOR
 
     def _split(self, text: str, lang="zh") -> List[str]:
         """Split long text into sentences with sentence-splitting punctuations.
@@ -73,64 +143,22 @@ class TextNormalizer:
         if lang == "zh":
             text = text.replace(" ", "")
             # 过滤掉特殊字符
-            text = re.sub(r"[——《》【】<>{}()（）#&@“”^_|\\]", "", text)
+            text = RE_SPECIAL.sub("", text)
         text = self.SENTENCE_SPLITOR.sub(r"\1\n", text)
         text = text.strip()
-        sentences = [sentence.strip() for sentence in re.split(r"\n+", text)]
+        sentences = [sentence.strip() for sentence in RE_NEWLINES.split(text)]
         return sentences
 
     def _post_replace(self, sentence: str) -> str:
-        sentence = sentence.replace("/", "每")
-        # sentence = sentence.replace('~', '至')
-        # sentence = sentence.replace('～', '至')
-        sentence = sentence.replace("①", "一")
-        sentence = sentence.replace("②", "二")
-        sentence = sentence.replace("③", "三")
-        sentence = sentence.replace("④", "四")
-        sentence = sentence.replace("⑤", "五")
-        sentence = sentence.replace("⑥", "六")
-        sentence = sentence.replace("⑦", "七")
-        sentence = sentence.replace("⑧", "八")
-        sentence = sentence.replace("⑨", "九")
-        sentence = sentence.replace("⑩", "十")
-        sentence = sentence.replace("α", "阿尔法")
-        sentence = sentence.replace("β", "贝塔")
-        sentence = sentence.replace("γ", "伽玛").replace("Γ", "伽玛")
-        sentence = sentence.replace("δ", "德尔塔").replace("Δ", "德尔塔")
-        sentence = sentence.replace("ε", "艾普西龙")
-        sentence = sentence.replace("ζ", "捷塔")
-        sentence = sentence.replace("η", "依塔")
-        sentence = sentence.replace("θ", "西塔").replace("Θ", "西塔")
-        sentence = sentence.replace("ι", "艾欧塔")
-        sentence = sentence.replace("κ", "喀帕")
-        sentence = sentence.replace("λ", "拉姆达").replace("Λ", "拉姆达")
-        sentence = sentence.replace("μ", "缪")
-        sentence = sentence.replace("ν", "拗")
-        sentence = sentence.replace("ξ", "克西").replace("Ξ", "克西")
-        sentence = sentence.replace("ο", "欧米克伦")
-        sentence = sentence.replace("π", "派").replace("Π", "派")
-        sentence = sentence.replace("ρ", "肉")
-        sentence = sentence.replace("ς", "西格玛").replace("Σ", "西格玛").replace("σ", "西格玛")
-        sentence = sentence.replace("τ", "套")
-        sentence = sentence.replace("υ", "宇普西龙")
-        sentence = sentence.replace("φ", "服艾").replace("Φ", "服艾")
-        sentence = sentence.replace("χ", "器")
-        sentence = sentence.replace("ψ", "普赛").replace("Ψ", "普赛")
-        sentence = sentence.replace("ω", "欧米伽").replace("Ω", "欧米伽")
-        # 兜底数学运算，顺便兼容懒人用语
-        sentence = sentence.replace("+", "加")
-        sentence = sentence.replace("-", "减")
-        sentence = sentence.replace("×", "乘")
-        sentence = sentence.replace("÷", "除")
-        sentence = sentence.replace("=", "等")
+        sentence = sentence.translate(POST_REPLACE_TABLE)
         # re filter special characters, have one more character "-" than line 68
-        sentence = re.sub(r"[-——《》【】<=>{}()（）#&@“”^_|\\]", "", sentence)
+        sentence = RE_POST_SPECIAL.sub("", sentence)
         return sentence
 
     def normalize_sentence(self, sentence: str) -> str:
         # basic character conversions
         sentence = tranditional_to_simplified(sentence)
-        sentence = sentence.translate(F2H_ASCII_LETTERS).translate(F2H_DIGITS).translate(F2H_SPACE)
+        sentence = sentence.translate(F2H_TABLE)
 
         # number related NSW verbalization
         sentence = RE_DATE.sub(replace_date, sentence)
@@ -60,33 +60,28 @@ def load_checkpoint(checkpoint_path, model, optimizer=None, skip_optimizer=False
     return model, optimizer, learning_rate, iteration
 
 
-import shutil
-from time import time as ttime
+from module.ckpt_writer import save_async, write_checkpoint
 
 
 def my_save(fea, path):  #####fix issue: torch.save doesn't support chinese path
-    dir = os.path.dirname(path)
-    name = os.path.basename(path)
-    tmp_path = "%s.pth" % (ttime())
-    torch.save(fea, tmp_path)
-    shutil.move(tmp_path, "%s/%s" % (dir, name))
+    write_checkpoint(fea, path)
 
 
 def save_checkpoint(model, optimizer, learning_rate, iteration, checkpoint_path):
     logger.info("Saving model and optimizer state at iteration {} to {}".format(iteration, checkpoint_path))
     if hasattr(model, "module"):
-        state_dict = model.module.state_dict()
-    else:
-        state_dict = model.state_dict()
+        model = model.module
     # torch.save(
-    my_save(
+    # 只在这里拷一份到 CPU, 序列化和写盘在后台线程里做
+    save_async(
         {
-            "model": state_dict,
+            "model": model.state_dict(),
             "iteration": iteration,
             "optimizer": optimizer.state_dict(),
             "learning_rate": learning_rate,
         },
         checkpoint_path,
+        slot=type(model).__name__,
     )
 
 
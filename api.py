@@ -164,7 +164,6 @@ import numpy as np
 from feature_extractor import cnhubert
 from io import BytesIO
 from module.models import Generator, SynthesizerTrn, SynthesizerTrnV3
-from peft import LoraConfig, get_peft_model
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
 from text import cleaned_text_to_sequence
 from text.cleaner import clean_text
@@ -375,7 +374,7 @@ class Sovits:
         self.hps = hps
 
 
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import get_sovits_version_from_path_fast, load_lora_merged, load_sovits_new, load_t2s_weights
 
 
 def get_sovits_weights(sovits_path):
@@ -447,16 +446,7 @@ def get_sovits_weights(sovits_path):
     else:
         path_sovits = path_sovits_v3 if model_version == "v3" else path_sovits_v4
         vq_model.load_state_dict(load_sovits_new(path_sovits)["weight"], strict=False)
-        lora_rank = dict_s2["lora_rank"]
-        lora_config = LoraConfig(
-            target_modules=["to_k", "to_q", "to_v", "to_out.0"],
-            r=lora_rank,
-            lora_alpha=lora_rank,
-            init_lora_weights=True,
-        )
-        vq_model.cfm = get_peft_model(vq_model.cfm, lora_config)
-        vq_model.load_state_dict(dict_s2["weight"], strict=False)
-        vq_model.cfm = vq_model.cfm.merge_and_unload()
+        load_lora_merged(vq_model, path_sovits, sovits_path, dict_s2)
         # torch.save(vq_model.state_dict(),"merge_win.pth")
         vq_model.eval()
 
@@ -475,7 +465,7 @@ hz = 50
 
 
 def get_gpt_weights(gpt_path):
-    dict_s1 = torch.load(gpt_path, map_location="cpu", weights_only=False)
+    dict_s1 = load_t2s_weights(gpt_path)
     config = dict_s1["config"]
     max_sec = config["data"]["max_sec"]
     t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
@@ -92,7 +92,7 @@ def get_weights_names():
         if not os.path.exists(path):
             continue
         for name in os.listdir(path):
-            if name.endswith(".pth"):
+            if name.endswith((".pth", ".safetensors")):
                 SoVITS_names.append("%s/%s" % (path, name))
     if not SoVITS_names:
         SoVITS_names = [""]
@@ -104,7 +104,7 @@ def get_weights_names():
         if not os.path.exists(path):
             continue
         for name in os.listdir(path):
-            if name.endswith(".ckpt"):
+            if name.endswith((".ckpt", ".safetensors")):
                 GPT_names.append("%s/%s" % (path, name))
     SoVITS_names = sorted(SoVITS_names, key=custom_sort_key)
     GPT_names = sorted(GPT_names, key=custom_sort_key)
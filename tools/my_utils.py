@@ -122,7 +122,7 @@ def check_details(path_list=None, is_train=False, is_dataset_processing=False):
                 ...
             else:
                 gr.Warning(i18n("缺少音素数据集"))
-        if os.listdir(hubert_path):
+        if os.listdir(hubert_path) or os.path.isdir(hubert_path + ".shards"):  # 分片特征库, 见 module/feature_store.py
             ...
         else:
             gr.Warning(i18n("缺少Hubert数据集"))